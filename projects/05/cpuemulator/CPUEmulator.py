@@ -0,0 +1,150 @@
+import os
+import re
+import sys
+import time
+
+from emulator import CPUEmulator, load_rom
+from recompiler import Recompiler
+from screen import Framebuffer, capture
+from snapshot import snapshot, restore
+from profiler import HackProfiler, load_symbols
+
+def main():
+    """
+    Runs a Hack program (a .hack file, or a packed ROM file) headlessly,
+    and reports where the machine stopped.
+    """
+    args = sys.argv[1:]
+    max_cycles = None
+
+    # The --blocks flag runs the program as compiled basic blocks.
+    with_blocks = '--blocks' in args
+    args = [arg for arg in args if arg != '--blocks']
+
+    # The --frames flag writes every new screen frame to the given
+    # directory (as PNG, or PBM with --pbm), checking the screen each
+    # --interval cycles.
+    frames = None
+    interval = 100000
+    fmt = 'pbm' if '--pbm' in args else 'png'
+    args = [arg for arg in args if arg != '--pbm']
+
+    if '--frames' in args:
+        idx = args.index('--frames')
+        frames = args[idx + 1]
+        args = args[:idx] + args[idx + 2:]
+
+    if '--interval' in args:
+        idx = args.index('--interval')
+        interval = int(args[idx + 1])
+        args = args[:idx] + args[idx + 2:]
+
+    # The --restore flag starts the program from the given snapshot file,
+    # and the --snapshot flag saves the final state to the given file.
+    restore_path = None
+    snapshot_path = None
+    if '--restore' in args:
+        idx = args.index('--restore')
+        restore_path = args[idx + 1]
+        args = args[:idx] + args[idx + 2:]
+
+    if '--snapshot' in args:
+        idx = args.index('--snapshot')
+        snapshot_path = args[idx + 1]
+        args = args[:idx] + args[idx + 2:]
+
+    # The --profile flag prints the cycles spent per label (or per function
+    # of a translated VM program, with --by-function), and the --collapsed
+    # flag writes the cycles per call stack to the given file. The labels
+    # are read from the .sym file of the program (see the assembler), or
+    # from the file given by --symbols.
+    profile = '--profile' in args
+    by_function = '--by-function' in args
+    args = [arg for arg in args if arg not in ['--profile', '--by-function']]
+
+    symbols_path = None
+    collapsed = None
+    if '--symbols' in args:
+        idx = args.index('--symbols')
+        symbols_path = args[idx + 1]
+        args = args[:idx] + args[idx + 2:]
+
+    if '--collapsed' in args:
+        idx = args.index('--collapsed')
+        collapsed = args[idx + 1]
+        args = args[:idx] + args[idx + 2:]
+
+    # The --cycles flag limits the amount of executed instructions.
+    if '--cycles' in args:
+        idx = args.index('--cycles')
+        max_cycles = int(args[idx + 1])
+        args = args[:idx] + args[idx + 2:]
+
+    if len(args) != 1:
+        raise Exception("Usage: python CPUEmulator.py filename " +
+            "[--cycles N] [--blocks] [--frames dirname [--interval N] [--pbm]] " +
+            "[--restore filename] [--snapshot filename] [--profile " +
+            "[--by-function]] [--collapsed filename] [--symbols filename]")
+
+    profiling = profile or collapsed is not None
+    if profiling and frames is not None:
+        raise Exception("Use either --frames or --profile/--collapsed")
+
+    if profiling and symbols_path is None:
+        symbols_path = re.sub('.hack$', '.sym', args[0])
+        if not os.path.isfile(symbols_path):
+            symbols_path = None
+
+    try:
+        cpu = CPUEmulator(load_rom(args[0]),
+            Recompiler() if with_blocks else None)
+
+        if restore_path is not None:
+            with open(restore_path, 'rb') as f:
+                restore(cpu, f.read())
+
+        profiler = None
+        if profiling:
+            symbols = load_symbols(symbols_path) if symbols_path else None
+            profiler = HackProfiler(cpu, symbols)
+
+        start = time.time()
+        if profiler is not None:
+            cycles = profiler.run(max_cycles)
+        elif frames is not None:
+            initial = cpu.cycles
+            written = capture(cpu, frames, interval, max_cycles, fmt)
+            cycles = cpu.cycles - initial
+        else:
+            cycles = cpu.run(max_cycles)
+        elapsed = time.time() - start
+
+        state = 'Halted' if cpu.halted else 'Stopped'
+        print "{} after {} cycles ({:.3f} seconds)".format(state, cycles,
+            elapsed)
+        print "PC: {}, A: {}, D: {}".format(cpu.pc, cpu.a, cpu.d)
+        print "RAM[0..15]: {}".format(' '.join(str(v) for v in cpu.ram[0:16]))
+        print "Screen: {}".format(Framebuffer(cpu.ram).hash())
+
+        if snapshot_path is not None:
+            with open(snapshot_path, 'wb') as f:
+                f.write(snapshot(cpu))
+
+        if profile:
+            profiler.write_flat(sys.stdout, by_function)
+
+        if collapsed is not None:
+            with open(collapsed, 'w') as f:
+                profiler.write_collapsed(f)
+
+        if frames is not None:
+            print "Wrote {} frames to {}".format(len(written), frames)
+
+    except IOError, err:
+        print "Encountered an I/O Error:", str(err)
+    except ValueError, err:
+        print "Encountered a Value Error:", str(err)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+import os
+import sys
+import time
+import multiprocessing
+
+from tester import run_script
+
+def main():
+    """
+    Runs test scripts (.tst files, or all the ones under the given
+    directories) on the CPU emulator, comparing their output with their
+    compare files, and reports the scripts that failed.
+    """
+    args = sys.argv[1:]
+    processes = None
+
+    # The -j flag determines the amount of worker processes (all the cores
+    # by default).
+    if '-j' in args:
+        idx = args.index('-j')
+        processes = int(args[idx + 1])
+        args = args[:idx] + args[idx + 2:]
+
+    if len(args) == 0:
+        raise Exception("Usage: python TestRunner.py filename/dirname " +
+            "[filename/dirname ...] [-j N]")
+
+    scripts = []
+    for path in args:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in sorted(os.walk(path)):
+                scripts.extend(os.path.join(dirpath, f)
+                    for f in sorted(filenames) if f.endswith('.tst'))
+        else:
+            scripts.append(path)
+
+    start = time.time()
+    if processes == 1:
+        results = [run_script(script) for script in scripts]
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(run_script, scripts)
+        finally:
+            pool.close()
+            pool.join()
+    elapsed = time.time() - start
+
+    failed = 0
+    for path, passed, message in results:
+        print "{} {}: {}".format('PASS' if passed else 'FAIL', path, message)
+        failed += not passed
+
+    print "{} passed, {} failed ({:.3f} seconds)".format(
+        len(results) - failed, failed, elapsed)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,329 @@
+from array import array
+
+# Defines the kinds of the predecoded instructions. END is the jump of the
+# (END) @END 0;JMP idiom, which ends translated programs with an infinite
+# loop, and HALT follows the last instruction of the program.
+A_INSTRUCTION, C_INSTRUCTION, END, HALT = range(4)
+
+# The Hack memory map.
+RAM_SIZE = 32768
+SCREEN = 16384
+KBD = 24576
+
+# The bits of the dest and jump fields of a C-instruction.
+DEST_A, DEST_D, DEST_M = 4, 2, 1
+JLT, JEQ, JGT = 4, 2, 1
+
+
+def word(value):
+    """
+    Wraps the given integer to a 16-bit two's complement value.
+    """
+    value &= 0xFFFF
+    return value - 65536 if value > 32767 else value
+
+
+# The comp functions, by the a-bit and the c1..c6 bits of the instruction.
+# Each one is called as fn(A, D, M). The registers hold 16-bit signed
+# values, so only the arithmetic functions need to wrap their result.
+comp_functions = {
+    0b0101010: lambda a, d, m: 0,
+    0b0111111: lambda a, d, m: 1,
+    0b0111010: lambda a, d, m: -1,
+    0b0001100: lambda a, d, m: d,
+    0b0110000: lambda a, d, m: a,
+    0b1110000: lambda a, d, m: m,
+    0b0001101: lambda a, d, m: ~d,
+    0b0110001: lambda a, d, m: ~a,
+    0b1110001: lambda a, d, m: ~m,
+    0b0001111: lambda a, d, m: word(-d),
+    0b0110011: lambda a, d, m: word(-a),
+    0b1110011: lambda a, d, m: word(-m),
+    0b0011111: lambda a, d, m: word(d + 1),
+    0b0110111: lambda a, d, m: word(a + 1),
+    0b1110111: lambda a, d, m: word(m + 1),
+    0b0001110: lambda a, d, m: word(d - 1),
+    0b0110010: lambda a, d, m: word(a - 1),
+    0b1110010: lambda a, d, m: word(m - 1),
+    0b0000010: lambda a, d, m: word(d + a),
+    0b1000010: lambda a, d, m: word(d + m),
+    0b0010011: lambda a, d, m: word(d - a),
+    0b1010011: lambda a, d, m: word(d - m),
+    0b0000111: lambda a, d, m: word(a - d),
+    0b1000111: lambda a, d, m: word(m - d),
+    0b0000000: lambda a, d, m: d & a,
+    0b1000000: lambda a, d, m: d & m,
+    0b0010101: lambda a, d, m: d | a,
+    0b1010101: lambda a, d, m: d | m
+}
+
+
+def alu(comp):
+    """
+    Returns the comp function of the given comp bits, as computed by the
+    Hack ALU. Used for the combinations that have no assembly mnemonic.
+    """
+    zx, nx, zy, ny, f, no = [(comp >> (5 - i)) & 1 for i in range(6)]
+    use_m = comp >> 6
+
+    def fn(a, d, m):
+        x, y = d, m if use_m else a
+        if zx:
+            x = 0
+        if nx:
+            x = ~x
+        if zy:
+            y = 0
+        if ny:
+            y = ~y
+        out = word(x + y) if f else x & y
+        return ~out if no else out
+
+    return fn
+
+
+def load_rom(path):
+    """
+    Returns the instructions of the given program, either a text .hack file
+    (an instruction per line, in binary digits) or a packed file (16-bit big
+    endian words).
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    if not data.strip() or set(data) <= set('01\r\n\t '):
+        return array('H', [int(line, 2) for line in data.split()])
+
+    rom = array('H')
+    rom.fromstring(data[:len(data) & ~1])
+    rom.byteswap()
+    return rom
+
+
+class CPUEmulator(object):
+    """
+    Executes Hack machine code. Every instruction of the ROM is decoded
+    once into parallel tables: its kind, its operand (the value of an
+    A-instruction, or the comp function of a C-instruction), and the dest
+    and jump bits of a C-instruction. The RAM is an array of 16-bit words,
+    including the memory maps of the screen and the keyboard.
+    """
+    def __init__(self, rom, recompiler=None, halt_at_end=True):
+        self.rom = array('H', rom)
+        if len(self.rom) > RAM_SIZE:
+            raise ValueError('Program is too large to be loaded.')
+
+        self.ram = array('h', [0]) * RAM_SIZE
+
+        self.kinds = array('b')
+        self.operands = array('i')
+        self.dests = array('b')
+        self.jumps = array('b')
+
+        # Maps each comp function id (an operand of a C-instruction) to the
+        # function and to its comp bits, and back.
+        self.comps = []
+        self.comp_bits = []
+        self.comp_ids = {}
+
+        # Given a recompiler (see recompiler.py), the program runs as
+        # compiled basic blocks.
+        self.recompiler = recompiler
+
+        # Determines whether the final loop of the program halts the
+        # machine, rather than spinning like the hardware does.
+        self.halt_at_end = halt_at_end
+
+        self.decode()
+        self.reset()
+
+    def comp_id(self, comp):
+        """Returns the comp function id of the given comp bits."""
+        if comp not in self.comp_ids:
+            self.comp_ids[comp] = len(self.comps)
+            self.comps.append(comp_functions.get(comp) or alu(comp))
+            self.comp_bits.append(comp)
+
+        return self.comp_ids[comp]
+
+    def decode(self):
+        """
+        Predecodes the ROM into the instruction tables.
+        """
+        rom = self.rom
+        for addr, instruction in enumerate(rom):
+            if instruction & 0x8000 == 0:
+                self.kinds.append(A_INSTRUCTION)
+                self.operands.append(instruction)
+                self.dests.append(0)
+                self.jumps.append(0)
+                continue
+
+            dest = (instruction >> 3) & 7
+            jump = instruction & 7
+            comp = (instruction >> 6) & 0x7F
+
+            # The 0;JMP of (END) @END 0;JMP, which jumps to itself.
+            kind = C_INSTRUCTION
+            if self.halt_at_end and addr > 0 and rom[addr - 1] == addr - 1 \
+                and dest == 0 and jump == 7 and comp == 0b0101010:
+                kind = END
+
+            self.kinds.append(kind)
+            self.operands.append(self.comp_id(comp))
+            self.dests.append(dest)
+            self.jumps.append(jump)
+
+        # Running off the end of the program halts the machine.
+        self.halt_addr = len(rom)
+        for table in [self.kinds, self.operands, self.dests, self.jumps]:
+            table.append(HALT if table is self.kinds else 0)
+
+    def reset(self):
+        """
+        Clears the memory and the registers, and restarts the program.
+        """
+        self.ram[:] = array('h', [0]) * RAM_SIZE
+        self.pc = 0
+        self.a = 0
+        self.d = 0
+        self.cycles = 0
+        self.halted = False
+
+    @property
+    def keyboard(self):
+        """Returns the key currently pressed, as mapped to memory."""
+        return self.ram[KBD]
+
+    @keyboard.setter
+    def keyboard(self, key):
+        self.ram[KBD] = key
+
+    def run(self, max_cycles=None):
+        """
+        Executes instructions until the machine halts (the program ends by
+        its infinite loop or runs off its end) or the given amount of
+        instructions was executed. Returns the amount of executed
+        instructions.
+        """
+        if self.recompiler is not None:
+            return self.run_blocks(max_cycles)
+
+        return self.interpret(max_cycles)
+
+    def run_blocks(self, max_cycles=None):
+        """
+        Executes the program as compiled basic blocks. The instructions that
+        aren't compiled, and the blocks that exceed the remaining budget,
+        are interpreted.
+        """
+        ram = self.ram
+        recompiler = self.recompiler
+        blocks = recompiler.blocks
+        halt_addr = self.halt_addr
+
+        budget = max_cycles if max_cycles is not None else 2 ** 62
+        cycles = 0
+
+        # The cycles of the compiled blocks, the interpreter counts its own.
+        compiled = 0
+
+        pc = self.pc
+        a = self.a
+        d = self.d
+
+        while cycles < budget and not self.halted:
+            block = blocks[pc] if pc in blocks else recompiler.block(self, pc)
+
+            if block is None or block[1] > budget - cycles:
+                self.pc, self.a, self.d = pc, a, d
+                cycles += self.interpret(1 if block is None else
+                    budget - cycles)
+                pc, a, d = self.pc, self.a, self.d
+                continue
+
+            fn, length = block
+            pc, a, d = fn(ram, a, d)
+            if pc > halt_addr:
+                pc = halt_addr
+            cycles += length
+            compiled += length
+
+        self.pc, self.a, self.d = pc, a, d
+        self.cycles += compiled
+        return cycles
+
+    def interpret(self, max_cycles=None):
+        """
+        Executes instructions one by one, from the predecoded tables.
+        """
+        if self.halted:
+            return 0
+
+        ram = self.ram
+        kinds = self.kinds
+        operands = self.operands
+        dests = self.dests
+        jumps = self.jumps
+        comps = self.comps
+        halt_addr = self.halt_addr
+
+        pc = self.pc
+        a = self.a
+        d = self.d
+
+        budget = max_cycles if max_cycles is not None else 2 ** 62
+        cycle = 0
+
+        # A holds a signed 16-bit value, and the RAM has exactly 2 ** 15
+        # words, so a negative address indexes the RAM from its end. That's
+        # the Hack addressing of memory by the low 15 bits of A.
+        for cycle in xrange(budget):
+            kind = kinds[pc]
+
+            if kind == A_INSTRUCTION:
+                a = operands[pc]
+                pc += 1
+            elif kind == C_INSTRUCTION:
+                value = comps[operands[pc]](a, d, ram[a])
+
+                # The jump target and the written address are the value of
+                # A before the instruction.
+                target = a
+                dest = dests[pc]
+                if dest:
+                    if dest & DEST_M:
+                        ram[a] = value
+                    if dest & DEST_D:
+                        d = value
+                    if dest & DEST_A:
+                        a = value
+
+                jump = jumps[pc]
+                if jump and (jump == 7 or (value < 0 and jump & JLT) or
+                    (value == 0 and jump & JEQ) or (value > 0 and jump & JGT)):
+                    pc = target & 0x7FFF
+                    if pc > halt_addr:
+                        pc = halt_addr
+                else:
+                    pc += 1
+            elif kind == END and (a == pc - 1 or a == pc):
+                # The program ended by its infinite loop.
+                self.halted = True
+                break
+            elif kind == END:
+                pc = a & 0x7FFF
+                if pc > halt_addr:
+                    pc = halt_addr
+            else:
+                self.halted = True
+                break
+        else:
+            # The budget was exhausted, the last loop step was executed.
+            cycle = budget
+
+        self.pc = pc
+        self.a = a
+        self.d = d
+        self.cycles += cycle
+        return cycle
@@ -0,0 +1,227 @@
+from array import array
+from bisect import bisect_right
+
+from recompiler import Recompiler
+
+# The name of the code before the first function, like the bootstrap code
+# of a translated VM program.
+BOOTSTRAP = 'bootstrap'
+
+
+def load_symbols(path):
+    """
+    Returns the labels of a .sym file, as written by the assembler (a label
+    and its ROM address per line), as (label, address) pairs in the order
+    they are declared.
+    """
+    symbols = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                name, address = line.split()
+                symbols.append((name, int(address)))
+
+    return symbols
+
+
+class HackProfiler(object):
+    """
+    Profiles the execution of a Hack program on the CPU emulator, by the
+    amount of cycles spent at every ROM address. The program runs as
+    compiled basic blocks (see recompiler.py), and only the block entries
+    are counted, so the overhead is a counter update per block.
+
+    Given the labels of the program (see load_symbols), cycles are
+    aggregated per label (an address belongs to the closest label before
+    it). The labels of a translated VM program also reveal its functions:
+    a label of the form Class.function is a function entry, and a label of
+    the form Class.function$ret.i is where a call to the function returns.
+    Entering them maintains a call stack, from which the collapsed stacks
+    are derived.
+    """
+    def __init__(self, cpu, symbols=None):
+        if cpu.recompiler is None:
+            cpu.recompiler = Recompiler()
+
+        self.cpu = cpu
+        self.symbols = symbols or []
+
+        # Counts the block entries and the interpreted instructions, by
+        # the call stack id and the address (stack id * 65536 + address).
+        self.block_counts = {}
+        self.step_counts = {}
+
+        # Determines the call stacks seen so far. Each call stack is given an
+        # id, mapped from its (caller stack id, function) pair.
+        self.stack_ids = {}
+        self.stacks = []
+        self.parents = []
+
+        # Maps the addresses of function entries and return labels to the
+        # function called or returned from.
+        self.calls = {}
+        self.returns = {}
+        for name, address in self.symbols:
+            if '$ret.' in name:
+                self.returns[address] = name.split('$ret.')[0]
+            elif '.' in name and '$' not in name:
+                self.calls[address] = name
+
+        self.stack = self.stack_id(None, BOOTSTRAP)
+
+    def stack_id(self, caller, name):
+        """
+        Returns the id of the call stack of the given function, called
+        from the given call stack id (None for the root).
+        """
+        key = (caller, name)
+        if key not in self.stack_ids:
+            self.stack_ids[key] = len(self.stacks)
+            parent = self.stacks[caller] if caller is not None else ()
+            self.stacks.append(parent + (name,))
+            self.parents.append(caller)
+
+        return self.stack_ids[key]
+
+    def enter(self, stack, pc):
+        """
+        Returns the call stack id after entering the given address. A return
+        label may share its address with the next function, in which case
+        it's a return only when returning from the current function.
+        """
+        name = self.returns.get(pc)
+        if name is not None and self.stacks[stack][-1] == name and \
+            self.parents[stack] is not None:
+            return self.parents[stack]
+
+        if pc in self.calls:
+            return self.stack_id(stack, self.calls[pc])
+
+        return stack
+
+    def run(self, max_cycles=None):
+        """
+        Executes the program until the machine halts or the given amount of
+        instructions was executed. Returns the amount of executed
+        instructions.
+        """
+        cpu = self.cpu
+        ram = cpu.ram
+        recompiler = cpu.recompiler
+        blocks = recompiler.blocks
+        halt_addr = cpu.halt_addr
+        block_counts = self.block_counts
+        step_counts = self.step_counts
+        calls = self.calls
+        returns = self.returns
+
+        budget = max_cycles if max_cycles is not None else 2 ** 62
+        cycles = 0
+        compiled = 0
+
+        pc, a, d = cpu.pc, cpu.a, cpu.d
+        stack = self.stack
+
+        while cycles < budget and not cpu.halted:
+            if pc in calls or pc in returns:
+                stack = self.enter(stack, pc)
+
+            block = blocks[pc] if pc in blocks else recompiler.block(cpu, pc)
+            key = stack * 65536 + pc
+
+            # Instructions outside compiled blocks (and blocks that exceed
+            # the budget) are interpreted and counted one by one.
+            if block is None or block[1] > budget - cycles:
+                cpu.pc, cpu.a, cpu.d = pc, a, d
+                if cpu.interpret(1):
+                    step_counts[key] = step_counts.get(key, 0) + 1
+                    cycles += 1
+                pc, a, d = cpu.pc, cpu.a, cpu.d
+                continue
+
+            block_counts[key] = block_counts.get(key, 0) + 1
+
+            fn, length = block
+            pc, a, d = fn(ram, a, d)
+            if pc > halt_addr:
+                pc = halt_addr
+            cycles += length
+            compiled += length
+
+        cpu.pc, cpu.a, cpu.d = pc, a, d
+        cpu.cycles += compiled
+        self.stack = stack
+        return cycles
+
+    def samples(self):
+        """
+        Yields the (stack id, address, cycles) of every counted address.
+        """
+        blocks = self.cpu.recompiler.blocks
+        for key, count in self.block_counts.iteritems():
+            stack, start = divmod(key, 65536)
+            for pc in xrange(start, start + blocks[start][1]):
+                yield stack, pc, count
+
+        for key, count in self.step_counts.iteritems():
+            stack, pc = divmod(key, 65536)
+            yield stack, pc, count
+
+    def address_counts(self):
+        """Returns the cycles spent at every ROM address."""
+        counts = array('i', [0]) * (self.cpu.halt_addr + 1)
+        for stack, pc, count in self.samples():
+            counts[pc] += count
+
+        return counts
+
+    def profile(self, functions=False):
+        """
+        Returns the flat profile, as a list of (label, cycles) pairs ordered
+        by cycles. Only function labels are used if functions is true.
+        Without labels, the profile is by address.
+        """
+        # Of the labels of an address, the one declared last is the closest
+        # to the code.
+        labels = [(address, name) for name, address in self.symbols
+            if not functions or self.calls.get(address) == name]
+        labels.sort(key=lambda label: label[0])
+        addresses = [address for address, name in labels]
+
+        totals = {}
+        for pc, count in enumerate(self.address_counts()):
+            if not count:
+                continue
+
+            if labels:
+                idx = bisect_right(addresses, pc) - 1
+                name = labels[idx][1] if idx >= 0 else BOOTSTRAP
+            else:
+                name = str(pc)
+
+            totals[name] = totals.get(name, 0) + count
+
+        return sorted(totals.items(), key=lambda item: (-item[1], item[0]))
+
+    def write_flat(self, f, functions=False):
+        """Writes the flat profile to the given file, as a table."""
+        rows = self.profile(functions)
+        total = sum(count for name, count in rows) or 1
+
+        f.write('{:<40}{:>14}{:>9}\n'.format('Label', 'Cycles', '%'))
+        for name, count in rows:
+            f.write('{:<40}{:>14}{:>8.2f}%\n'.format(name, count,
+                100.0 * count / total))
+
+    def write_collapsed(self, f):
+        """
+        Writes the cycles of every call stack in the collapsed stacks format
+        (one 'caller;...;callee cycles' line per call stack).
+        """
+        totals = [0] * len(self.stacks)
+        for stack, pc, count in self.samples():
+            totals[stack] += count
+
+        for names, count in sorted(zip(self.stacks, totals)):
+            if count:
+                f.write('{} {}\n'.format(';'.join(names), count))
@@ -0,0 +1,205 @@
+from emulator import C_INSTRUCTION, A_INSTRUCTION, DEST_A, DEST_D, DEST_M
+
+# Determines the maximal amount of instructions in a block, so a long
+# straight-line block doesn't overshoot the cycles budget by much.
+MAX_BLOCK = 64
+
+# Caches the compiled code objects by their generated source, so a block is
+# compiled once per process even when many emulator instances run the
+# same program.
+code_cache = {}
+
+
+def wrap(source):
+    """
+    Returns the given arithmetic expression, wrapped to a 16-bit signed value.
+    """
+    return '((({}) + 32768) & 65535) - 32768'.format(source)
+
+
+# The comp expressions, by the a-bit and the c1..c6 bits of the instruction.
+# {a}, {d} and {m} stand for the registers.
+comp_sources = {
+    0b0101010: '0',
+    0b0111111: '1',
+    0b0111010: '-1',
+    0b0001100: '{d}',
+    0b0110000: '{a}',
+    0b1110000: '{m}',
+    0b0001101: '~{d}',
+    0b0110001: '~{a}',
+    0b1110001: '~{m}',
+    0b0001111: wrap('-{d}'),
+    0b0110011: wrap('-{a}'),
+    0b1110011: wrap('-{m}'),
+    0b0011111: wrap('{d} + 1'),
+    0b0110111: wrap('{a} + 1'),
+    0b1110111: wrap('{m} + 1'),
+    0b0001110: wrap('{d} - 1'),
+    0b0110010: wrap('{a} - 1'),
+    0b1110010: wrap('{m} - 1'),
+    0b0000010: wrap('{d} + {a}'),
+    0b1000010: wrap('{d} + {m}'),
+    0b0010011: wrap('{d} - {a}'),
+    0b1010011: wrap('{d} - {m}'),
+    0b0000111: wrap('{a} - {d}'),
+    0b1000111: wrap('{m} - {d}'),
+    0b0000000: '{d} & {a}',
+    0b1000000: '{d} & {m}',
+    0b0010101: '{d} | {a}',
+    0b1010101: '{d} | {m}'
+}
+
+# The jump conditions on the computed value, by the jump bits.
+jump_conditions = {
+    1: 'v > 0',
+    2: 'v == 0',
+    3: 'v >= 0',
+    4: 'v < 0',
+    5: 'v != 0',
+    6: 'v <= 0',
+    7: 'True'
+}
+
+
+class Recompiler:
+    """
+    A second execution tier of the CPU emulator. The ROM is split into basic
+    blocks - straight-line instructions that end by a jump - as they are
+    first entered, and every block is compiled into a Python function that
+    executes its instructions on local variables, instead of dispatching
+    them one by one. The value of A is tracked while it's a known constant
+    (after an A-instruction), so memory accesses through it are resolved
+    at compile time.
+
+    The generated function is called as block(ram, a, d) and returns the
+    (pc, a, d) to continue from. A block always executes all its
+    instructions, so it counts a fixed amount of cycles. The Hack ROM can't
+    be written by the program, so compiled blocks never go stale.
+    """
+    def __init__(self):
+        # Maps each block by the ROM address it starts at, to its (function,
+        # amount of instructions), or to None if it can't be compiled.
+        self.blocks = {}
+
+    def block(self, cpu, pc):
+        """
+        Returns the compiled block that starts at the given address, as a
+        (function, length) pair, or None if the instruction there must be
+        interpreted (the end of the program, or its final loop).
+        """
+        if pc in self.blocks:
+            return self.blocks[pc]
+
+        source, length = BlockCompiler(cpu, pc).compile()
+        block = None
+
+        if length > 0:
+            code = code_cache.get(source)
+            if code is None:
+                code = compile(source, '<hack {}>'.format(pc), 'exec')
+                code_cache[source] = code
+
+            namespace = {}
+            exec code in namespace
+            block = (namespace['block'], length)
+
+        self.blocks[pc] = block
+        return block
+
+
+class BlockCompiler:
+    """
+    Generates the Python source of the basic block that starts at the given
+    ROM address.
+    """
+    def __init__(self, cpu, start):
+        self.cpu = cpu
+        self.start = start
+        self.lines = []
+
+        # The source of the value of A: a constant or the variable a.
+        self.a = 'a'
+
+    def emit(self, line):
+        self.lines.append('    ' + line)
+
+    def compile(self):
+        """
+        Returns the generated source of the block and its amount of
+        instructions.
+        """
+        cpu = self.cpu
+        pc = self.start
+        end = None
+
+        while pc - self.start < MAX_BLOCK:
+            kind = cpu.kinds[pc]
+            if kind == A_INSTRUCTION:
+                self.a = str(cpu.operands[pc])
+            elif kind == C_INSTRUCTION and \
+                cpu.comp_bits[cpu.operands[pc]] in comp_sources:
+                end = self.compile_c_instruction(pc)
+            else:
+                # The final loop, the end of the program, or a comp without
+                # a mnemonic, which are interpreted.
+                break
+
+            pc += 1
+            if end is not None:
+                break
+
+        if end is None:
+            end = '{}, {}, d'.format(pc, self.a)
+
+        lines = ['def block(ram, a, d):'] + self.lines + ['    return ' + end]
+        return '\n'.join(lines) + '\n', pc - self.start
+
+    def compile_c_instruction(self, pc):
+        """
+        Emits a C-instruction. Returns the return statement that ends the
+        block if the instruction is a jump, None otherwise.
+        """
+        cpu = self.cpu
+        comp = comp_sources[cpu.comp_bits[cpu.operands[pc]]]
+        dest = cpu.dests[pc]
+        jump = cpu.jumps[pc]
+
+        expression = comp.format(a=self.a, d='d', m='ram[{}]'.format(self.a))
+
+        # The jump target and the written address are the value of A before
+        # the instruction.
+        target = self.a
+        if jump and dest & DEST_A and target == 'a':
+            self.emit('t = a')
+            target = 't'
+
+        targets = []
+        if dest & DEST_M:
+            targets.append('ram[{}]'.format(self.a))
+        if dest & DEST_D:
+            targets.append('d')
+        if dest & DEST_A:
+            targets.append('a')
+            self.a = 'a'
+
+        if len(targets) == 1 and not jump:
+            self.emit('{} = {}'.format(targets[0], expression))
+        elif targets or jump:
+            self.emit('v = ' + expression)
+            for name in targets:
+                self.emit('{} = v'.format(name))
+
+        if not jump:
+            return None
+
+        if target.isdigit():
+            taken = '{}, {}, d'.format(target, self.a)
+        else:
+            taken = '{} & 32767, {}, d'.format(target, self.a)
+        if jump == 7:
+            return taken
+
+        self.emit('if {}:'.format(jump_conditions[jump]))
+        self.emit('    return ' + taken)
+        return '{}, {}, d'.format(pc + 1, self.a)
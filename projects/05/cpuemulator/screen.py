@@ -0,0 +1,151 @@
+import os
+import zlib
+import struct
+import hashlib
+
+from emulator import SCREEN, KBD
+
+# The screen dimensions, in pixels. Each row is mapped to 32 words, where
+# pixel x is bit x % 16 (from the least significant bit) of word x / 16.
+WIDTH = 512
+HEIGHT = 256
+ROW_WORDS = WIDTH / 16
+
+# Maps each byte to its bits in reversed order, as bitmap formats hold the
+# leftmost pixel in the most significant bit.
+reversed_bits = [int(format(i, '08b')[::-1], 2) for i in range(256)]
+
+
+class Framebuffer(object):
+    """
+    A headless view of the screen memory map of an emulator RAM (a 16-bit
+    array). Reading the view doesn't copy the screen, so it can be hashed
+    cheaply after every batch of cycles, and frames are only converted to
+    images when they are written.
+    """
+    def __init__(self, ram):
+        self.ram = ram
+
+    def view(self):
+        """Returns a read-only buffer of the screen memory, without a copy."""
+        size = self.ram.itemsize
+        return buffer(self.ram, SCREEN * size, (KBD - SCREEN) * size)
+
+    def hash(self):
+        """Returns a hash of the current frame."""
+        return hashlib.sha1(self.view()).hexdigest()
+
+    def frame(self):
+        """Returns a copy of the current frame, as a list of words."""
+        return self.ram[SCREEN:KBD].tolist()
+
+    def pixel(self, x, y):
+        """Returns whether the given pixel is black."""
+        return (self.ram[SCREEN + y * ROW_WORDS + x / 16] >> (x % 16)) & 1
+
+    def bitmap(self, frame=None):
+        """
+        Returns the given frame (the current one by default) as packed rows
+        of pixels, a set bit being a black pixel.
+        """
+        frame = frame if frame is not None else self.frame()
+        data = bytearray()
+        for value in frame:
+            data.append(reversed_bits[value & 0xFF])
+            data.append(reversed_bits[(value >> 8) & 0xFF])
+
+        return data
+
+    def write_pbm(self, path, frame=None):
+        """Writes the given frame (the current one by default) as a PBM."""
+        with open(path, 'wb') as f:
+            f.write('P4\n{} {}\n'.format(WIDTH, HEIGHT))
+            f.write(self.bitmap(frame))
+
+    def write_png(self, path, frame=None):
+        """
+        Writes the given frame (the current one by default) as a 1-bit
+        grayscale PNG.
+        """
+        data = self.bitmap(frame)
+        stride = WIDTH / 8
+
+        # In a grayscale PNG a clear bit is black, each row starts by its
+        # filter type (none).
+        raw = bytearray()
+        for row in range(HEIGHT):
+            raw.append(0)
+            raw.extend(255 - b for b in data[row * stride:(row + 1) * stride])
+
+        def chunk(kind, body):
+            crc = zlib.crc32(kind + body) & 0xFFFFFFFF
+            return struct.pack('>I', len(body)) + kind + body + \
+                struct.pack('>I', crc)
+
+        with open(path, 'wb') as f:
+            f.write('\x89PNG\r\n\x1a\n')
+            f.write(chunk('IHDR', struct.pack('>IIBBBBB', WIDTH, HEIGHT, 1,
+                0, 0, 0, 0)))
+            f.write(chunk('IDAT', zlib.compress(str(raw), 9)))
+            f.write(chunk('IEND', ''))
+
+
+def diff(old, new):
+    """
+    Compares two frames (lists of words). Returns the amount of differing
+    words and the bounding box of the differing pixels, as an (x1, y1, x2,
+    y2) tuple (None if the frames are equal).
+    """
+    changed = [i for i in xrange(len(new)) if old[i] != new[i]]
+    if not changed:
+        return 0, None
+
+    xs = []
+    for i in changed:
+        bits = (old[i] ^ new[i]) & 0xFFFF
+        x = (i % ROW_WORDS) * 16
+        xs.append(x + (bits & -bits).bit_length() - 1)
+        xs.append(x + bits.bit_length() - 1)
+
+    return len(changed), (min(xs), changed[0] / ROW_WORDS, max(xs),
+        changed[-1] / ROW_WORDS)
+
+
+def capture(machine, directory, interval, max_cycles=None, fmt='png'):
+    """
+    Runs the given machine (anything with run(n), halted and ram, like the
+    CPU emulator) in batches of the given amount of cycles, and writes each
+    new frame to the given directory, after the batch it appeared in.
+    Returns the (cycles, hash) of the written frames.
+    """
+    screen = Framebuffer(machine.ram)
+    frames = []
+    last = None
+    cycles = 0
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    while not machine.halted and (max_cycles is None or cycles < max_cycles):
+        batch = interval if max_cycles is None else \
+            min(interval, max_cycles - cycles)
+        executed = machine.run(batch)
+        cycles += executed
+
+        digest = screen.hash()
+        if digest != last:
+            name = 'frame{:06d}.{}'.format(len(frames), fmt)
+            path = os.path.join(directory, name)
+            if fmt == 'pbm':
+                screen.write_pbm(path)
+            else:
+                screen.write_png(path)
+
+            frames.append((cycles, digest))
+            last = digest
+
+        # The machine halted (or waits without running).
+        if executed == 0:
+            break
+
+    return frames
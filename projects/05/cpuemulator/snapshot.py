@@ -0,0 +1,96 @@
+import sys
+import zlib
+import struct
+import hashlib
+import multiprocessing
+from array import array
+
+# A snapshot starts with a header: a magic string, the id of the ROM it was
+# taken from, the registers, the cycles count and the halted flag. The RAM
+# follows, compressed (mostly zeros), as 16-bit big endian words.
+MAGIC = 'HKSN'
+HEADER = struct.Struct('>4s20sHhhQ?')
+
+# The machine forked by fork(), in its snapshot state. Worker processes
+# inherit it from the parent process, and share its memory until they write
+# to it (copy-on-write), so the snapshot is never serialized.
+forked = None
+
+
+def rom_id(cpu):
+    """Returns the id of the ROM of the given machine, a hash of its words."""
+    return hashlib.sha1(cpu.rom.tostring()).digest()
+
+
+def snapshot(cpu):
+    """
+    Returns the state of the given machine, serialized.
+    """
+    ram = array('h', cpu.ram)
+    if sys.byteorder == 'little':
+        ram.byteswap()
+
+    header = HEADER.pack(MAGIC, rom_id(cpu), cpu.pc, cpu.a, cpu.d, cpu.cycles,
+        cpu.halted)
+    return header + zlib.compress(ram.tostring())
+
+
+def restore(cpu, data):
+    """
+    Restores the given machine to the given snapshot, which must have been
+    taken from the same program.
+    """
+    magic, rom, pc, a, d, cycles, halted = HEADER.unpack(data[:HEADER.size])
+    if magic != MAGIC:
+        raise ValueError('Given data is not a snapshot.')
+    if rom != rom_id(cpu):
+        raise ValueError('Snapshot was taken from a different program.')
+
+    ram = array('h')
+    ram.fromstring(zlib.decompress(data[HEADER.size:]))
+    if sys.byteorder == 'little':
+        ram.byteswap()
+
+    cpu.ram[:] = ram
+    cpu.pc, cpu.a, cpu.d = pc, a, d
+    cpu.cycles, cpu.halted = cycles, halted
+
+
+def run_forked(job):
+    """
+    Runs a job of fork() on the inherited machine, from its snapshot state.
+    """
+    fn, arg = job
+    cpu, state = forked
+    restore(cpu, state)
+    return fn(cpu, arg)
+
+
+def fork(cpu, fn, args, processes=None):
+    """
+    Runs fn(machine, arg) for each of the given arguments, each time on the
+    given machine as it is now, and returns the results. The runs are spread
+    over the given amount of worker processes (all the cores by default), or
+    run in this process, one after the other, if processes is 1. fn must be
+    a module-level function, so it can be sent to the workers.
+    """
+    global forked
+
+    state = snapshot(cpu)
+    forked = (cpu, state)
+    jobs = [(fn, arg) for arg in args]
+
+    try:
+        if processes == 1:
+            return [run_forked(job) for job in jobs]
+
+        pool = multiprocessing.Pool(processes)
+        try:
+            return pool.map(run_forked, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        # The caller gets back its machine as it was.
+        restore(cpu, state)
+        forked = None
@@ -0,0 +1,319 @@
+import os
+import re
+
+from emulator import CPUEmulator, load_rom
+from recompiler import Recompiler
+
+# The registers of the CPU emulator and of the Computer chip, as named by
+# test scripts, mapped to the emulator attributes.
+registers = {
+    'A': 'a',
+    'D': 'd',
+    'PC': 'pc',
+    'ARegister[]': 'a',
+    'DRegister[]': 'd',
+    'PC[]': 'pc',
+    'ARegister': 'a',
+    'DRegister': 'd'
+}
+
+# The memory of the CPU emulator and of the Computer chip.
+memory = re.compile(r'(RAM|RAM16K|Screen|Memory)\[(\d+)\]$')
+
+# The comparisons of while conditions.
+conditions = {
+    '=': lambda x, y: x == y,
+    '<>': lambda x, y: x != y,
+    '<': lambda x, y: x < y,
+    '>': lambda x, y: x > y,
+    '<=': lambda x, y: x <= y,
+    '>=': lambda x, y: x >= y
+}
+
+
+class ScriptError(Exception):
+    """Raised for scripts the runner doesn't support (or can't parse)."""
+    pass
+
+
+class Mismatch(Exception):
+    """Raised on the first output line that differs from the compare file."""
+    def __init__(self, line, expected, actual):
+        Exception.__init__(self, 'Comparison failure at line {}: expected ' \
+            '{!r}, got {!r}'.format(line, expected, actual))
+        self.line = line
+
+
+def tokenize(text):
+    """
+    Returns the tokens of a test script: words, quoted strings, braces and
+    the command terminators (',', ';' and '!').
+    """
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'//[^\n]*', '', text)
+    return re.findall(r'"[^"]*"|[{},;!]|[^\s{},;!]+', text)
+
+
+def parse(tokens, idx=0):
+    """
+    Parses the commands of a script from the given token index, up to the
+    end of the script or of the enclosing block. Returns the commands and
+    the index after them. A command is a list of words, or a ('repeat',
+    count, commands) or ('while', condition, commands) tuple.
+    """
+    commands = []
+    words = []
+
+    while idx < len(tokens):
+        token = tokens[idx]
+        idx += 1
+
+        if token == '}':
+            break
+        elif token in [',', ';', '!']:
+            if words:
+                commands.append(words)
+            words = []
+        elif token == '{':
+            body, idx = parse(tokens, idx)
+            if words and words[0] == 'repeat':
+                count = int(words[1]) if len(words) > 1 else -1
+                commands.append(('repeat', count, body))
+            elif words and words[0] == 'while':
+                commands.append(('while', words[1:], body))
+            else:
+                raise ScriptError('Unexpected block after {}'.format(words))
+            words = []
+        else:
+            words.append(token)
+
+    if words:
+        commands.append(words)
+
+    return commands, idx
+
+
+class OutputColumn(object):
+    """
+    A column of the output list, as given by name%Fl.w.r: the format
+    (D decimal, B binary, X hexadecimal or S string), and the padding
+    around a value of the given width.
+    """
+    def __init__(self, spec):
+        name, _, fmt = spec.partition('%')
+        self.name = name
+        self.fmt = fmt[0] if fmt else 'D'
+        left, width, right = (fmt[1:] or '1.6.1').split('.')
+        self.left, self.width, self.right = int(left), int(width), int(right)
+
+    def header(self):
+        """Returns the column header, its name centered."""
+        total = self.left + self.width + self.right
+        name = self.name[:total]
+        left = (total - len(name)) / 2
+        return ' ' * left + name + ' ' * (total - len(name) - left)
+
+    def format(self, value):
+        """Returns the given value, formatted as the column."""
+        if self.fmt == 'S':
+            text = str(value).ljust(self.width)
+        elif self.fmt == 'B':
+            text = format(value & 0xFFFF, '016b')[-self.width:]
+        elif self.fmt == 'X':
+            text = format(value & 0xFFFF, '04X')[-self.width:]
+        else:
+            text = str(value).rjust(self.width)
+
+        return ' ' * self.left + text + ' ' * self.right
+
+
+class TestScript(object):
+    """
+    Runs a test script of the CPU emulator (which loads a .hack program and
+    executes it by ticktock) or of the Computer chip (which loads its ROM32K
+    with a program and clocks it by tick and tock), on the CPU emulator.
+    Every output line is compared to the compare file as soon as it is
+    written, and the script stops at the first mismatch.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.dirname = os.path.dirname(path)
+
+        self.cpu = None
+        self.columns = []
+        self.expected = None
+        self.lines = 0
+
+        # The clock of the Computer chip, and its reset input.
+        self.time = 0
+        self.ticked = False
+        self.reset = 0
+
+    def run(self):
+        """
+        Runs the script. Raises Mismatch on the first output line that
+        differs from the compare file.
+        """
+        with open(self.path) as f:
+            commands, idx = parse(tokenize(f.read()))
+
+        try:
+            self.execute(commands)
+        finally:
+            if self.expected is not None:
+                self.expected.close()
+
+        return self.lines
+
+    def execute(self, commands):
+        for command in commands:
+            if isinstance(command, tuple) and command[0] == 'repeat':
+                self.repeat(command[1], command[2])
+            elif isinstance(command, tuple):
+                while self.condition(command[1]):
+                    self.execute(command[2])
+            else:
+                self.command(command)
+
+    def repeat(self, count, body):
+        # A repeated ticktock alone runs as a single batch.
+        if count >= 0 and body == [['ticktock']] and self.cpu is not None:
+            self.cpu.run(count)
+            return
+
+        if count < 0:
+            raise ScriptError('Endless repeat (an interactive script) is ' +
+                'not supported')
+
+        for i in xrange(count):
+            self.execute(body)
+
+    def condition(self, words):
+        if len(words) != 3 or words[1] not in conditions:
+            raise ScriptError('Unsupported condition {}'.format(words))
+        return conditions[words[1]](self.value(words[0]), int(words[2]))
+
+    def command(self, words):
+        name = words[0]
+
+        if name == 'load' or (name == 'ROM32K' and words[1:2] == ['load']):
+            filename = words[-1] if len(words) > 1 else None
+            if filename is None or filename.endswith('.hdl'):
+                if filename != 'Computer.hdl':
+                    raise ScriptError('Only the Computer chip is supported')
+            else:
+                self.load(filename)
+        elif name == 'output-list':
+            self.columns = [OutputColumn(spec) for spec in words[1:]]
+            self.output_line('|' + '|'.join(c.header() for c in
+                self.columns) + '|')
+        elif name == 'compare-to':
+            self.expected = open(os.path.join(self.dirname, words[1]))
+        elif name == 'output':
+            self.output_line('|' + '|'.join(c.format(self.value(c.name))
+                for c in self.columns) + '|')
+        elif name == 'set':
+            self.set(words[1], int(words[2]))
+        elif name == 'ticktock':
+            self.machine().run(1)
+        elif name == 'tick':
+            self.ticked = True
+        elif name == 'tock':
+            self.tock()
+        elif name in ['output-file', 'echo', 'clear-echo', 'breakpoint',
+            'clear-breakpoints']:
+            pass
+        else:
+            raise ScriptError('Unsupported command {}'.format(name))
+
+    def load(self, filename):
+        rom = load_rom(os.path.join(self.dirname, filename))
+        self.cpu = CPUEmulator(rom, Recompiler(), halt_at_end=False)
+
+    def machine(self):
+        if self.cpu is None:
+            raise ScriptError('No program is loaded')
+        return self.cpu
+
+    def tock(self):
+        """
+        Completes a clock cycle of the Computer chip: the current
+        instruction is executed, and a reset restarts the program.
+        """
+        cpu = self.machine()
+        cpu.run(1)
+        if self.reset:
+            cpu.pc = 0
+            cpu.halted = False
+
+        self.time += 1
+        self.ticked = False
+
+    def value(self, name):
+        if name == 'time':
+            return '{}{}'.format(self.time, '+' if self.ticked else '')
+        if name == 'reset':
+            return self.reset
+        if name in registers:
+            return getattr(self.machine(), registers[name])
+
+        match = memory.match(name)
+        if match is None:
+            raise ScriptError('Unknown variable {}'.format(name))
+
+        return self.machine().ram[self.address(match)]
+
+    def address(self, match):
+        # The Screen and Memory parts of the Computer are mapped from their
+        # own bases.
+        offset = {'Screen': 16384}.get(match.group(1), 0)
+        return offset + int(match.group(2))
+
+    def set(self, name, value):
+        if name == 'reset':
+            self.reset = value
+        elif name in registers:
+            cpu = self.machine()
+            setattr(cpu, registers[name], value)
+            if name.startswith('PC'):
+                cpu.halted = False
+        else:
+            match = memory.match(name)
+            if match is None:
+                raise ScriptError('Unknown variable {}'.format(name))
+            self.machine().ram[self.address(match)] = value
+
+    def output_line(self, line):
+        """Compares an output line with the next line of the compare file."""
+        self.lines += 1
+        if self.expected is None:
+            return
+
+        expected = self.expected.readline()
+        expected = expected.rstrip('\r\n') if expected else None
+        if expected is None or not matches(expected, line):
+            raise Mismatch(self.lines, expected, line)
+
+
+def matches(expected, line):
+    """
+    Returns whether an output line matches the expected one, where a '*'
+    in the expected line matches any character.
+    """
+    if len(expected) != len(line):
+        return False
+
+    return all(e == c or e == '*' for e, c in zip(expected, line))
+
+
+def run_script(path):
+    """
+    Runs the given test script. Returns a (path, passed, message) tuple.
+    """
+    try:
+        lines = TestScript(path).run()
+        return path, True, '{} lines'.format(lines)
+    except Mismatch as err:
+        return path, False, str(err)
+    except (ScriptError, IOError, ValueError) as err:
+        return path, False, 'Error: {}'.format(err)
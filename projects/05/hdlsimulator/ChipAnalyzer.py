@@ -0,0 +1,55 @@
+import sys
+import json
+
+from hdl import ChipLoader, HDLError
+from netlist import Netlist
+from analyzer import GateReport, diff, diff_table
+
+def main():
+    """
+    Reports the amount of Nand gates a chip (an .hdl file) is built of, by
+    its parts, and the depth of its critical path. Given another version of
+    the chip (by --diff), reports the differences from it instead.
+    """
+    args = sys.argv[1:]
+    old_path = None
+
+    # The --json flag prints the report as JSON.
+    as_json = '--json' in args
+    args = [arg for arg in args if arg != '--json']
+
+    if '--diff' in args:
+        idx = args.index('--diff')
+        old_path = args[idx + 1]
+        args = args[:idx] + args[idx + 2:]
+
+    if len(args) != 1:
+        raise Exception("Usage: python ChipAnalyzer.py filename.hdl " +
+            "[--diff old.hdl] [--json]")
+
+    try:
+        report = GateReport(Netlist(ChipLoader(), args[0]))
+        if old_path is None:
+            if as_json:
+                print json.dumps(report.as_dict(), indent=2, sort_keys=True)
+            else:
+                print report.as_table(),
+            return
+
+        old = GateReport(Netlist(ChipLoader(), old_path))
+        changes = diff(old.as_dict(), report.as_dict())
+        if as_json:
+            print json.dumps(changes, indent=2, sort_keys=True)
+        else:
+            print diff_table(changes),
+
+    except IOError, err:
+        print "Encountered an I/O Error:", str(err)
+        sys.exit(1)
+    except HDLError, err:
+        print "Encountered an HDL Error:", str(err)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
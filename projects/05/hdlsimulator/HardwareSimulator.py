@@ -0,0 +1,107 @@
+import os
+import sys
+import time
+import multiprocessing
+
+from tester import run_script
+from builtin import builtins, natives
+
+def run_job(job):
+    return run_script(*job)
+
+
+def main():
+    """
+    Runs hardware test scripts (.tst files, or all the ones under the given
+    directories) on compiled netlists of their chips, comparing their output
+    with their compare files, and reports the scripts that failed.
+    """
+    args = sys.argv[1:]
+    processes = None
+    cache_dir = None
+    vectors = None
+    native = ()
+
+    # The -j flag determines the amount of worker processes (all the cores
+    # by default).
+    if '-j' in args:
+        idx = args.index('-j')
+        processes = int(args[idx + 1])
+        args = args[:idx] + args[idx + 2:]
+
+    # The --cache flag keeps the compiled chips in the given directory, by
+    # the hash of their HDL files, for later runs.
+    if '--cache' in args:
+        idx = args.index('--cache')
+        cache_dir = args[idx + 1]
+        args = args[:idx] + args[idx + 2:]
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    # The --vectors flag evaluates combinational chips on batches of up to
+    # the given amount of input vectors at once, a bit of every wire per
+    # vector.
+    if '--vectors' in args:
+        idx = args.index('--vectors')
+        vectors = int(args[idx + 1])
+        args = args[:idx] + args[idx + 2:]
+
+    # The --native flag replaces the given parts (comma separated, or all)
+    # by native implementations, and the --crosscheck flag compares every
+    # output with the gate level version of the chip.
+    crosscheck = '--crosscheck' in args
+    args = [arg for arg in args if arg != '--crosscheck']
+
+    # The --events flag simulates the chips by events, evaluating only the
+    # gates whose inputs changed.
+    events = '--events' in args
+    args = [arg for arg in args if arg != '--events']
+
+    if '--native' in args:
+        idx = args.index('--native')
+        native = args[idx + 1].split(',')
+        args = args[:idx] + args[idx + 2:]
+        if native == ['all']:
+            native = sorted(set(builtins) | set(natives))
+
+    if len(args) == 0:
+        raise Exception("Usage: python HardwareSimulator.py " +
+            "filename/dirname [filename/dirname ...] [-j N] [--cache DIR] " +
+            "[--vectors N] [--native name,...|all [--crosscheck]] " +
+            "[--events]")
+
+    scripts = []
+    for path in args:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in sorted(os.walk(path)):
+                scripts.extend(os.path.join(dirpath, f)
+                    for f in sorted(filenames) if f.endswith('.tst'))
+        else:
+            scripts.append(path)
+
+    jobs = [(script, cache_dir, vectors, native, crosscheck, events)
+        for script in scripts]
+    start = time.time()
+    if processes == 1:
+        results = [run_job(job) for job in jobs]
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(run_job, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    elapsed = time.time() - start
+
+    failed = 0
+    for path, passed, message in results:
+        print "{} {}: {}".format('PASS' if passed else 'FAIL', path, message)
+        failed += not passed
+
+    print "{} passed, {} failed ({:.3f} seconds)".format(
+        len(results) - failed, failed, elapsed)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+from netlist import FALSE, TRUE
+
+
+class GateReport(object):
+    """
+    The hardware cost of a chip, given its netlist: the amount of Nand
+    gates it's built of, by the parts of the chip (and by their chip), the
+    built-in parts it uses, and its critical path, the longest chain of
+    Nand gates between an input (a chip input, or the output of a clocked
+    part) and an output (a chip output, or the input of a clocked part).
+    Built-in parts add no gates to a path through them.
+    """
+    def __init__(self, netlist):
+        self.netlist = netlist
+        chip = netlist.chip
+
+        # The parts of the chip, labeled by their chip and their count so
+        # far (like Mux16#2).
+        self.labels = []
+        counts = {}
+        for name, connections in chip.parts:
+            self.labels.append('{}#{}'.format(name, counts.get(name, 0)))
+            counts[name] = counts.get(name, 0) + 1
+
+        self.depth, self.path = self.critical_path()
+
+    def label(self, owner):
+        return self.labels[owner] if owner is not None else \
+            self.netlist.chip.name
+
+    def critical_path(self):
+        """
+        Returns the depth of the critical path, and the labels of the parts
+        it goes through, from its start to its end.
+        """
+        netlist = self.netlist
+        gates = netlist.gates
+        count = len(gates)
+
+        # The depth of every wire, and the wire and node it's reached from
+        # along its longest path.
+        depths = [0] * netlist.wires
+        via = [None] * netlist.wires
+
+        for node in netlist.nodes:
+            if node < count:
+                out, a, b = gates[node]
+                # On a tie, the path goes on through a wire that isn't a
+                # constant.
+                source = a if (depths[a], a > TRUE) >= (depths[b], b > TRUE) \
+                    else b
+                depths[out] = depths[source] + 1
+                via[out] = (source, node)
+                continue
+
+            part = netlist.parts[node - count]
+            inputs = [w for wires in part.combinational_inputs()
+                for w in wires if w not in [FALSE, TRUE]]
+            source = max(inputs, key=lambda w: depths[w]) if inputs else None
+            for wires in part.outputs:
+                for wire in wires:
+                    if source is not None:
+                        depths[wire] = depths[source]
+                        via[wire] = (source, node)
+
+        # The endpoints: the chip outputs and the inputs of clocked parts.
+        endpoints = [(wire, name) for name, wires in netlist.outputs
+            for wire in wires]
+        for part in netlist.parts:
+            if part.is_clocked():
+                endpoints.extend((wire, self.label(part.owner))
+                    for wires in part.inputs for wire in wires)
+
+        if not endpoints:
+            return 0, []
+
+        wire, end = max(endpoints, key=lambda endpoint: depths[endpoint[0]])
+        depth = depths[wire]
+
+        # Follows the path back to where it starts.
+        labels = [end]
+        while via[wire] is not None:
+            wire, node = via[wire]
+            owner = netlist.owners[node] if node < count else \
+                netlist.parts[node - count].owner
+            if self.label(owner) != labels[-1]:
+                labels.append(self.label(owner))
+
+        inputs = dict((w, name) for name, wires in netlist.inputs
+            for w in wires)
+        start = inputs.get(wire)
+        if start is None:
+            start = next((self.label(part.owner) for part in netlist.parts
+                if any(wire in wires for wires in part.outputs)), None)
+        if start is not None and start != labels[-1]:
+            labels.append(start)
+
+        return depth, labels[::-1]
+
+    def as_dict(self):
+        """Returns the report as a dictionary."""
+        netlist = self.netlist
+
+        nands = [0] * len(self.labels)
+        builtins = [{} for label in self.labels]
+        for owner in netlist.owners:
+            if owner is not None:
+                nands[owner] += 1
+        for part in netlist.parts:
+            if part.owner is not None:
+                counts = builtins[part.owner]
+                counts[part.name] = counts.get(part.name, 0) + 1
+
+        parts = []
+        chips = {}
+        for idx, label in enumerate(self.labels):
+            name = netlist.chip.parts[idx][0]
+            parts.append({
+                'part': label,
+                'chip': name,
+                'nands': nands[idx],
+                'builtins': builtins[idx]
+            })
+
+            entry = chips.setdefault(name, {'instances': 0, 'nands': 0})
+            entry['instances'] += 1
+            entry['nands'] += nands[idx]
+
+        total_builtins = {}
+        for part in netlist.parts:
+            total_builtins[part.name] = total_builtins.get(part.name, 0) + 1
+
+        return {
+            'chip': netlist.chip.name,
+            'path': netlist.chip.path,
+            'nands': len(netlist.gates),
+            'depth': self.depth,
+            'critical_path': self.path,
+            'builtins': total_builtins,
+            'parts': parts,
+            'chips': chips
+        }
+
+    def as_table(self):
+        """Returns the report as a human readable text table."""
+        report = self.as_dict()
+        width = max([len(p['part']) for p in report['parts']] +
+            [len('Part')])
+
+        row = '{:<%d} {:>8} {:>7}  {}' % width
+        lines = [
+            row.format('Part', 'Nands', '%', 'Built-in parts'),
+            '-' * (width + 35)
+        ]
+
+        total = report['nands'] or 1
+        for part in report['parts']:
+            lines.append(row.format(part['part'], part['nands'],
+                '{:.1f}'.format(100.0 * part['nands'] / total),
+                ', '.join('{} x{}'.format(name, count) for name, count in
+                sorted(part['builtins'].items()))))
+
+        lines += [
+            '-' * (width + 35),
+            'Total: {} Nand gates, {} built-in parts'.format(report['nands'],
+                sum(report['builtins'].values())),
+            'Critical path: {} gates deep'.format(report['depth']),
+            '    ' + ' -> '.join(report['critical_path'])
+        ]
+
+        return '\n'.join(lines) + '\n'
+
+
+def diff(old, new):
+    """
+    Compares the reports (as dictionaries) of two versions of a chip.
+    Returns the differences as a dictionary: the amount of Nand gates and
+    the depth of each version and their change, and the same for every chip
+    used as a part whose gates changed.
+    """
+    chips = {}
+    for name in set(old['chips']) | set(new['chips']):
+        before = old['chips'].get(name, {'nands': 0})['nands']
+        after = new['chips'].get(name, {'nands': 0})['nands']
+        if before != after:
+            chips[name] = {'old': before, 'new': after,
+                'change': after - before}
+
+    return {
+        'chip': new['chip'],
+        'old': {'path': old['path'], 'nands': old['nands'],
+            'depth': old['depth']},
+        'new': {'path': new['path'], 'nands': new['nands'],
+            'depth': new['depth']},
+        'nands': new['nands'] - old['nands'],
+        'depth': new['depth'] - old['depth'],
+        'chips': chips
+    }
+
+
+def diff_table(changes):
+    """Returns the differences of two chips as a human readable table."""
+    row = '{:<20} {:>8} {:>8} {:>8}'
+    lines = [
+        row.format('', 'Old', 'New', 'Change'),
+        row.format('Nand gates', changes['old']['nands'],
+            changes['new']['nands'], '{:+d}'.format(changes['nands'])),
+        row.format('Depth', changes['old']['depth'], changes['new']['depth'],
+            '{:+d}'.format(changes['depth']))
+    ]
+
+    if changes['chips']:
+        lines += ['', row.format('Part chip', 'Old', 'New', 'Change')]
+        for name, entry in sorted(changes['chips'].items()):
+            lines.append(row.format(name, entry['old'], entry['new'],
+                '{:+d}'.format(entry['change'])))
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,192 @@
+from array import array
+
+# Python implementations of the built-in chips (see tools/builtInChips) that
+# can't be built from Nand gates: the clocked chips and the memory maps.
+# Every implementation is given the values of its pins as integers, in the
+# order the chip declares them: evaluate() is given the unclocked inputs
+# and returns the outputs, tick() is given all the inputs when the clock
+# rises, and tock() commits the new state when the clock falls.
+
+
+class DFF(object):
+    """
+    Data flip-flop: out(t) = in(t-1). Its state (as read by test scripts) is
+    the value it latched on the last tick.
+    """
+    def __init__(self):
+        self.value = 0
+        self.next = 0
+
+    def evaluate(self):
+        return (self.value,)
+
+    def tick(self, value):
+        self.next = value
+
+    def tock(self):
+        self.value = self.next
+
+    def get(self, index):
+        return self.next
+
+    def set(self, index, value):
+        self.value = self.next = value
+
+
+class Register(DFF):
+    """A register (or a single bit): out(t) = in(t-1) if load(t-1)."""
+    def tick(self, value, load):
+        self.next = value if load else self.value
+
+
+class PC(DFF):
+    """A 16-bit counter with load, inc and reset controls."""
+    def tick(self, value, load, inc, reset):
+        if reset:
+            self.next = 0
+        elif load:
+            self.next = value
+        elif inc:
+            self.next = (self.value + 1) & 0xFFFF
+        else:
+            self.next = self.value
+
+
+class RAM(object):
+    """
+    A memory of 16-bit registers, whose output is the register at the
+    (unclocked) address.
+    """
+    def __init__(self, size):
+        self.memory = array('H', [0]) * size
+        self.write = None
+
+    def evaluate(self, address):
+        return (self.memory[address],)
+
+    def tick(self, value, load, address):
+        self.write = (address, value) if load else None
+
+    def tock(self):
+        if self.write is not None:
+            address, value = self.write
+            self.memory[address] = value
+            self.write = None
+
+    def get(self, index):
+        return self.memory[index]
+
+    def set(self, index, value):
+        self.memory[index] = value
+
+
+class ROM32K(RAM):
+    """The instruction memory, loaded with a program by test scripts."""
+    def __init__(self):
+        RAM.__init__(self, 32768)
+
+    def load(self, path):
+        """Loads the given program (a .hack file)."""
+        self.memory[:] = array('H', [0]) * len(self.memory)
+        with open(path) as f:
+            words = [int(line.strip(), 2) for line in f if line.strip()]
+        self.memory[:len(words)] = array('H', words)
+
+
+class Keyboard(object):
+    """The keyboard memory map, holding the code of the pressed key."""
+    def __init__(self):
+        self.key = 0
+
+    def evaluate(self):
+        return (self.key,)
+
+    def get(self, index):
+        return self.key
+
+    def set(self, index, value):
+        self.key = value
+
+
+class Combinational(object):
+    """A built-in chip without state, computed by a function of its inputs."""
+    def __init__(self, function):
+        self.evaluate = function
+
+
+def alu(x, y, zx, nx, zy, ny, f, no):
+    if zx:
+        x = 0
+    if nx:
+        x ^= 0xFFFF
+    if zy:
+        y = 0
+    if ny:
+        y ^= 0xFFFF
+
+    out = (x + y) & 0xFFFF if f else x & y
+    if no:
+        out ^= 0xFFFF
+
+    return out, int(out == 0), out >> 15
+
+
+def dmux(value, sel, ways):
+    """Returns the outputs of a demultiplexor: value at sel, 0 elsewhere."""
+    outputs = [0] * ways
+    outputs[sel] = value
+    return tuple(outputs)
+
+
+# The implementations of the chips that can't be built from Nand gates, by
+# chip name.
+builtins = {
+    'DFF': DFF,
+    'Bit': Register,
+    'Register': Register,
+    'ARegister': Register,
+    'DRegister': Register,
+    'PC': PC,
+    'RAM8': lambda: RAM(8),
+    'RAM64': lambda: RAM(64),
+    'RAM512': lambda: RAM(512),
+    'RAM4K': lambda: RAM(4096),
+    'RAM16K': lambda: RAM(16384),
+    'Screen': lambda: RAM(8192),
+    'Keyboard': Keyboard,
+    'ROM32K': ROM32K
+}
+
+# Native implementations of combinational chips, by chip name. They replace
+# the gates of the chips they're enabled for (see ChipLoader), computing
+# their outputs by integer arithmetic.
+natives = {
+    'Not': lambda a: (a ^ 1,),
+    'And': lambda a, b: (a & b,),
+    'Or': lambda a, b: (a | b,),
+    'Xor': lambda a, b: (a ^ b,),
+    'Mux': lambda a, b, sel: (b if sel else a,),
+    'DMux': lambda value, sel: dmux(value, sel, 2),
+    'Not16': lambda a: (a ^ 0xFFFF,),
+    'And16': lambda a, b: (a & b,),
+    'Or16': lambda a, b: (a | b,),
+    'Mux16': lambda a, b, sel: (b if sel else a,),
+    'Or8Way': lambda a: (int(a != 0),),
+    'Mux4Way16': lambda a, b, c, d, sel: ((a, b, c, d)[sel],),
+    'Mux8Way16': lambda a, b, c, d, e, f, g, h, sel:
+        ((a, b, c, d, e, f, g, h)[sel],),
+    'DMux4Way': lambda value, sel: dmux(value, sel, 4),
+    'DMux8Way': lambda value, sel: dmux(value, sel, 8),
+    'HalfAdder': lambda a, b: (a ^ b, a & b),
+    'FullAdder': lambda a, b, c: ((a + b + c) & 1, (a + b + c) >> 1),
+    'Add16': lambda a, b: ((a + b) & 0xFFFF,),
+    'Inc16': lambda a: ((a + 1) & 0xFFFF,),
+    'ALU': alu
+}
+
+
+def implementation(name):
+    """Returns a new instance of the implementation of the given chip."""
+    if name in builtins:
+        return builtins[name]()
+    return Combinational(natives[name])
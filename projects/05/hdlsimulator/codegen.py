@@ -0,0 +1,153 @@
+import os
+import marshal
+
+from netlist import FALSE, TRUE
+
+# The compiled code of the netlists, by the hash of their HDL files.
+code_cache = {}
+
+
+def wire_name(wire):
+    """Returns the expression of the value of the given wire."""
+    if wire == FALSE:
+        return '0'
+    if wire == TRUE:
+        return 'm'
+    return 'n{}'.format(wire)
+
+
+def pack(wires, name=wire_name):
+    """Returns the expression of the value of a pin, given its wires."""
+    terms = []
+    constant = 0
+    for bit, wire in enumerate(wires):
+        if wire == TRUE:
+            constant |= 1 << bit
+        elif wire != FALSE:
+            terms.append(name(wire) if bit == 0 else
+                '{} << {}'.format(name(wire), bit))
+
+    if constant or not terms:
+        terms.append(str(constant))
+
+    return ' | '.join(terms)
+
+
+def generate(netlist):
+    """
+    Returns the source of the evaluation functions of the given netlist:
+    evaluate(w, parts, m=1), which computes the wires, and tick(w, parts),
+    which clocks the clocked parts. w is the list of the values of the
+    wires, of which evaluate() reads the chip inputs and writes the chip
+    outputs and the inputs of the clocked parts, and parts are the
+    implementations of the built-in parts.
+
+    Each gate or part is a line of evaluate(), in levelized order, with the
+    wires held in local variables. A wire may also hold the bits of many
+    independent evaluations (one per bit), in which case m is the mask of
+    all of them, and true is m.
+    """
+    gates = netlist.gates
+    parts = netlist.parts
+
+    # The wires read by anything, the only part outputs worth unpacking.
+    used = set()
+    for out, a, b in gates:
+        used.update([a, b])
+    for part in parts:
+        for wires in part.inputs:
+            used.update(wires)
+    for name, wires in netlist.outputs:
+        used.update(wires)
+
+    # The wires written back for tick() and for the chip outputs.
+    stored = set()
+    for part in parts:
+        if part.is_clocked():
+            for wires in part.inputs:
+                stored.update(wires)
+    for name, wires in netlist.outputs:
+        stored.update(wires)
+    stored -= set([FALSE, TRUE])
+
+    lines = ['def evaluate(w, parts, m=1):']
+    if parts:
+        lines.append('    {}, = parts'.format(', '.join('p{}'.format(i)
+            for i in range(len(parts)))))
+
+    for name, wires in netlist.inputs:
+        for wire in wires:
+            lines.append('    n{} = w[{}]'.format(wire, wire))
+
+    for node in netlist.nodes:
+        if node < len(gates):
+            out, a, b = gates[node]
+            lines.append('    n{} = m ^ ({} & {})'.format(out, wire_name(a),
+                wire_name(b)))
+            continue
+
+        idx = node - len(gates)
+        part = parts[idx]
+        args = ', '.join(pack(wires) for wires in
+            part.combinational_inputs())
+        lines.append('    o = p{}.evaluate({})'.format(idx, args))
+        for pin, wires in enumerate(part.outputs):
+            for bit, wire in enumerate(wires):
+                if wire in used:
+                    lines.append('    n{} = o[{}] >> {} & 1'.format(wire, pin,
+                        bit))
+
+    for wire in sorted(stored):
+        lines.append('    w[{}] = n{}'.format(wire, wire))
+
+    lines.append('')
+    lines.append('def tick(w, parts):')
+    if parts:
+        lines.append('    {}, = parts'.format(', '.join('p{}'.format(i)
+            for i in range(len(parts)))))
+
+    def stored_name(wire):
+        return 'w[{}]'.format(wire)
+
+    for idx, part in enumerate(parts):
+        if part.is_clocked():
+            lines.append('    p{}.tick({})'.format(idx, ', '.join(
+                pack(wires, stored_name) for wires in part.inputs)))
+
+    lines.append('    pass')
+    return '\n'.join(lines) + '\n'
+
+
+def compile_netlist(netlist, cache_dir=None):
+    """
+    Returns the evaluate and tick functions of the given netlist (see
+    generate). The code is cached by the hash of the HDL files of the chip,
+    in memory and, if given a cache directory, on disk.
+    """
+    code = code_cache.get(netlist.digest)
+    path = None
+    if code is None and cache_dir is not None:
+        path = os.path.join(cache_dir, netlist.digest + '.code')
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                code = marshal.load(f)
+
+    if code is None:
+        code = compile(generate(netlist), '<{}>'.format(netlist.chip.name),
+            'exec')
+
+        # The file is written in full before it's renamed, so it's never
+        # read half written.
+        if path is not None:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            temp = '{}.{}'.format(path, os.getpid())
+            with open(temp, 'wb') as f:
+                marshal.dump(code, f)
+            os.rename(temp, path)
+
+    code_cache[netlist.digest] = code
+
+    namespace = {}
+    exec code in namespace
+    return namespace['evaluate'], namespace['tick']
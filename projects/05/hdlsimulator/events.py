@@ -0,0 +1,153 @@
+from hdl import HDLError
+from simulator import Simulator
+
+
+class EventSimulator(Simulator):
+    """
+    Simulates a chip by events: only the gates and parts whose inputs
+    changed since they were last evaluated are evaluated again. Every wire
+    holds its value, and a change of a wire schedules the nodes of its
+    fan-out (see Netlist.levelize). The scheduled nodes are evaluated level
+    by level, so each is evaluated at most once per evaluation of the chip.
+
+    The amount of evaluated nodes is counted (apart from the first
+    evaluation, of every node), as well as the amount of clocks (tocks) and
+    evaluations of the chip.
+    """
+    def compile(self, cache_dir):
+        netlist = self.netlist
+        self.gates = netlist.gates
+        self.fanout = netlist.fanout
+        self.levels = netlist.levels
+        self.buckets = [[] for level in range(max(netlist.levels or [0]) + 1)]
+        self.scheduled = bytearray(len(netlist.levels))
+
+        self.evaluated = 0
+        self.clocks = 0
+
+        # Initially, every node is yet to be evaluated.
+        for node in netlist.nodes:
+            self.schedule(node)
+
+    def schedule(self, node):
+        if not self.scheduled[node]:
+            self.scheduled[node] = 1
+            self.buckets[self.levels[node]].append(node)
+
+    def part(self, name):
+        impl = Simulator.part(self, name)
+
+        # The part may be changed by the caller (like a ROM that's loaded
+        # with a program), so it's evaluated again.
+        idx = self.parts.index(impl)
+        self.schedule(len(self.gates) + idx)
+        return impl
+
+    def set(self, name, value):
+        if name not in dict(self.netlist.inputs):
+            return Simulator.set(self, name, value)
+
+        values = self.values
+        for bit, wire in enumerate(self.pins[name]):
+            bit = (value >> bit) & 1
+            if values[wire] != bit:
+                values[wire] = bit
+                for node in self.fanout[wire]:
+                    self.schedule(node)
+
+    def eval(self):
+        """Evaluates the scheduled nodes, and the nodes they change."""
+        values = self.values
+        gates = self.gates
+        count = len(gates)
+        fanout = self.fanout
+        levels = self.levels
+        buckets = self.buckets
+        scheduled = self.scheduled
+        evaluated = 0
+
+        for bucket in buckets:
+            if not bucket:
+                continue
+
+            # The nodes scheduled on the way are on later levels.
+            for node in bucket:
+                scheduled[node] = 0
+                evaluated += 1
+
+                if node < count:
+                    out, a, b = gates[node]
+                    value = 1 ^ (values[a] & values[b])
+                    if value != values[out]:
+                        values[out] = value
+                        for dependent in fanout[out]:
+                            if not scheduled[dependent]:
+                                scheduled[dependent] = 1
+                                buckets[levels[dependent]].append(dependent)
+                else:
+                    for wire in self.eval_part(node - count):
+                        for dependent in fanout[wire]:
+                            if not scheduled[dependent]:
+                                scheduled[dependent] = 1
+                                buckets[levels[dependent]].append(dependent)
+
+            del bucket[:]
+
+        if self.evaluations:
+            self.evaluated += evaluated
+        self.evaluations += 1
+
+    def pack(self, wires):
+        values = self.values
+        value = 0
+        for bit, wire in enumerate(wires):
+            value |= values[wire] << bit
+        return value
+
+    def eval_part(self, idx):
+        """
+        Evaluates the given built-in part. Returns the wires it changed.
+        """
+        part = self.netlist.parts[idx]
+        outputs = self.parts[idx].evaluate(*[self.pack(wires)
+            for wires in part.combinational_inputs()])
+
+        values = self.values
+        changed = []
+        for wires, output in zip(part.outputs, outputs):
+            for bit, wire in enumerate(wires):
+                value = (output >> bit) & 1
+                if values[wire] != value:
+                    values[wire] = value
+                    changed.append(wire)
+
+        return changed
+
+    def tick(self):
+        self.eval()
+        for idx, part in enumerate(self.netlist.parts):
+            if part.is_clocked():
+                self.parts[idx].tick(*[self.pack(wires)
+                    for wires in part.inputs])
+
+    def tock(self):
+        # The clocked parts may change their outputs.
+        count = len(self.gates)
+        for idx, part in enumerate(self.netlist.parts):
+            if part.is_clocked():
+                self.parts[idx].tock()
+                self.schedule(count + idx)
+
+        self.clocks += 1
+        self.eval()
+
+    def eval_vectors(self, vectors):
+        raise HDLError('Event simulation evaluates a vector at a time')
+
+    def per_clock(self):
+        """
+        Returns the average amount of nodes evaluated per clock (or per
+        evaluation, for a chip that isn't clocked).
+        """
+        return float(self.evaluated) / (self.clocks or
+            max(self.evaluations - 1, 1))
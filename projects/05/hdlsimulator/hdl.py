@@ -0,0 +1,201 @@
+import os
+import re
+
+# The directory of the projects, whose chips are used as the parts of other
+# chips, and the directory of the built-in chips of the nand2tetris tools.
+PROJECTS = os.path.normpath(os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), '..', '..'))
+BUILTIN_DIR = os.path.normpath(os.path.join(PROJECTS, '..', 'tools',
+    'builtInChips'))
+
+# The directories searched for the parts of a chip, after the directory of
+# the chip itself.
+search_path = [os.path.join(PROJECTS, d) for d in ['01', '02', '03/a',
+    '03/b', '05']] + [BUILTIN_DIR]
+
+
+class HDLError(Exception):
+    """Raised for chips that can't be parsed or built."""
+    pass
+
+
+def tokenize(text):
+    """Returns the tokens of an HDL file, without its comments."""
+    text = re.sub(r'/\*.*?\*/', ' ', text, flags=re.S)
+    text = re.sub(r'//[^\n]*', ' ', text)
+    return re.findall(r'\.\.|[A-Za-z_]\w*|\d+|\S', text)
+
+
+class Chip(object):
+    """
+    A chip, as declared by an HDL file: its input and output pins (as
+    (name, width) pairs), and either its parts or the name of its built-in
+    implementation and the inputs that only affect it on a clock (CLOCKED).
+    A part is a (chip name, connections) pair, where each connection is a
+    (pin, pin bits, wire, wire bits) tuple and bits is a (first, last) pair
+    (None for the whole pin).
+    """
+    def __init__(self, path, text):
+        self.path = path
+        self.dirname = os.path.dirname(path)
+        self.text = text
+
+        self.name = None
+        self.inputs = []
+        self.outputs = []
+        self.parts = []
+        self.builtin = None
+        self.clocked = set()
+
+        self.tokens = tokenize(text)
+        self.idx = 0
+        self.parse()
+        del self.tokens
+
+    def is_stub(self):
+        """Returns whether the chip is yet to be implemented."""
+        return not self.parts and self.builtin is None
+
+    def width(self, pin):
+        """Returns the width of the given input or output pin (or None)."""
+        for name, width in self.inputs + self.outputs:
+            if name == pin:
+                return width
+
+        return None
+
+    def next(self):
+        if self.idx >= len(self.tokens):
+            raise HDLError('{}: unexpected end of file'.format(self.path))
+        token = self.tokens[self.idx]
+        self.idx += 1
+        return token
+
+    def peek(self):
+        return self.tokens[self.idx] if self.idx < len(self.tokens) else None
+
+    def expect(self, expected):
+        token = self.next()
+        if token != expected:
+            raise HDLError('{}: expected {!r}, got {!r}'.format(self.path,
+                expected, token))
+
+    def parse(self):
+        self.expect('CHIP')
+        self.name = self.next()
+        self.expect('{')
+
+        while self.peek() != '}':
+            section = self.next()
+            if section in ['IN', 'OUT']:
+                pins = self.inputs if section == 'IN' else self.outputs
+                pins.extend(self.pin_list())
+            elif section == 'PARTS':
+                self.expect(':')
+                while self.peek() not in ['}', None]:
+                    self.parts.append(self.part())
+            elif section == 'BUILTIN':
+                self.builtin = self.next()
+                self.expect(';')
+            elif section == 'CLOCKED':
+                self.clocked.update(name for name, width in self.pin_list())
+            else:
+                raise HDLError('{}: unexpected {!r}'.format(self.path,
+                    section))
+
+        self.expect('}')
+
+    def pin_list(self):
+        """Parses a list of pin declarations, up to its ';'."""
+        pins = []
+        while True:
+            name = self.next()
+            width = 1
+            if self.peek() == '[':
+                self.next()
+                width = int(self.next())
+                self.expect(']')
+            pins.append((name, width))
+
+            if self.next() == ';':
+                return pins
+
+    def part(self):
+        """Parses a part, like Nand(a=x, b=y[0], out=z);"""
+        name = self.next()
+        self.expect('(')
+
+        connections = []
+        while True:
+            pin, pin_bits = self.pin_ref()
+            self.expect('=')
+            wire, wire_bits = self.pin_ref()
+            connections.append((pin, pin_bits, wire, wire_bits))
+
+            token = self.next()
+            if token == ')':
+                break
+            elif token != ',':
+                raise HDLError('{}: unexpected {!r} in part {}'.format(
+                    self.path, token, name))
+
+        self.expect(';')
+        return name, connections
+
+    def pin_ref(self):
+        """Parses a pin name and its optional bits, like a or a[3] or a[0..7]."""
+        name = self.next()
+        if self.peek() != '[':
+            return name, None
+
+        self.next()
+        first = last = int(self.next())
+        if self.peek() == '..':
+            self.next()
+            last = int(self.next())
+        self.expect(']')
+
+        if last < first:
+            raise HDLError('{}: bad sub bus {}[{}..{}]'.format(self.path,
+                name, first, last))
+
+        return name, (first, last)
+
+
+class ChipLoader(object):
+    """
+    Finds and parses the chips used by a chip. A part is looked up in the
+    directory of the chip that uses it, then in the search path, and chips
+    that are yet to be implemented (with no parts) are skipped, so they fall
+    back to their built-in versions.
+
+    Parts named in native are always replaced by their built-in versions,
+    to be simulated by their native implementations (see builtin.py).
+    """
+    def __init__(self, path=None, native=()):
+        self.path = path if path is not None else search_path
+        self.native = set(native)
+        self.chips = {}
+
+    def parse(self, path):
+        """Returns the chip of the given HDL file."""
+        path = os.path.abspath(path)
+        if path not in self.chips:
+            with open(path) as f:
+                self.chips[path] = Chip(path, f.read())
+
+        return self.chips[path]
+
+    def load(self, name, dirname):
+        """Returns the chip of the given name, used in the given directory."""
+        if name in self.native:
+            return self.parse(os.path.join(BUILTIN_DIR, name + '.hdl'))
+
+        for directory in [dirname] + self.path:
+            path = os.path.join(directory, name + '.hdl')
+            if os.path.isfile(path):
+                chip = self.parse(path)
+                if not chip.is_stub():
+                    return chip
+
+        raise HDLError('Chip {} is not implemented'.format(name))
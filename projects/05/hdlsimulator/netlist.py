@@ -0,0 +1,289 @@
+import hashlib
+from collections import deque
+
+from hdl import HDLError
+
+# The wires of the constants false and true.
+FALSE = 0
+TRUE = 1
+
+
+class Part(object):
+    """
+    An instance of a built-in chip in a netlist: the wires of its input and
+    output pins (a list of wires per pin, from the least significant bit, in
+    the order the chip declares them), and which of its inputs are clocked.
+    """
+    def __init__(self, chip, inputs, outputs, owner=None):
+        self.chip = chip
+        self.name = chip.name
+        self.inputs = inputs
+        self.outputs = outputs
+        self.clocked = [name in chip.clocked for name, width in chip.inputs]
+        self.owner = owner
+
+    def is_clocked(self):
+        return any(self.clocked)
+
+    def combinational_inputs(self):
+        """Returns the input pins that affect the outputs without a clock."""
+        return [wires for wires, clocked in zip(self.inputs, self.clocked)
+            if not clocked]
+
+
+class Netlist(object):
+    """
+    A chip flattened down to Nand gates and built-in parts. Every bit is a
+    wire, numbered from 2 (0 and 1 are the constants false and true). A gate
+    is an (out, a, b) tuple of wires, and the gates and parts are levelized:
+    each comes after the ones its (unclocked) inputs depend on.
+    """
+    def __init__(self, loader, path):
+        self.loader = loader
+        self.wires = 2
+        self.gates = []
+        self.parts = []
+
+        # The index of the part of the chip (in its PARTS) that every gate
+        # was instantiated by.
+        self.owners = []
+        self.owner = None
+
+        # Maps the wires of pins that are connected to other wires (like an
+        # internal pin to the output of the part that drives it).
+        self.aliases = {}
+
+        # The names of the internal pins of the chips, by their wires, for
+        # wires that must be driven.
+        self.internals = {}
+        self.sources = set()
+
+        chip = loader.parse(path)
+        if chip.is_stub():
+            raise HDLError('Chip {} has no parts'.format(chip.name))
+
+        self.chip = chip
+        self.inputs = [(name, self.new_wires(width))
+            for name, width in chip.inputs]
+        self.outputs = [(name, self.new_wires(width))
+            for name, width in chip.outputs]
+
+        self.instantiate(chip, dict(self.inputs + self.outputs))
+        self.resolve()
+        self.levelize()
+
+        self.digest = hashlib.sha1(''.join(sorted(self.sources))).hexdigest()
+
+    def new_wires(self, width):
+        """Returns the given amount of new wires."""
+        self.wires += width
+        return range(self.wires - width, self.wires)
+
+    def instantiate(self, chip, pins):
+        """
+        Adds the given chip to the netlist, connecting its pins (by name) to
+        the given wires.
+        """
+        self.sources.add(chip.name + '\0' + chip.text)
+
+        if chip.name == 'Nand':
+            self.gates.append((pins['out'][0], pins['a'][0], pins['b'][0]))
+            self.owners.append(self.owner)
+            return
+
+        if chip.builtin is not None:
+            self.parts.append(Part(chip, [pins[name] for name, width in
+                chip.inputs], [pins[name] for name, width in chip.outputs],
+                self.owner))
+            return
+
+        # The wires of the pins and internal pins of this chip.
+        wires = dict(pins)
+
+        for idx, (name, connections) in enumerate(chip.parts):
+            if chip is self.chip:
+                self.owner = idx
+
+            part = self.loader.load(name, chip.dirname)
+            outputs = dict(part.outputs)
+            part_pins = {}
+
+            # Unconnected inputs are false.
+            for pin, width in part.inputs:
+                part_pins[pin] = [FALSE] * width
+            for pin, width in part.outputs:
+                part_pins[pin] = self.new_wires(width)
+
+            for pin, pin_bits, wire, wire_bits in connections:
+                width = part.width(pin)
+                if width is None:
+                    raise HDLError('{}: {} has no pin {}'.format(chip.name,
+                        name, pin))
+
+                first, last = pin_bits or (0, width - 1)
+                if last >= width:
+                    raise HDLError('{}: {}[{}..{}] is out of range'.format(
+                        chip.name, pin, first, last))
+
+                if pin in outputs:
+                    targets = self.target(chip, wires, wire, wire_bits,
+                        last - first + 1)
+                    for target, source in zip(targets,
+                        part_pins[pin][first:last + 1]):
+                        self.alias(chip, target, source)
+                else:
+                    part_pins[pin][first:last + 1] = self.source(chip, wires,
+                        wire, wire_bits, last - first + 1)
+
+            self.instantiate(part, part_pins)
+
+    def bits(self, chip, wire, wires, wire_bits, width):
+        """Returns the given bits of the wires of a pin of the chip."""
+        if wire_bits is None:
+            if len(wires) != width:
+                raise HDLError('{}: {} is {} bits wide, expected {}'.format(
+                    chip.name, wire, len(wires), width))
+            return wires
+
+        first, last = wire_bits
+        if last >= len(wires) or last - first + 1 != width:
+            raise HDLError('{}: bad sub bus {}[{}..{}]'.format(chip.name,
+                wire, first, last))
+
+        return wires[first:last + 1]
+
+    def source(self, chip, wires, wire, wire_bits, width):
+        """Returns the wires of a connection to an input of a part."""
+        if wire in ['true', 'false']:
+            return [TRUE if wire == 'true' else FALSE] * width
+        if wire in dict(chip.outputs):
+            raise HDLError('{}: output pin {} can\'t feed a part'.format(
+                chip.name, wire))
+
+        if wire not in wires:
+            if wire_bits is not None:
+                raise HDLError('{}: sub bus of internal pin {}'.format(
+                    chip.name, wire))
+            wires[wire] = self.new_wires(width)
+            for w in wires[wire]:
+                self.internals[w] = '{}.{}'.format(chip.name, wire)
+
+        return self.bits(chip, wire, wires[wire], wire_bits, width)
+
+    def target(self, chip, wires, wire, wire_bits, width):
+        """Returns the wires of a connection from an output of a part."""
+        if wire in ['true', 'false'] or wire in dict(chip.inputs):
+            raise HDLError('{}: a part output can\'t drive {}'.format(
+                chip.name, wire))
+
+        if wire not in wires:
+            if wire_bits is not None:
+                raise HDLError('{}: sub bus of internal pin {}'.format(
+                    chip.name, wire))
+            wires[wire] = self.new_wires(width)
+
+        return self.bits(chip, wire, wires[wire], wire_bits, width)
+
+    def alias(self, chip, wire, source):
+        """Connects the given wire to the wire that drives it."""
+        if wire in self.aliases:
+            raise HDLError('{}: a pin has more than one source'.format(
+                chip.name))
+        self.aliases[wire] = source
+
+    def find(self, wire):
+        """Returns the wire that actually drives the given wire."""
+        while wire in self.aliases:
+            wire = self.aliases[wire]
+
+        if wire in self.internals:
+            raise HDLError('Internal pin {} has no source'.format(
+                self.internals[wire]))
+
+        return wire
+
+    def resolve(self):
+        """
+        Replaces every wire by the wire that drives it. Undriven outputs are
+        false.
+        """
+        driven = set([FALSE, TRUE])
+        for name, wires in self.inputs:
+            driven.update(wires)
+        for out, a, b in self.gates:
+            driven.add(out)
+        for part in self.parts:
+            for wires in part.outputs:
+                driven.update(wires)
+
+        def find(wire):
+            wire = self.find(wire)
+            return wire if wire in driven else FALSE
+
+        self.gates = [(out, find(a), find(b)) for out, a, b in self.gates]
+        for part in self.parts:
+            part.inputs = [[find(w) for w in wires] for wires in part.inputs]
+
+        self.outputs = [(name, [find(w) for w in wires])
+            for name, wires in self.outputs]
+        self.aliases = {}
+
+    def levelize(self):
+        """
+        Orders the gates and parts so each comes after the ones it depends
+        on (a topological sort), and keeps the order as self.nodes: gates
+        are given by their index, and parts by their index plus the amount
+        of gates. Raises HDLError on a combinational loop.
+
+        Also keeps the level of every node (1 plus the highest level of the
+        nodes it depends on) as self.levels, and the nodes that read every
+        wire without a clock (the fan-out of the wire) as self.fanout.
+        """
+        count = len(self.gates)
+        drivers = {}
+        for node, (out, a, b) in enumerate(self.gates):
+            drivers[out] = node
+        for idx, part in enumerate(self.parts):
+            for wires in part.outputs:
+                for wire in wires:
+                    drivers[wire] = count + idx
+
+        inputs = [(a, b) for out, a, b in self.gates] + \
+            [[w for wires in part.combinational_inputs() for w in wires]
+            for part in self.parts]
+
+        dependents = [[] for node in inputs]
+        pending = [0] * len(inputs)
+        self.fanout = [[] for wire in range(self.wires)]
+        for node, wires in enumerate(inputs):
+            for wire in set(wires):
+                self.fanout[wire].append(node)
+            for dependency in set(drivers[w] for w in wires if w in drivers):
+                dependents[dependency].append(node)
+                pending[node] += 1
+
+        ready = deque(node for node in range(len(inputs)) if not pending[node])
+        self.nodes = []
+        while ready:
+            node = ready.popleft()
+            self.nodes.append(node)
+            for dependent in dependents[node]:
+                pending[dependent] -= 1
+                if not pending[dependent]:
+                    ready.append(dependent)
+
+        if len(self.nodes) != len(inputs):
+            raise HDLError('Chip {} has a combinational loop'.format(
+                self.chip.name))
+
+        self.levels = [0] * len(inputs)
+        for node in self.nodes:
+            for dependent in dependents[node]:
+                self.levels[dependent] = max(self.levels[dependent],
+                    self.levels[node] + 1)
+
+    def node(self, node):
+        """Returns the gate or part of the given node."""
+        if node < len(self.gates):
+            return self.gates[node]
+        return self.parts[node - len(self.gates)]
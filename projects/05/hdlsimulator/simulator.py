@@ -0,0 +1,150 @@
+import re
+
+from builtin import builtins, natives, implementation
+from codegen import compile_netlist
+from hdl import HDLError
+
+# The state of a built-in part, as named by test scripts (like RAM16K[2] or
+# DRegister[]).
+part_state = re.compile(r'(\w+)\[(\d*)\]$')
+
+
+class Simulator(object):
+    """
+    Simulates a chip, given its netlist: the pins of the chip are set and
+    read by name, and the chip is evaluated by its compiled evaluation
+    function (see codegen.py) and clocked by tick() and tock().
+    """
+    def __init__(self, netlist, cache_dir=None):
+        self.netlist = netlist
+        self.values = [0] * netlist.wires
+        self.values[1] = 1
+
+        self.parts = []
+        for part in netlist.parts:
+            if part.name not in builtins and part.name not in natives:
+                raise HDLError('Built-in chip {} is not supported'.format(
+                    part.name))
+            self.parts.append(implementation(part.name))
+
+        self.clocked = [impl for impl, part in zip(self.parts, netlist.parts)
+            if part.is_clocked()]
+
+        self.compile(cache_dir)
+        self.pins = dict(netlist.inputs + netlist.outputs)
+
+        # The amount of times the netlist was evaluated.
+        self.evaluations = 0
+
+    def compile(self, cache_dir):
+        """Compiles the evaluation functions of the netlist."""
+        self.evaluate, self.clock = compile_netlist(self.netlist, cache_dir)
+
+    def part(self, name):
+        """Returns the implementation of the first built-in part named so."""
+        for impl, part in zip(self.parts, self.netlist.parts):
+            if part.name == name:
+                return impl
+
+        raise HDLError('Chip {} has no part {}'.format(
+            self.netlist.chip.name, name))
+
+    def width(self, name):
+        """Returns the width of the given pin (or part state)."""
+        if name in self.pins:
+            return len(self.pins[name])
+        return 16
+
+    def get(self, name):
+        """
+        Returns the value of the given pin (as of the last evaluation), or
+        of the state of a built-in part, as an unsigned integer.
+        """
+        if name in self.pins:
+            values = self.values
+            value = 0
+            for bit, wire in enumerate(self.pins[name]):
+                value |= values[wire] << bit
+            return value
+
+        match = part_state.match(name)
+        if match is None:
+            raise HDLError('Unknown pin {}'.format(name))
+        return self.part(match.group(1)).get(int(match.group(2) or 0))
+
+    def set(self, name, value):
+        """Sets the given input pin, or the state of a built-in part."""
+        if name in dict(self.netlist.inputs):
+            for bit, wire in enumerate(self.pins[name]):
+                self.values[wire] = (value >> bit) & 1
+            return
+
+        match = part_state.match(name)
+        if match is None:
+            raise HDLError('Unknown input pin {}'.format(name))
+        self.part(match.group(1)).set(int(match.group(2) or 0),
+            value & 0xFFFF)
+
+    def eval(self):
+        """Evaluates the chip."""
+        self.evaluate(self.values, self.parts)
+        self.evaluations += 1
+
+    def tick(self):
+        """
+        Raises the clock: the chip is evaluated, and the clocked parts read
+        their inputs.
+        """
+        self.evaluate(self.values, self.parts)
+        self.clock(self.values, self.parts)
+        self.evaluations += 1
+
+    def tock(self):
+        """
+        Lowers the clock: the clocked parts commit their new state, and the
+        chip is evaluated.
+        """
+        for impl in self.clocked:
+            impl.tock()
+        self.evaluate(self.values, self.parts)
+        self.evaluations += 1
+
+    def eval_vectors(self, vectors):
+        """
+        Evaluates a combinational chip on each of the given input vectors
+        (dicts of input pin values), all at once: every wire holds a bit per
+        vector. Returns the output pin values of each vector, as dicts.
+        Doesn't change the pins of the chip.
+        """
+        if self.parts:
+            raise HDLError('Chip {} isn\'t combinational'.format(
+                self.netlist.chip.name))
+
+        count = len(vectors)
+        mask = (1 << count) - 1
+        values = [0] * self.netlist.wires
+        values[1] = mask
+
+        # The wire of each input bit gets the bit of every vector.
+        for name, wires in self.netlist.inputs:
+            pins = [vector.get(name, 0) for vector in vectors]
+            for bit, wire in enumerate(wires):
+                value = 0
+                for idx, pin in enumerate(pins):
+                    value |= ((pin >> bit) & 1) << idx
+                values[wire] = value
+
+        self.evaluate(values, self.parts, mask)
+        self.evaluations += 1
+
+        results = [{} for vector in vectors]
+        for name, wires in self.netlist.outputs:
+            pins = [0] * count
+            for bit, wire in enumerate(wires):
+                value = values[wire]
+                for idx in xrange(count):
+                    pins[idx] |= ((value >> idx) & 1) << bit
+            for idx in xrange(count):
+                results[idx][name] = pins[idx]
+
+        return results
@@ -0,0 +1,429 @@
+import os
+import re
+
+from hdl import ChipLoader, HDLError
+from netlist import Netlist
+from simulator import Simulator
+from events import EventSimulator
+
+# The comparisons of while conditions.
+conditions = {
+    '=': lambda x, y: x == y,
+    '<>': lambda x, y: x != y,
+    '<': lambda x, y: x < y,
+    '>': lambda x, y: x > y,
+    '<=': lambda x, y: x <= y,
+    '>=': lambda x, y: x >= y
+}
+
+# The radixes of values in scripts (like %B101, %X1F or %D-1).
+radixes = {'B': 2, 'X': 16, 'D': 10}
+
+# The most iterations of a while loop. Loops that wait for a key (of
+# interactive scripts) never end otherwise.
+MAX_ITERATIONS = 100000
+
+
+class ScriptError(Exception):
+    """Raised for scripts the runner doesn't support (or can't parse)."""
+    pass
+
+
+class CrossCheckFailure(Exception):
+    """
+    Raised on the first output of a chip with native parts that differs
+    from the output of its gate level version.
+    """
+    def __init__(self, line, pin, value, expected):
+        Exception.__init__(self, 'Native parts differ at line {}: {} is ' \
+            '{}, {} at gate level'.format(line, pin, value, expected))
+        self.line = line
+
+
+class Mismatch(Exception):
+    """Raised on the first output line that differs from the compare file."""
+    def __init__(self, line, expected, actual):
+        Exception.__init__(self, 'Comparison failure at line {}: expected ' \
+            '{!r}, got {!r}'.format(line, expected, actual))
+        self.line = line
+
+
+def tokenize(text):
+    """
+    Returns the tokens of a test script: words, quoted strings, braces and
+    the command terminators (',', ';' and '!').
+    """
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'//[^\n]*', '', text)
+    return re.findall(r'"[^"]*"|[{},;!]|[^\s{},;!]+', text)
+
+
+def parse(tokens, idx=0):
+    """
+    Parses the commands of a script from the given token index, up to the
+    end of the script or of the enclosing block. Returns the commands and
+    the index after them. A command is a list of words, or a ('repeat',
+    count, commands) or ('while', condition, commands) tuple.
+    """
+    commands = []
+    words = []
+
+    while idx < len(tokens):
+        token = tokens[idx]
+        idx += 1
+
+        if token == '}':
+            break
+        elif token in [',', ';', '!']:
+            if words:
+                commands.append(words)
+            words = []
+        elif token == '{':
+            body, idx = parse(tokens, idx)
+            if words and words[0] == 'repeat':
+                count = int(words[1]) if len(words) > 1 else -1
+                commands.append(('repeat', count, body))
+            elif words and words[0] == 'while':
+                commands.append(('while', words[1:], body))
+            else:
+                raise ScriptError('Unexpected block after {}'.format(words))
+            words = []
+        else:
+            words.append(token)
+
+    if words:
+        commands.append(words)
+
+    return commands, idx
+
+
+def parse_value(text):
+    """Returns the value of a script literal, like 5, -1 or %B101."""
+    if text.startswith('%'):
+        return int(text[2:], radixes[text[1].upper()])
+    return int(text)
+
+
+class OutputColumn(object):
+    """
+    A column of the output list, as given by name%Fl.w.r: the format
+    (D decimal, B binary, X hexadecimal or S string), and the padding
+    around a value of the given width.
+    """
+    def __init__(self, spec):
+        name, _, fmt = spec.partition('%')
+        self.name = name
+        self.fmt = fmt[0] if fmt else 'B'
+        left, width, right = (fmt[1:] or '1.1.1').split('.')
+        self.left, self.width, self.right = int(left), int(width), int(right)
+
+    def header(self):
+        """Returns the column header, its name centered."""
+        total = self.left + self.width + self.right
+        name = self.name[:total]
+        left = (total - len(name)) / 2
+        return ' ' * left + name + ' ' * (total - len(name) - left)
+
+    def format(self, value, bits=16):
+        """
+        Returns the given value (an unsigned integer of the given amount of
+        bits, or a string), formatted as the column. 16-bit values are
+        signed in decimal.
+        """
+        if self.fmt == 'S' or isinstance(value, str):
+            text = str(value).ljust(self.width)
+        elif self.fmt == 'B':
+            text = format(value, '0{}b'.format(self.width))[-self.width:]
+        elif self.fmt == 'X':
+            text = format(value, '0{}X'.format(self.width))[-self.width:]
+        else:
+            if bits == 16 and value & 0x8000:
+                value -= 0x10000
+            text = str(value).rjust(self.width)
+
+        return ' ' * self.left + text + ' ' * self.right
+
+
+class TestScript(object):
+    """
+    Runs a test script of the hardware simulator: loads a chip, sets its
+    inputs, evaluates and clocks it, and outputs its pins. Every output line
+    is compared to the compare file as soon as it is written, and the script
+    stops at the first mismatch.
+
+    Given an amount of vectors, the evaluations of a combinational chip are
+    batched: up to that amount of evaluated input vectors are evaluated at
+    once (see Simulator.eval_vectors), and the output lines that depend on
+    them are written after the batch.
+
+    Given the names of parts to replace by their native implementations
+    (see builtin.py), the chip is simulated with them, and if cross checked,
+    also without them, and every output is compared between the two.
+
+    If given events, the chip is simulated by events (see events.py).
+    """
+    def __init__(self, path, cache_dir=None, vectors=None, native=(),
+        crosscheck=False, events=False):
+        self.path = path
+        self.dirname = os.path.dirname(path)
+        self.cache_dir = cache_dir
+        self.batch = vectors
+        self.native = native
+        self.crosscheck = crosscheck
+        self.events = events
+
+        # The chip, and its gate level version when cross checked.
+        self.chip = None
+        self.reference = None
+        self.columns = []
+        self.expected = None
+        self.lines = 0
+
+        self.time = 0
+        self.ticked = False
+
+        # The input vectors of the current batch, the output lines waiting
+        # for them (each an index of the vector its outputs are of, or None
+        # for the outputs of the last batch, and the values of the other
+        # columns), and the outputs of the last vector of the last batch.
+        self.vectors = []
+        self.pending = []
+        self.last_outputs = {}
+
+    def run(self):
+        """
+        Runs the script. Raises Mismatch on the first output line that
+        differs from the compare file.
+        """
+        with open(self.path) as f:
+            commands, idx = parse(tokenize(f.read()))
+
+        try:
+            self.execute(commands)
+            self.flush()
+        finally:
+            if self.expected is not None:
+                self.expected.close()
+
+        return self.lines
+
+    def execute(self, commands):
+        for command in commands:
+            if isinstance(command, tuple) and command[0] == 'repeat':
+                if command[1] < 0:
+                    raise ScriptError('Endless repeat (an interactive ' +
+                        'script) is not supported')
+                for i in xrange(command[1]):
+                    self.execute(command[2])
+            elif isinstance(command, tuple):
+                iterations = 0
+                while self.condition(command[1]):
+                    iterations += 1
+                    if iterations > MAX_ITERATIONS:
+                        raise ScriptError('A while loop doesn\'t end (an ' +
+                            'interactive script?)')
+                    self.execute(command[2])
+            else:
+                self.command(command)
+
+    def condition(self, words):
+        if len(words) != 3 or words[1] not in conditions:
+            raise ScriptError('Unsupported condition {}'.format(words))
+
+        value = self.value(words[0])
+        if self.machine().width(words[0]) == 16 and value & 0x8000:
+            value -= 0x10000
+        return conditions[words[1]](value, parse_value(words[2]))
+
+    def batching(self):
+        """Returns whether the evaluations are batched."""
+        return self.batch and self.chip is not None and \
+            not self.chip.parts and self.reference is None and not self.events
+
+    def command(self, words):
+        name = words[0]
+
+        if self.batching():
+            if name == 'eval':
+                self.vectors.append(dict((pin, self.chip.get(pin))
+                    for pin, wires in self.chip.netlist.inputs))
+                if len(self.vectors) >= self.batch:
+                    self.flush()
+                return
+            elif name == 'output':
+                self.pending.append((len(self.vectors) - 1 if self.vectors
+                    else None, self.column_values(outputs=False)))
+                return
+            elif name != 'set':
+                self.flush()
+
+        if name == 'load':
+            self.load(words[1])
+        elif name == 'ROM32K' and words[1:2] == ['load']:
+            for machine in self.machines():
+                machine.part('ROM32K').load(os.path.join(self.dirname,
+                    words[2]))
+        elif name == 'output-list':
+            self.columns = [OutputColumn(spec) for spec in words[1:]]
+            self.output_line('|' + '|'.join(c.header() for c in
+                self.columns) + '|')
+        elif name == 'compare-to':
+            self.expected = open(os.path.join(self.dirname, words[1]))
+        elif name == 'output':
+            values = self.column_values()
+            if self.reference is not None:
+                self.cross_check(values)
+            self.output(values)
+        elif name == 'set':
+            for machine in self.machines():
+                machine.set(words[1], parse_value(words[2]))
+        elif name == 'eval':
+            for machine in self.machines():
+                machine.eval()
+        elif name == 'tick':
+            for machine in self.machines():
+                machine.tick()
+            self.ticked = True
+        elif name == 'tock':
+            for machine in self.machines():
+                machine.tock()
+            self.time += 1
+            self.ticked = False
+        elif name in ['output-file', 'echo', 'clear-echo', 'breakpoint',
+            'clear-breakpoints']:
+            pass
+        else:
+            raise ScriptError('Unsupported command {}'.format(name))
+
+    def load(self, filename):
+        path = os.path.join(self.dirname, filename)
+        simulator = EventSimulator if self.events else Simulator
+        self.chip = simulator(Netlist(ChipLoader(native=self.native), path),
+            self.cache_dir)
+
+        if self.crosscheck:
+            self.reference = Simulator(Netlist(ChipLoader(), path),
+                self.cache_dir)
+
+    def machine(self):
+        if self.chip is None:
+            raise ScriptError('No chip is loaded')
+        return self.chip
+
+    def machines(self):
+        """Returns the chip, and its gate level version if cross checked."""
+        machine = self.machine()
+        return [machine, self.reference] if self.reference else [machine]
+
+    def value(self, name):
+        if name == 'time':
+            return '{}{}'.format(self.time, '+' if self.ticked else '')
+
+        # The outputs of batched evaluations are only known after them.
+        if self.batching() and name in dict(self.chip.netlist.outputs):
+            self.flush()
+            return self.last_outputs.get(name, 0)
+
+        return self.machine().get(name)
+
+    def column_values(self, outputs=True):
+        """
+        Returns the values of the output list columns, by name, without the
+        chip outputs unless given outputs.
+        """
+        chip_outputs = dict(self.machine().netlist.outputs)
+        return dict((column.name, self.value(column.name))
+            for column in self.columns
+            if outputs or column.name not in chip_outputs)
+
+    def cross_check(self, values):
+        """
+        Compares the values of the output list columns with the gate level
+        version of the chip.
+        """
+        for column in self.columns:
+            if column.name == 'time':
+                continue
+            expected = self.reference.get(column.name)
+            if values[column.name] != expected:
+                raise CrossCheckFailure(self.lines + 1, column.name,
+                    values[column.name], expected)
+
+    def output(self, values=None):
+        values = values if values is not None else self.column_values()
+        line = []
+        for column in self.columns:
+            bits = 16 if column.name == 'time' else \
+                self.machine().width(column.name)
+            line.append(column.format(values[column.name], bits))
+
+        self.output_line('|' + '|'.join(line) + '|')
+
+    def flush(self):
+        """
+        Evaluates the batched vectors, and writes the output lines that
+        waited for them.
+        """
+        if not self.vectors and not self.pending:
+            return
+
+        results = self.chip.eval_vectors(self.vectors) if self.vectors \
+            else []
+        pending = self.pending
+        self.vectors = []
+        self.pending = []
+
+        for idx, values in pending:
+            outputs = results[idx] if idx is not None else self.last_outputs
+            values.update((name, outputs.get(name, 0))
+                for name, wires in self.chip.netlist.outputs)
+            self.output(values)
+
+        if results:
+            self.last_outputs = results[-1]
+
+    def output_line(self, line):
+        """Compares an output line with the next line of the compare file."""
+        self.lines += 1
+        if self.expected is None:
+            return
+
+        expected = self.expected.readline()
+        expected = expected.rstrip('\r\n') if expected else None
+        if expected is None or not matches(expected, line):
+            raise Mismatch(self.lines, expected, line)
+
+
+def matches(expected, line):
+    """
+    Returns whether an output line matches the expected one, where a '*'
+    in the expected line matches any character.
+    """
+    if len(expected) != len(line):
+        return False
+
+    return all(e == c or e == '*' for e, c in zip(expected, line))
+
+
+def run_script(path, cache_dir=None, vectors=None, native=(),
+    crosscheck=False, events=False):
+    """
+    Runs the given test script. Returns a (path, passed, message) tuple.
+    """
+    try:
+        script = TestScript(path, cache_dir, vectors, native, crosscheck,
+            events)
+        lines = script.run()
+
+        chip = script.chip
+        message = '{} lines, {} evaluations'.format(lines,
+            chip.evaluations if chip else 0)
+        if isinstance(chip, EventSimulator):
+            message += ', {:.1f} of {} nodes evaluated per clock'.format(
+                chip.per_clock(), len(chip.netlist.nodes))
+
+        return path, True, message
+    except (Mismatch, CrossCheckFailure) as err:
+        return path, False, str(err)
+    except (ScriptError, HDLError, IOError, ValueError) as err:
+        return path, False, 'Error: {}'.format(err)
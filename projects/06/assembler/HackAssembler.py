@@ -9,10 +9,17 @@ def main():
     Transforms a program written in assembly code into binary machine code
     that can be run on the Hack hardware.
     """
-    if len(sys.argv) < 2:
-        raise Exception("Usage: python HackAssembler.py filename")
+    # The --symbols flag also writes the ROM address of every label to a
+    # .sym file, for tools that map addresses back to the source (like the
+    # profiler of the CPU emulator).
+    args = sys.argv[1:]
+    with_symbols = '--symbols' in args
+    args = [arg for arg in args if arg != '--symbols']
 
-    filename = sys.argv[1]
+    if len(args) < 1:
+        raise Exception("Usage: python HackAssembler.py filename [--symbols]")
+
+    filename = args[0]
     hack_filename = re.sub('.asm$', '.hack', filename)
 
     try:
@@ -24,6 +31,9 @@ def main():
         code = Code()
         table = SymbolTable()
 
+        # Determines the labels, in the order they are declared.
+        labels = []
+
         # Determines the ROM count (actuall program instructions). Incremented
         # whenever a C-instruction or an A-instruction is encountered.
         instructions_count = 0
@@ -41,6 +51,7 @@ def main():
                 # store the next command in the program
                 symbol = parser.symbol()
                 table.add_entry(symbol, instructions_count)
+                labels.append(symbol)
             else:
                 instructions_count += 1
 
@@ -79,6 +90,15 @@ def main():
 
         print "Done writing (binary) hack file: {0}".format(hack_filename)
         hackfile.close()
+
+        if with_symbols:
+            sym_filename = re.sub('.hack$', '.sym', hack_filename)
+            with open(sym_filename, 'w') as symfile:
+                for symbol in labels:
+                    symfile.write('{0} {1}\n'.format(symbol,
+                        table.symbols[symbol]))
+
+            print "Done writing symbols file: {0}".format(sym_filename)
     except IOError, err:
         print "Encountered an I/O Error:", str(err)
 
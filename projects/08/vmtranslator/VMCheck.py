@@ -0,0 +1,210 @@
+import os
+import re
+import sys
+import glob
+
+from emulator import VMEmulator, STACK
+from intrinsics import natives, HEAP
+from jit import JIT
+
+# The execution tiers of the VM emulator, by the arguments they're
+# created with. Each run creates its own JIT, so every tier starts cold.
+tiers = [
+    ('interpreted', lambda: {}),
+    ('native', lambda: {'natives': natives}),
+    ('jit', lambda: {'jit': JIT(1)})
+]
+
+# The pointers of a VM test script, mapped to their RAM addresses.
+pointers = {
+    'sp': 0,
+    'local': 1,
+    'argument': 2,
+    'this': 3,
+    'that': 4
+}
+
+# The OS arrays that hold scratch data only (Math.divide keeps its partial
+# results in Math.1), which natives don't bother to maintain. Maps the
+# static variable referring to each array to its size.
+scratch = {
+    'Math.1': 16
+}
+
+# Determines the amount of VM commands a program may execute.
+MAX_STEPS = 5000000
+
+
+def parse_test(path):
+    """
+    Parses a VM emulator test script (a *VME.tst file). Returns the tested
+    program path, the (target, value) pairs the script sets, the amount of
+    VM steps it runs and the RAM addresses it outputs.
+    """
+    with open(path) as f:
+        script = re.sub(r'//[^\n]*', '', f.read())
+
+    # The script loads either a single VM file, or the whole directory.
+    dirname = os.path.dirname(path)
+    match = re.search(r'load\s*([^\s,;]*)', script)
+    program = os.path.join(dirname, match.group(1)) if match and \
+        match.group(1) else dirname
+
+    sets = re.findall(r'set\s+(\S+)\s+(-?\d+)', script)
+    steps = re.search(r'repeat\s+(\d+)', script)
+    outputs = re.search(r'output-list([^;]*);', script).group(1)
+
+    return (program, [(target, int(value)) for target, value in sets],
+        int(steps.group(1)) if steps else 1,
+        [int(addr) for addr in re.findall(r'RAM\[(\d+)\]', outputs)])
+
+def parse_cmp(path):
+    """
+    Returns the values of the first row of the given compare file.
+    """
+    with open(path) as f:
+        rows = [line for line in f.read().splitlines() if line.strip()]
+
+    return [int(value) for value in rows[1].strip('|').split('|')]
+
+def set_target(ram, target, value):
+    """
+    Sets a pointer (sp, local, ...), a RAM word (RAM[i]) or a segment
+    entry (argument[i], ...) as a test script does.
+    """
+    match = re.match(r'(\w+)\[(\d+)\]$', target)
+    if match is None:
+        ram[pointers[target]] = value
+    elif match.group(1) == 'RAM':
+        ram[int(match.group(2))] = value
+    else:
+        ram[ram[pointers[match.group(1)]] + int(match.group(2))] = value
+
+def run_test(path, tier):
+    """
+    Runs the given test script on the given tier, and returns the values
+    of its output list. Like the supplied VM emulator, a program that has
+    Sys.init starts right at it, on the stack the script has set up.
+    """
+    program, sets, steps, outputs = parse_test(path)
+    vm = VMEmulator(program, os_dir=None, **tier())
+
+    for target, value in sets:
+        set_target(vm.ram, target, value)
+
+    if vm.bootstrap:
+        vm.pc = vm.entries[vm.function_idx['Sys.init']]
+
+    # Compiled code counts fewer steps than the commands it executes, so it
+    # may run further than the script, into the final loop of the program.
+    vm.run(steps)
+    return [vm.ram[addr] for addr in outputs]
+
+def check_test(path):
+    """
+    Runs the given test script on every tier and compares the outputs with
+    the compare file. Returns whether all the tiers passed.
+    """
+    expected = parse_cmp(re.sub(r'VME\.tst$', '.cmp', path))
+    passed = True
+
+    for name, tier in tiers:
+        values = run_test(path, tier)
+        if values != expected:
+            print "FAIL {} ({}): expected {}, got {}".format(path, name,
+                expected, values)
+            passed = False
+
+    if passed:
+        print "PASS {}".format(path)
+
+    return passed
+
+def check_program(path, max_steps):
+    """
+    Runs the given program (with the OS) on every tier and compares the
+    final machine states with the interpreted one: the pointers, the
+    static variables, the heap and the memory maps. The stack is left
+    out, as compiled code keeps its temporaries in Python variables, and
+    so are the scratch arrays of the OS.
+    Returns whether all the tiers agree.
+    """
+    states = []
+    for name, tier in tiers:
+        vm = VMEmulator(path, **tier())
+        steps = vm.run(max_steps)
+
+        # A program that waits for input (or runs forever) is stopped by
+        # the steps budget, where the tiers may be at different points.
+        if not vm.halted:
+            print "SKIP {}: stopped after {} VM commands ({})".format(path,
+                steps, name)
+            return True
+
+        states.append((name, vm.ram[:]))
+
+    ram = vm.ram
+    ignored = set()
+    for static, size in scratch.items():
+        if static in vm.statics and static.split('.')[0] in vm.os_classes:
+            base = ram[vm.statics[static]]
+            ignored.update(range(base, base + size))
+
+    passed = True
+    reference = states[0][1]
+    addrs = [addr for addr in range(5) + range(16, STACK) +
+        range(HEAP, len(reference)) if addr not in ignored]
+
+    for name, ram in states[1:]:
+        diffs = [addr for addr in addrs if ram[addr] != reference[addr]]
+        if diffs:
+            print "FAIL {} ({}): {} words differ, first at RAM[{}]".format(
+                path, name, len(diffs), diffs[0])
+            passed = False
+
+    if passed:
+        print "PASS {}".format(path)
+
+    return passed
+
+def main():
+    """
+    Checks that the tiers of the VM emulator (interpreted, with natives
+    and with a JIT that compiles every called function) agree. A directory
+    that holds VM emulator test scripts is checked against their compare
+    files, and any other VM program is run to its end on every tier.
+    """
+    args = sys.argv[1:]
+    max_steps = MAX_STEPS
+
+    if '--steps' in args:
+        idx = args.index('--steps')
+        max_steps = int(args[idx + 1])
+        args = args[:idx] + args[idx + 2:]
+
+    if len(args) == 0:
+        raise Exception("Usage: python VMCheck.py dirname/filename " +
+            "[dirname/filename ...] [--steps N]")
+
+    failed = 0
+    try:
+        for path in args:
+            tests = sorted(glob.glob(os.path.join(path, '*VME.tst')))
+            if tests:
+                failed += len([t for t in tests if not check_test(t)])
+            elif not check_program(path, max_steps):
+                failed += 1
+
+    except IOError, err:
+        print "Encountered an I/O Error:", str(err)
+        failed += 1
+    except ValueError, err:
+        print "Encountered a Value Error:", str(err)
+        failed += 1
+
+    print "{} failed".format(failed)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
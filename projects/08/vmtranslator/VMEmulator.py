@@ -0,0 +1,98 @@
+import os
+import sys
+import time
+
+from emulator import VMEmulator
+from intrinsics import natives
+from jit import JIT
+from profiler import VMProfiler
+
+def main():
+    """
+    Runs a VM program (a single VM file, or a directory of VM files)
+    headlessly, and reports where the machine stopped.
+    """
+    args = sys.argv[1:]
+    max_steps = None
+
+    # The --native flag executes the OS functions that have a native
+    # implementation natively, instead of interpreting their VM code.
+    with_natives = '--native' in args
+    args = [arg for arg in args if arg != '--native']
+
+    # The --jit flag compiles functions into Python functions, once they
+    # are called the given amount of times.
+    jit = None
+    if '--jit' in args:
+        idx = args.index('--jit')
+        jit = JIT(int(args[idx + 1]))
+        args = args[:idx] + args[idx + 2:]
+
+    # The --profile flag prints the flat profile of the program, and the
+    # --collapsed flag writes its call tree to the given file.
+    profile = '--profile' in args
+    args = [arg for arg in args if arg != '--profile']
+
+    collapsed = None
+    if '--collapsed' in args:
+        idx = args.index('--collapsed')
+        collapsed = args[idx + 1]
+        args = args[:idx] + args[idx + 2:]
+
+    # The --steps flag limits the amount of executed VM commands.
+    if '--steps' in args:
+        idx = args.index('--steps')
+        max_steps = int(args[idx + 1])
+        args = args[:idx] + args[idx + 2:]
+
+    if len(args) == 0:
+        path = os.getcwd()
+    elif len(args) == 1:
+        path = args[0]
+    else:
+        raise Exception("Usage: python VMEmulator.py filename/dirname " +
+            "[--steps N] [--native] [--jit N] [--profile] " +
+            "[--collapsed filename] (empty path for current dir)")
+
+    profiling = profile or collapsed is not None
+    if profiling and jit is not None:
+        raise Exception("Compiled functions can't be profiled, " +
+            "use either --jit or --profile/--collapsed")
+
+    try:
+        vm = VMEmulator(path, natives=natives if with_natives else None,
+            jit=jit)
+
+        profiler = VMProfiler(vm) if profiling else None
+
+        start = time.time()
+        steps = (profiler or vm).run(max_steps)
+        elapsed = time.time() - start
+
+        state = 'Halted' if vm.halted else 'Stopped'
+        print "{} after {} VM commands ({:.3f} seconds)".format(state, steps,
+            elapsed)
+        print "SP: {}, LCL: {}, ARG: {}, THIS: {}, THAT: {}".format(
+            *vm.ram[0:5])
+
+        if jit is not None:
+            print "Compiled {} functions".format(len(jit.compiled))
+            for name, reason in sorted(jit.failed.items()):
+                print "Not compiled {}: {}".format(name, reason)
+
+        if profile:
+            print "Maximal call depth: {}".format(profiler.max_depth)
+            profiler.write_flat(sys.stdout)
+
+        if collapsed is not None:
+            with open(collapsed, 'w') as f:
+                profiler.write_collapsed(f)
+
+    except IOError, err:
+        print "Encountered an I/O Error:", str(err)
+    except ValueError, err:
+        print "Encountered a Value Error:", str(err)
+
+
+if __name__ == '__main__':
+    main()
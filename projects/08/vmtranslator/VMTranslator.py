@@ -5,20 +5,27 @@ import glob
 
 from parser import Parser
 from writer import CodeWriter
+from cost import CostReport, TOPLEVEL, TERMINATE
 
 def main():
     path = None
     files = None
 
+    # The --report flag asks for a static cost report of the translated
+    # program, written next to the generated assembly file.
+    args = sys.argv[1:]
+    with_report = '--report' in args
+    args = [arg for arg in args if arg != '--report']
+
     # If no path is specified, the VM translator operates on the
     # current directory by default.
-    if len(sys.argv) == 1:
+    if len(args) == 0:
         path = os.getcwd()
-    elif len(sys.argv) == 2:
-        path = sys.argv[1]
+    elif len(args) == 1:
+        path = args[0]
     else:
         raise Exception("Usage: python VMTranslator.py filename/dirname " +
-            "(empty path for current dir)")
+            "[--report] (empty path for current dir)")
 
     # Given path is either a single VM file, or a directory of VM files.
     is_single_file = re.search('.vm$', path)
@@ -38,23 +45,42 @@ def main():
         # We're given a single VM file.
         files = [path]
 
+    report = CostReport(path) if with_report else None
+
     try:
-        writer = CodeWriter(path)
+        writer = CodeWriter(path, report)
 
         # Only inject bootstrap code when dealing with directories.
         if not is_single_file:
             writer.write_init()
 
+        if report:
+            report.begin(TOPLEVEL, None)
+
         for file in files:
             writer.sef_file_name(file)
             translate(writer, file)
 
         # It is always recommended to end each machine language
         # program with an infinite loop
+        if report:
+            report.begin(TERMINATE, 'terminate')
+
         writer.terminate()
         writer.close_file()
         print "Done writing assembly code to", re.sub('(.vm)|()$', '.asm', path)
 
+        if report:
+            name = re.sub('.vm$', '', path)
+            report.write(name)
+            print "Done writing cost report to", name + '.cost.txt'
+
+            # Fail loudly, e.g. in CI, when the program can't fit in ROM.
+            if report.overflows():
+                print "Program exceeds the ROM size: {} instructions".format(
+                    report.total_instructions())
+                sys.exit(1)
+
     except IOError, err:
         print "Encountered an I/O Error:", str(err)
     except ValueError, err:
@@ -74,6 +100,10 @@ def translate(writer, filename):
         # Write the current vm command as a comment before any assembly code.
         writer.write_lines('// ' + parser.current_command)
 
+        if writer.report:
+            name = parser.arg1() if command_type == 'C_FUNCTION' else None
+            writer.report.begin(name, command_class(parser))
+
         arg1 = parser.arg1()
         arg2 = parser.arg2()
 
@@ -108,5 +138,18 @@ def translate(writer, filename):
     parser.close() # We're done reading from file.
 
 
+def command_class(parser):
+    """
+    Returns the class of the current VM command, as used by the cost report.
+    For example, 'push local', 'add' or 'call'.
+    """
+    args = parser.current_command.split(' ')
+
+    if parser.command_type() in ['C_PUSH', 'C_POP']:
+        return '{} {}'.format(args[0], args[1])
+
+    return args[0]
+
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,215 @@
+import json
+
+# The Hack ROM is addressed by 15 bits, so a program may hold at most
+# 32K instructions.
+ROM_SIZE = 32768
+
+# Comparison commands branch to one of two short sequences. Only one of
+# them is executed, so the instructions of the skipped branch (3 for the
+# shorter, "true" branch) are not part of the estimated cycle count.
+skipped_instructions = {
+    'eq': 3,
+    'gt': 3,
+    'lt': 3
+}
+
+# Code emitted outside of any VM function.
+BOOTSTRAP = '(bootstrap)'
+TOPLEVEL = '(toplevel)'
+TERMINATE = '(terminate)'
+
+
+class CostReport:
+    """
+    Static cost model of a translated VM program. Collects, per VM function,
+    the amount of emitted Hack instructions, the static call sites and the
+    estimated cycles it takes to execute each VM command class once.
+    """
+    def __init__(self, program):
+        self.program = program
+
+        # Maps a function name to its collected statistics.
+        self.functions = {}
+
+        # Determines the function and command class currently translated.
+        self.current_function = BOOTSTRAP
+        self.current_class = 'bootstrap'
+
+        # Determines the instructions emitted so far for the current command,
+        # and whether that command wasn't accounted yet.
+        self.current_instructions = 0
+        self.pending = False
+
+    def begin(self, name, command_class):
+        """
+        Informs that the code of a new VM command is about to be written.
+        The command is accounted to the given function, or to the current
+        one if no name is given.
+        """
+        self._end_command()
+
+        if name is not None:
+            self.current_function = name
+
+        self.current_class = command_class
+        self.pending = True
+
+    def record_call(self, callee):
+        """
+        Records a static call site of the given callee in the current function.
+        """
+        callees = self._function()['callees']
+        callees[callee] = callees.get(callee, 0) + 1
+
+    def record_lines(self, lines):
+        """
+        Counts the Hack instructions within the given lines of assembly code.
+        Comments and label declarations don't take any ROM space.
+        """
+        for line in '\n'.join(lines).split('\n'):
+            line = line.strip()
+            if line and not line.startswith('//') and not line.startswith('('):
+                self.current_instructions += 1
+
+    def _end_command(self):
+        """
+        Helper method to account the instructions of the last command.
+        Commands that emit no instructions (labels, or functions without
+        local variables) are counted as well.
+        """
+        count = self.current_instructions
+        if not count and not self.pending:
+            return
+
+        stats = self._function()
+        command = stats['commands'].setdefault(self.current_class, {
+            'count': 0,
+            'instructions': 0,
+            'cycles': 0
+        })
+
+        cycles = count - skipped_instructions.get(self.current_class, 0)
+
+        command['count'] += 1
+        command['instructions'] += count
+        command['cycles'] += cycles
+        stats['instructions'] += count
+
+        self.current_instructions = 0
+        self.pending = False
+
+    def _function(self):
+        """
+        Helper method to get (or create) the statistics of the current function.
+        """
+        name = self.current_function
+        if name not in self.functions:
+            self.functions[name] = {
+                'name': name,
+                'instructions': 0,
+                'callees': {},
+                'commands': {}
+            }
+
+        return self.functions[name]
+
+    def total_instructions(self):
+        """
+        Returns the amount of instructions in the whole program.
+        """
+        self._end_command()
+        return sum(f['instructions'] for f in self.functions.values())
+
+    def overflows(self):
+        """
+        Does the translated program exceed the Hack ROM?
+        """
+        return self.total_instructions() > ROM_SIZE
+
+    def as_dict(self):
+        """
+        Returns the report as a dictionary, functions sorted by their size.
+        """
+        total = self.total_instructions()
+
+        functions = []
+        for stats in self.sorted_functions():
+            functions.append({
+                'name': stats['name'],
+                'instructions': stats['instructions'],
+                'calls': sum(stats['callees'].values()),
+                'callees': stats['callees'],
+                'commands': stats['commands']
+            })
+
+        return {
+            'program': self.program,
+            'rom_size': ROM_SIZE,
+            'total_instructions': total,
+            'functions': functions
+        }
+
+    def sorted_functions(self):
+        """
+        Returns the functions statistics, the largest function first.
+        """
+        self._end_command()
+        return sorted(self.functions.values(),
+            key=lambda f: (-f['instructions'], f['name']))
+
+    def as_table(self):
+        """
+        Returns the report as a human readable text table.
+        """
+        total = self.total_instructions()
+        width = max([len(f) for f in self.functions] + [len('Function')])
+
+        row = '{:<%d} {:>8} {:>7} {:>6} {:>10}' % width
+        lines = [
+            row.format('Function', 'Instr', '%ROM', 'Calls', 'Cycles'),
+            '-' * (width + 35)
+        ]
+
+        for stats in self.sorted_functions():
+            # The cycles of a single pass over every command of the function.
+            cycles = sum(c['cycles'] for c in stats['commands'].values())
+            share = 100.0 * stats['instructions'] / ROM_SIZE
+
+            lines.append(row.format(stats['name'], stats['instructions'],
+                '{:.2f}'.format(share), sum(stats['callees'].values()), cycles))
+
+        lines += [
+            '-' * (width + 35),
+            'Total: {} instructions ({:.2f}% of ROM)'.format(total,
+                100.0 * total / ROM_SIZE),
+            '',
+            'Estimated cycles per VM command class:'
+        ]
+
+        # Aggregate the command classes across all functions.
+        classes = {}
+        for stats in self.functions.values():
+            for name, command in stats['commands'].items():
+                entry = classes.setdefault(name, [0, 0, 0])
+                entry[0] += command['count']
+                entry[1] += command['instructions']
+                entry[2] += command['cycles']
+
+        row = '{:<20} {:>8} {:>8} {:>12}'
+        lines.append(row.format('Command', 'Count', 'Instr', 'Cycles/cmd'))
+        for name, entry in sorted(classes.items(), key=lambda c: -c[1][1]):
+            per_command = float(entry[2]) / entry[0]
+            lines.append(row.format(name, entry[0], entry[1],
+                '{:.1f}'.format(per_command)))
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """
+        Writes the report into path.cost.json and path.cost.txt.
+        """
+        with open(path + '.cost.json', 'w') as f:
+            json.dump(self.as_dict(), f, indent=2, sort_keys=True)
+
+        with open(path + '.cost.txt', 'w') as f:
+            f.write(self.as_table())
@@ -0,0 +1,847 @@
+import os
+import glob
+from array import array
+from collections import deque
+from itertools import islice
+
+from parser import Parser
+
+# Defines the opcodes of the predecoded VM program. Every instruction is
+# stored in the code array as its opcode, followed by its (resolved)
+# operands: a segment index, a code offset or a function index.
+(PUSH_CONSTANT, PUSH_LOCAL, PUSH_ARGUMENT, PUSH_THIS, PUSH_THAT, PUSH_ADDR,
+ POP_LOCAL, POP_ARGUMENT, POP_THIS, POP_THAT, POP_ADDR,
+ ADD, SUB, NEG, EQ, GT, LT, AND, OR, NOT,
+ GOTO, IF_GOTO, FUNCTION, RETURN, HALT,
+ CALL, NATIVE, PROFILE_CALL, COMPILED) = range(29)
+
+# The call commands to a function are patched according to the way it is
+# currently executed: interpreted, natively, interpreted while counting its
+# calls (until it's compiled), or compiled. The call opcodes come last, so
+# the dispatch loop identifies all of them by a single comparison.
+
+# The amount of code words taken by each kind of VM command.
+widths = {
+    'C_PUSH': 2,
+    'C_POP': 2,
+    'C_ARITHMETIC': 1,
+    'C_LABEL': 0,
+    'C_GOTO': 2,
+    'C_IF': 2,
+    'C_FUNCTION': 2,
+    'C_CALL': 3,
+    'C_RETURN': 1
+}
+
+arithmetic_ops = {
+    'add': ADD,
+    'sub': SUB,
+    'neg': NEG,
+    'eq': EQ,
+    'gt': GT,
+    'lt': LT,
+    'and': AND,
+    'or': OR,
+    'not': NOT
+}
+
+# Segments whose base address is held in a pointer register.
+push_ops = {
+    'local': PUSH_LOCAL,
+    'argument': PUSH_ARGUMENT,
+    'this': PUSH_THIS,
+    'that': PUSH_THAT
+}
+
+pop_ops = {
+    'local': POP_LOCAL,
+    'argument': POP_ARGUMENT,
+    'this': POP_THIS,
+    'that': POP_THAT
+}
+
+# Segments that are mapped directly on a fixed RAM area.
+fixed_segments = {
+    'pointer': 3,
+    'temp': 5
+}
+
+# The Hack memory map.
+RAM_SIZE = 32768
+STACK = 256
+SCREEN = 16384
+KBD = 24576
+
+# Compiled functions call each other by Python calls. Beyond this stack
+# depth, calls are interpreted, so deep recursion can't exhaust the Python
+# stack (every VM frame takes at least 5 words of the VM stack).
+DEEP = STACK + 1024
+
+# Determines the standard library (OS) that is loaded for classes
+# not supplied by the program itself.
+OS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..', '..', '..', 'tools', 'OS')
+
+
+class Deoptimize(Exception):
+    """
+    Raised by compiled code in order to continue its execution in the
+    interpreter: when the steps budget runs out, when the machine halts, or
+    when the code does something only the interpreter can do. The frames of
+    the compiled functions on the way are collected (innermost first), each
+    as a (pc, nargs, args, locals, stack, this, that) tuple, where pc is the
+    code offset to continue from, and nargs is the amount of arguments of
+    the call it waits for. registers are the (pc, SP, LCL, ARG) of a nested
+    interpreter, if one was running the innermost frame.
+    """
+    def __init__(self, frame=None, registers=None, halted=False):
+        Exception.__init__(self)
+        self.frames = [frame] if frame is not None else []
+        self.registers = registers
+        self.halted = halted
+
+
+class MemoryMap(object):
+    """
+    A live view of a RAM area (like the screen), indexed from its base
+    address. Reads and writes go directly to the underlying RAM array.
+    """
+    def __init__(self, ram, base, size):
+        self.ram = ram
+        self.base = base
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def address(self, idx):
+        """Returns the RAM address of the given index."""
+        if idx < 0:
+            idx += self.size
+        if not 0 <= idx < self.size:
+            raise IndexError('Memory map index out of range')
+        return self.base + idx
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            start, stop, step = idx.indices(self.size)
+            return self.ram[self.base + start:self.base + stop:step]
+        return self.ram[self.address(idx)]
+
+    def __setitem__(self, idx, value):
+        if isinstance(idx, slice):
+            start, stop, step = idx.indices(self.size)
+            self.ram[self.base + start:self.base + stop:step] = value
+        else:
+            self.ram[self.address(idx)] = value
+
+    def __iter__(self):
+        return iter(self[:])
+
+
+class VMEmulator(object):
+    """
+    Executes VM programs without translating them to Hack code. All the
+    .vm files of a program are parsed once and predecoded into a compact
+    array of opcodes, in which labels and functions are resolved to code
+    offsets. The machine memory (RAM, screen and keyboard) follows the
+    standard VM mapping on the Hack platform.
+
+    Functions may be given a native (Python) implementation, see
+    intrinsics.py, which is then called instead of interpreting their code.
+    Given a JIT (see jit.py), frequently called functions are compiled into
+    Python functions. Compiled code counts a step per call and per loop
+    iteration (rather than per command), and continues in the interpreter
+    once the steps budget runs out, so the machine stops with the same
+    frames and pointers as an interpreted run.
+    """
+    def __init__(self, path, os_dir=OS_DIR, natives=None, jit=None):
+        self.ram = array('h', [0]) * RAM_SIZE
+        self.code = array('i')
+
+        # Determines the functions of the program. A call command refers to
+        # its callee by index, which is resolved to a code offset in entries.
+        self.function_names = []
+        self.function_idx = {}
+        self.entries = array('i')
+
+        # Determines the native implementation of each function (by index),
+        # and the code offsets of the call commands to each function.
+        self.natives = []
+        self.call_sites = {}
+
+        # Determines the functions currently executed natively.
+        self.native_functions = set()
+
+        # Maps each function to its (class name, locals count, commands),
+        # as parsed from its VM code. Commands are (type, arg1, arg2, code
+        # offset) tuples.
+        self.bodies = {}
+
+        # Determines, per function index, the amount of calls so far and the
+        # compiled function (None if not compiled yet, False if it can't be
+        # compiled). Compiled code calls other functions through fns.
+        self.jit = jit
+        self.call_counts = array('i')
+        self.compiled = []
+        self.fns = []
+
+        # Determines the steps compiled code may execute, before continuing
+        # in the interpreter.
+        self.fuel = [0]
+
+        # Maps each static variable (file.index) to its RAM address.
+        self.statics = {}
+
+        # Determines the classes loaded from the OS directory.
+        self.os_classes = set()
+
+        # Determines whether the program is started by the bootstrap code,
+        # i.e, calling Sys.init, like a translated directory of VM files.
+        self.bootstrap = False
+
+        self.pc = 0
+        self.steps = 0
+        self.halted = False
+
+        self.load(self.program_files(path, os_dir))
+        self.reset()
+
+        # Natives replace the OS functions only, not the program's own
+        # implementation of an OS class (like the ones of project 12). A
+        # native may rely on other OS classes as well, listed by fn.uses.
+        for name, fn in (natives or {}).items():
+            classes = [name.split('.')[0]] + getattr(fn, 'uses', [])
+            if name in self.function_idx and \
+                all(c in self.os_classes for c in classes):
+                self.natives[self.function_idx[name]] = fn
+                self.use_native(name)
+
+        # Count the calls of every function, to find the ones worth compiling.
+        if jit is not None:
+            for idx in range(len(self.function_names)):
+                self.patch(idx)
+
+    def program_files(self, path, os_dir):
+        """
+        Returns the VM files of the given program. A directory is completed
+        with the OS classes it doesn't implement by itself.
+        """
+        if not os.path.isdir(path):
+            if not path.endswith('.vm'):
+                raise ValueError('Given path is not a directory or valid vm file.')
+            return [path]
+
+        files = sorted(glob.glob(os.path.join(path, '*.vm')))
+        classes = set(self.classname(f) for f in files)
+
+        if os_dir and os.path.isdir(os_dir):
+            for filename in sorted(glob.glob(os.path.join(os_dir, '*.vm'))):
+                if self.classname(filename) not in classes:
+                    files.append(filename)
+                    self.os_classes.add(self.classname(filename))
+
+        return files
+
+    def classname(self, filename):
+        """Returns the class name (file name without extension) of a VM file."""
+        return os.path.basename(filename).replace('.vm', '')
+
+    def function_index(self, name):
+        """
+        Returns the index of the given function, registering it if needed.
+        """
+        if name not in self.function_idx:
+            self.function_idx[name] = len(self.function_names)
+            self.function_names.append(name)
+            self.entries.append(-1)
+            self.natives.append(None)
+            self.call_counts.append(0)
+            self.compiled.append(None)
+            self.fns.append(self.trampoline(self.function_idx[name]))
+
+        return self.function_idx[name]
+
+    def load(self, files):
+        """
+        Parses the given VM files and predecodes them into the code array.
+        """
+        commands = []
+        for filename in files:
+            parser = Parser(filename)
+            classname = self.classname(filename)
+
+            while parser.has_more_lines():
+                parser.advance()
+                commands.append((classname, parser.command_type(),
+                    parser.arg1(), parser.arg2()))
+
+            parser.close()
+
+        self.bootstrap = any(c[1] == 'C_FUNCTION' and c[2] == 'Sys.init'
+            for c in commands)
+
+        # The bootstrap code calls Sys.init, the program ends when it returns.
+        offset = 4 if self.bootstrap else 0
+
+        # First pass - resolve labels (scoped by their function) and
+        # function entry points to code offsets.
+        labels = {}
+        function = None
+        for classname, t, arg1, arg2 in commands:
+            if t == 'C_FUNCTION':
+                function = arg1
+                self.entries[self.function_index(arg1)] = offset
+                self.bodies[arg1] = (classname, arg2, [])
+            elif t == 'C_LABEL':
+                labels[(function, arg1)] = offset
+
+            if function is not None and t != 'C_FUNCTION':
+                self.bodies[function][2].append((t, arg1, arg2, offset))
+
+            offset += widths[t]
+
+        if offset >= 65536:
+            raise ValueError('Program is too large to be loaded.')
+
+        # Second pass - emit the opcodes.
+        code = self.code
+        if self.bootstrap:
+            code.extend([CALL, self.function_index('Sys.init'), 0, HALT])
+
+        function = None
+        for classname, t, arg1, arg2 in commands:
+            if t == 'C_PUSH' or t == 'C_POP':
+                code.extend(self.decode_push_pop(classname, t, arg1, arg2))
+            elif t == 'C_ARITHMETIC':
+                code.append(arithmetic_ops[arg1])
+            elif t == 'C_GOTO' or t == 'C_IF':
+                if (function, arg1) not in labels:
+                    raise ValueError('Unknown label {} in {}'.format(arg1, function))
+                code.extend([GOTO if t == 'C_GOTO' else IF_GOTO,
+                    labels[(function, arg1)]])
+            elif t == 'C_FUNCTION':
+                function = arg1
+                code.extend([FUNCTION, arg2])
+            elif t == 'C_CALL':
+                idx = self.function_index(arg1)
+                self.call_sites.setdefault(idx, []).append(len(code))
+                code.extend([CALL, idx, arg2])
+            elif t == 'C_RETURN':
+                code.append(RETURN)
+
+        # Running off the end of the code (e.g, a single VM file that is not
+        # ended by an infinite loop) halts the machine.
+        self.halt_addr = len(code)
+        code.append(HALT)
+
+        # Sys.halt is the OS way of ending the program; there's no reason
+        # to spin in its infinite loop.
+        if 'Sys.halt' in self.function_idx:
+            self.entries[self.function_idx['Sys.halt']] = len(code)
+            self.compiled[self.function_idx['Sys.halt']] = False
+            code.append(HALT)
+
+    def decode_push_pop(self, classname, t, segment, idx):
+        """
+        Returns the code words of a push or pop command.
+        """
+        ops = push_ops if t == 'C_PUSH' else pop_ops
+        if segment in ops:
+            return [ops[segment], idx]
+
+        if segment == 'constant':
+            if t == 'C_POP' or not 0 <= idx <= 32767:
+                raise ValueError('Invalid constant command {}'.format(idx))
+            return [PUSH_CONSTANT, idx]
+
+        if segment in fixed_segments:
+            addr = fixed_segments[segment] + idx
+        elif segment == 'static':
+            # Static variables are allocated from RAM[16] onward, in the
+            # order of their first appearance, as done by the assembler.
+            name = '{}.{}'.format(classname, idx)
+            if name not in self.statics:
+                self.statics[name] = 16 + len(self.statics)
+            addr = self.statics[name]
+        else:
+            raise ValueError('{} is an invalid segment'.format(segment))
+
+        return [PUSH_ADDR if t == 'C_PUSH' else POP_ADDR, addr]
+
+    def use_native(self, name, enabled=True):
+        """
+        Determines whether calls to the given function execute its native
+        implementation or interpret its VM code.
+        """
+        idx = self.function_idx.get(name)
+        if idx is None or self.natives[idx] is None:
+            raise ValueError('{} has no native implementation.'.format(name))
+
+        if enabled:
+            self.native_functions.add(name)
+        else:
+            self.native_functions.discard(name)
+
+        self.patch(idx)
+
+    def set_compiled(self, idx, fn):
+        """
+        Installs the compiled code of the given function, or marks it as
+        not compilable if fn is False.
+        """
+        self.compiled[idx] = fn
+        self.fns[idx] = self.trampoline(idx)
+        self.patch(idx)
+
+    def patch(self, idx):
+        """
+        Patches the call commands to the given function by the way it is
+        currently executed, so there's no overhead for interpreted calls.
+        """
+        if self.function_names[idx] in self.native_functions:
+            op = NATIVE
+        elif self.compiled[idx]:
+            op = COMPILED
+        elif self.jit is not None and self.compiled[idx] is None:
+            op = PROFILE_CALL
+        else:
+            op = CALL
+
+        for offset in self.call_sites.get(idx, []):
+            self.code[offset] = op
+
+    def trampoline(self, idx):
+        """
+        Returns a callable, fn(sp, *args), that calls the given function
+        from compiled code. sp is the stack address above the arguments.
+        """
+        if self.compiled[idx]:
+            return self.compiled[idx]
+
+        def call(sp, *args):
+            return self.reenter(idx, sp - len(args), args)
+
+        return call
+
+    def call(self, name, args, max_steps=None):
+        """
+        Calls the given function with the given arguments, on top of the
+        current stack, and runs until it returns. Returns its return value.
+        """
+        ram = self.ram
+        idx = self.function_idx.get(name)
+        if idx is None or self.entries[idx] < 0:
+            raise ValueError('Unknown function {}'.format(name))
+
+        if ram[0] < STACK:
+            ram[0] = STACK
+
+        # A native function is called directly, unless it doesn't handle
+        # the given arguments.
+        if name in self.native_functions:
+            result = self.natives[idx](self, array('h', args))
+            if result is not None:
+                return result
+
+        self.push_frame(idx, ram[0], args)
+
+        pc, halted = self.pc, self.halted
+        self.pc = self.entries[idx]
+        self.halted = False
+
+        self.run(max_steps)
+        returned = self.halted and self.pc == self.halt_addr
+        self.pc, self.halted = pc, halted
+
+        if not returned:
+            raise ValueError('{} did not return'.format(name))
+
+        # Pop the return value.
+        ram[0] -= 1
+        return ram[ram[0]]
+
+    def reenter(self, idx, sp, args):
+        """
+        Calls the function of the given index from compiled code, pushing
+        the arguments from the given stack address. Returns its return value.
+        An interpreted function runs within the remaining steps budget, and
+        raises Deoptimize if it doesn't return (or the machine halts).
+        """
+        ram = self.ram
+
+        if self.function_names[idx] in self.native_functions:
+            result = self.natives[idx](self, args)
+            if result is not None:
+                return result
+
+        if self.jit is not None and self.compiled[idx] is None:
+            self.call_counts[idx] += 1
+            if self.call_counts[idx] >= self.jit.threshold:
+                self.jit.promote(self, idx)
+
+        if self.compiled[idx]:
+            return self.compiled[idx](sp + len(args), *args)
+
+        if self.entries[idx] < 0:
+            raise ValueError('Unknown function {}'.format(
+                self.function_names[idx]))
+
+        self.push_frame(idx, sp, args)
+
+        # The nested run is accounted by the fuel, not as steps of its own.
+        pc, halted, steps, fuel = self.pc, self.halted, self.steps, self.fuel[0]
+        self.pc = self.entries[idx]
+        self.halted = False
+
+        used = self.run(fuel)
+        registers = (self.pc, ram[0], ram[1], ram[2])
+        returned = self.halted and self.pc == self.halt_addr
+        stopped = self.halted and not returned
+
+        self.pc, self.halted, self.steps = pc, halted, steps
+        self.fuel[0] = fuel - used
+
+        if not returned:
+            raise Deoptimize(registers=registers, halted=stopped)
+
+        # Pop the return value.
+        ram[0] -= 1
+        return ram[ram[0]]
+
+    def push_frame(self, idx, sp, args):
+        """
+        Pushes the given arguments from the given stack address, followed by
+        a frame that returns to the HALT command at the end of the code, and
+        sets the pointers for running the function of the given index.
+        """
+        ram = self.ram
+        for value in args:
+            ram[sp] = value
+            sp += 1
+
+        ret = self.halt_addr
+        ram[sp] = ret - 65536 if ret > 32767 else ret
+        ram[sp + 1:sp + 5] = ram[1:5]
+        sp += 5
+
+        ram[0] = sp
+        ram[1] = sp
+        ram[2] = sp - 5 - len(args)
+
+    def resume(self, state, ret, sp, nargs, lcl, arg):
+        """
+        Rebuilds, on the RAM stack, the frames of the compiled functions
+        described by the given Deoptimize. The outermost one was called with
+        nargs arguments below sp, by a caller whose frame pointers are lcl
+        and arg, and returns to ret. Returns the (pc, SP, LCL, ARG) to
+        continue from in the interpreter.
+        """
+        ram = self.ram
+        base = sp - nargs
+
+        for pc, pending, args, local, stack, this, that in \
+            reversed(state.frames):
+            args = (list(args) + [0] * nargs)[:nargs]
+            top = base + nargs
+
+            values = args + [word(ret), lcl, arg, this, that] + local + stack
+            for i, value in enumerate(values):
+                ram[base + i] = value
+
+            lcl = top + 5
+            arg = base
+            base = lcl + len(local) + len(stack)
+            ret = pc
+            nargs = pending
+
+        if state.registers is None:
+            return ret, base, lcl, arg
+
+        # The innermost frame was pushed by a nested interpreter, which
+        # returns to the innermost compiled function.
+        top = base + nargs
+        ram[top] = word(ret)
+        ram[top + 1] = lcl
+        ram[top + 2] = arg
+        return state.registers
+
+    def reset(self):
+        """
+        Clears the memory and restarts the program.
+        """
+        self.ram[:] = array('h', [0]) * RAM_SIZE
+        self.pc = 0
+        self.steps = 0
+        self.halted = False
+
+        if self.bootstrap:
+            self.ram[0] = STACK
+
+    @property
+    def screen(self):
+        """
+        Returns the screen memory map, as a live view of the RAM.
+        """
+        return MemoryMap(self.ram, SCREEN, KBD - SCREEN)
+
+    @property
+    def keyboard(self):
+        """Returns the key currently pressed, as mapped to memory."""
+        return self.ram[KBD]
+
+    @keyboard.setter
+    def keyboard(self, key):
+        self.ram[KBD] = key
+
+    def run(self, max_steps=None):
+        """
+        Executes VM commands until the machine halts or the given amount
+        of commands was executed. Returns the amount of executed commands,
+        where a call to a compiled function counts as a single step, plus
+        a step per iteration of its loops (and the steps of the interpreted
+        functions it calls).
+        """
+        if self.halted:
+            return 0
+
+        code = self.code
+        ram = self.ram
+        entries = self.entries
+        natives = self.natives
+        compiled = self.compiled
+        call_counts = self.call_counts
+        threshold = self.jit.threshold if self.jit is not None else 0
+        fuel = self.fuel
+
+        pc = self.pc
+        sp = ram[0]
+        lcl = ram[1]
+        arg = ram[2]
+
+        budget = max_steps if max_steps is not None else 2 ** 62
+        step = 0
+
+        # The steps taken by compiled code are skipped on the counter.
+        counter = iter(xrange(budget))
+
+        # The main dispatch loop. Opcodes are ordered by how frequently they
+        # appear in compiled Jack programs.
+        for step in counter:
+            op = code[pc]
+
+            if op == PUSH_CONSTANT:
+                ram[sp] = code[pc + 1]
+                sp += 1
+                pc += 2
+            elif op == PUSH_LOCAL:
+                ram[sp] = ram[lcl + code[pc + 1]]
+                sp += 1
+                pc += 2
+            elif op == PUSH_ARGUMENT:
+                ram[sp] = ram[arg + code[pc + 1]]
+                sp += 1
+                pc += 2
+            elif op == POP_LOCAL:
+                sp -= 1
+                ram[lcl + code[pc + 1]] = ram[sp]
+                pc += 2
+            elif op == ADD:
+                sp -= 1
+                value = ram[sp - 1] + ram[sp]
+                if value > 32767:
+                    value -= 65536
+                elif value < -32768:
+                    value += 65536
+                ram[sp - 1] = value
+                pc += 1
+            elif op == IF_GOTO:
+                sp -= 1
+                if ram[sp]:
+                    pc = code[pc + 1]
+                else:
+                    pc += 2
+            elif op == NOT:
+                ram[sp - 1] = ~ram[sp - 1]
+                pc += 1
+            elif op == PUSH_ADDR:
+                ram[sp] = ram[code[pc + 1]]
+                sp += 1
+                pc += 2
+            elif op == POP_ADDR:
+                sp -= 1
+                ram[code[pc + 1]] = ram[sp]
+                pc += 2
+            elif op == POP_ARGUMENT:
+                sp -= 1
+                ram[arg + code[pc + 1]] = ram[sp]
+                pc += 2
+            elif op == PUSH_THAT or op == PUSH_THIS:
+                addr = ram[4 if op == PUSH_THAT else 3] + code[pc + 1]
+                if addr < 3:
+                    # Reads one of the pointers cached below.
+                    ram[0], ram[1], ram[2] = sp, lcl, arg
+                ram[sp] = ram[addr]
+                sp += 1
+                pc += 2
+            elif op == POP_THAT or op == POP_THIS:
+                sp -= 1
+                addr = ram[4 if op == POP_THAT else 3] + code[pc + 1]
+                if addr < 3:
+                    # Overwrites one of the pointers cached below (usually a
+                    # bug of the program, but the machine allows it).
+                    ram[0], ram[1], ram[2] = sp, lcl, arg
+                    ram[addr] = ram[sp]
+                    sp, lcl, arg = ram[0], ram[1], ram[2]
+                else:
+                    ram[addr] = ram[sp]
+                pc += 2
+            elif op == GOTO:
+                target = code[pc + 1]
+                if target == pc:
+                    # A jump to itself is an infinite loop that ends the program.
+                    self.halted = True
+                    break
+                pc = target
+            elif op == SUB:
+                sp -= 1
+                value = ram[sp - 1] - ram[sp]
+                if value > 32767:
+                    value -= 65536
+                elif value < -32768:
+                    value += 65536
+                ram[sp - 1] = value
+                pc += 1
+            elif op == LT:
+                sp -= 1
+                ram[sp - 1] = -1 if ram[sp - 1] < ram[sp] else 0
+                pc += 1
+            elif op == GT:
+                sp -= 1
+                ram[sp - 1] = -1 if ram[sp - 1] > ram[sp] else 0
+                pc += 1
+            elif op == EQ:
+                sp -= 1
+                ram[sp - 1] = -1 if ram[sp - 1] == ram[sp] else 0
+                pc += 1
+            elif op >= CALL:
+                idx = code[pc + 1]
+                nargs = code[pc + 2]
+
+                if op == NATIVE:
+                    # Natives may access the pointers (Memory.peek/poke).
+                    ram[0], ram[1], ram[2] = sp, lcl, arg
+                    result = natives[idx](self, ram[sp - nargs:sp])
+                    sp, lcl, arg = ram[0], ram[1], ram[2]
+
+                    # The native pops the arguments and pushes the result,
+                    # unless it leaves the call to the VM code.
+                    if result is not None:
+                        sp -= nargs
+                        ram[sp] = result
+                        sp += 1
+                        pc += 3
+                        continue
+                elif op == COMPILED and STACK <= sp <= DEEP:
+                    # Compiled code keeps its frames in Python variables,
+                    # they are pushed on the RAM stack only if the execution
+                    # continues in the interpreter.
+                    fuel[0] = budget - step - 1
+                    ram[0], ram[1], ram[2] = sp, lcl, arg
+                    try:
+                        result = compiled[idx](sp, *ram[sp - nargs:sp])
+                    except Deoptimize as state:
+                        pc, sp, lcl, arg = self.resume(state, pc + 3, sp,
+                            nargs, lcl, arg)
+                        if state.halted:
+                            self.halted = True
+                            step = budget - fuel[0]
+                            break
+                    else:
+                        sp -= nargs
+                        ram[sp] = result
+                        sp += 1
+                        pc += 3
+
+                    used = budget - step - 1 - fuel[0]
+                    if used > 0:
+                        deque(islice(counter, used), maxlen=0)
+                    continue
+                elif op == PROFILE_CALL:
+                    call_counts[idx] += 1
+                    if call_counts[idx] >= threshold:
+                        # Compiles the function, this call is still
+                        # interpreted.
+                        self.pc = pc
+                        self.jit.promote(self, idx)
+
+                entry = entries[idx]
+                if entry < 0:
+                    self.pc = pc
+                    raise ValueError('Unknown function {}'.format(
+                        self.function_names[idx]))
+
+                # Saves the caller's frame. The return address is stored as
+                # a 16-bit word.
+                ret = pc + 3
+                ram[sp] = ret - 65536 if ret > 32767 else ret
+                ram[sp + 1] = lcl
+                ram[sp + 2] = arg
+                ram[sp + 3] = ram[3]
+                ram[sp + 4] = ram[4]
+                sp += 5
+
+                arg = sp - 5 - code[pc + 2]
+                lcl = sp
+                pc = entry
+            elif op == FUNCTION:
+                for i in xrange(code[pc + 1]):
+                    ram[sp] = 0
+                    sp += 1
+                pc += 2
+            elif op == RETURN:
+                frame = lcl
+                pc = ram[frame - 5] & 0xFFFF
+
+                # Repositions the return value and the caller's SP.
+                ram[arg] = ram[sp - 1]
+                sp = arg + 1
+
+                ram[4] = ram[frame - 1]
+                ram[3] = ram[frame - 2]
+                arg = ram[frame - 3]
+                lcl = ram[frame - 4]
+            elif op == AND:
+                sp -= 1
+                ram[sp - 1] = ram[sp - 1] & ram[sp]
+                pc += 1
+            elif op == OR:
+                sp -= 1
+                ram[sp - 1] = ram[sp - 1] | ram[sp]
+                pc += 1
+            elif op == NEG:
+                value = -ram[sp - 1]
+                ram[sp - 1] = value if value != 32768 else -32768
+                pc += 1
+            elif op == HALT:
+                self.halted = True
+                break
+        else:
+            # The budget was exhausted, the last loop step was executed.
+            step = budget
+
+        # Write back the cached pointers.
+        self.pc = pc
+        ram[0] = sp
+        ram[1] = lcl
+        ram[2] = arg
+
+        self.steps += step
+        return step
+
+
+def word(value):
+    """
+    Wraps the given code offset to a 16-bit word, as stored in a frame.
+    """
+    return value - 65536 if value > 32767 else value
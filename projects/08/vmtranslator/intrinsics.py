@@ -0,0 +1,385 @@
+# Native implementations of OS functions, used by the VM emulator instead of
+# interpreting the VM code of tools/OS. Each native operates on the same RAM
+# layout as the OS function it replaces (the heap free list, String objects
+# and the Screen static variables), so native and interpreted OS functions
+# can be mixed freely.
+#
+# A native is called as fn(vm, args) and returns the 16-bit return value of
+# the function. Returning None means the native doesn't handle the given
+# arguments (usually an error condition, like a division by zero), and the
+# VM code of the function is interpreted instead. A native that returns None
+# must leave the memory as it found it.
+#
+# Natives don't touch the temp segment, which the OS VM code uses freely.
+# Programs compiled by the projects/11 compiler may rely on temp 0 surviving
+# an OS call (an array assignment keeps the target address in temp 0 while
+# its value is evaluated), so their native and interpreted results can
+# differ - MathTest, for example, is only correct when run natively. That's
+# a compiler issue, not an intrinsics one.
+from emulator import SCREEN
+
+# The heap is managed by the OS as a linked list of free segments,
+# starting at RAM[2048]. Each segment holds its size and the address
+# of the next segment, followed by its data.
+HEAP = 2048
+HEAP_END = 16379
+
+
+def word(value):
+    """
+    Wraps the given integer to a 16-bit two's complement value.
+    """
+    value &= 0xFFFF
+    return value - 65536 if value > 32767 else value
+
+
+# Math
+
+def math_multiply(vm, args):
+    x, y = args
+    return word(x * y)
+
+def math_divide(vm, args):
+    x, y = args
+
+    # Division by zero is reported by the OS. The OS can't represent the
+    # absolute value of -32768, leave its (odd) result to the OS as well.
+    if y == 0 or x == -32768 or y == -32768:
+        return None
+
+    q = abs(x) // abs(y)
+    return -q if (x < 0) != (y < 0) else q
+
+def math_sqrt(vm, args):
+    x = args[0]
+    if x < 0:
+        return None
+
+    # Integer square root, by a binary search over the 8 result bits.
+    y = 0
+    for j in range(7, -1, -1):
+        if (y + (1 << j)) ** 2 <= x:
+            y += 1 << j
+
+    return y
+
+def math_abs(vm, args):
+    return word(abs(args[0]))
+
+def math_min(vm, args):
+    return min(args[0], args[1])
+
+def math_max(vm, args):
+    return max(args[0], args[1])
+
+
+# Memory
+
+def memory_peek(vm, args):
+    return vm.ram[args[0]]
+
+def memory_poke(vm, args):
+    vm.ram[args[0]] = args[1]
+    return 0
+
+def memory_alloc(vm, args, undo=None):
+    """
+    Allocates a heap block. Given an undo list, the overwritten words are
+    appended to it as (address, value) pairs, so the allocation can be
+    reverted.
+    """
+    size = args[0]
+    if size < 1:
+        return None
+
+    ram = vm.ram
+
+    # First fit - find the first free segment that is large enough. A walk
+    # that leaves the heap (through the end of the free list) means there's
+    # no such segment, which the OS reports.
+    segment = HEAP
+    while ram[segment] < size:
+        segment = ram[segment + 1]
+        if segment < HEAP or segment > HEAP_END:
+            return None
+
+    if segment + size > HEAP_END:
+        return None
+
+    if undo is not None:
+        for addr in [segment, segment + 1, segment + size + 2,
+            segment + size + 3]:
+            undo.append((addr, ram[addr]))
+
+    # Split the segment, the remainder stays in the free list.
+    if ram[segment] > size + 2:
+        ram[segment + size + 2] = word(ram[segment] - size - 2)
+
+        if ram[segment + 1] == segment + 2:
+            ram[segment + size + 3] = word(segment + size + 4)
+        else:
+            ram[segment + size + 3] = ram[segment + 1]
+
+        ram[segment + 1] = word(segment + size + 2)
+
+    ram[segment] = 0
+    return word(segment + 2)
+
+def memory_dealloc(vm, args):
+    ram = vm.ram
+    segment = word(args[0] - 2)
+    following = ram[segment + 1]
+
+    # Merge the segment with the following one, if that one is free.
+    if ram[following] == 0:
+        ram[segment] = word(ram[segment + 1] - segment - 2)
+    else:
+        ram[segment] = word(ram[segment + 1] - segment + ram[following])
+
+        if ram[following + 1] == following + 2:
+            ram[segment + 1] = word(segment + 2)
+        else:
+            ram[segment + 1] = ram[following + 1]
+
+    return 0
+
+
+# Array
+
+def array_new(vm, args):
+    if args[0] <= 0:
+        return None
+
+    return memory_alloc(vm, args)
+
+def array_dispose(vm, args):
+    return memory_dealloc(vm, args)
+
+
+# String objects hold their maximal length, their characters array
+# and their current length, in this order.
+
+def string_new(vm, args):
+    length = args[0]
+    if length < 0:
+        return None
+
+    ram = vm.ram
+    undo = []
+    this = memory_alloc(vm, [3], undo)
+    if this is None:
+        return None
+
+    if length > 0:
+        chars = memory_alloc(vm, [length])
+        if chars is None:
+            # Revert the object allocation, the OS reports the error.
+            for addr, value in reversed(undo):
+                ram[addr] = value
+            return None
+        ram[this + 1] = chars
+
+    ram[this] = length
+    ram[this + 2] = 0
+    return this
+
+def string_dispose(vm, args):
+    ram = vm.ram
+    this = args[0]
+
+    if ram[this] > 0:
+        memory_dealloc(vm, [ram[this + 1]])
+
+    return memory_dealloc(vm, [this])
+
+def string_length(vm, args):
+    return vm.ram[args[0] + 2]
+
+def string_char_at(vm, args):
+    ram = vm.ram
+    this, idx = args
+    if idx < 0 or idx >= ram[this + 2]:
+        return None
+
+    return ram[ram[this + 1] + idx]
+
+def string_set_char_at(vm, args):
+    ram = vm.ram
+    this, idx, c = args
+    if idx < 0 or idx >= ram[this + 2]:
+        return None
+
+    ram[ram[this + 1] + idx] = c
+    return 0
+
+def string_append_char(vm, args):
+    ram = vm.ram
+    this, c = args
+
+    length = ram[this + 2]
+    if length == ram[this]:
+        return None
+
+    ram[ram[this + 1] + length] = c
+    ram[this + 2] = length + 1
+    return this
+
+def string_erase_last_char(vm, args):
+    ram = vm.ram
+    this = args[0]
+    if ram[this + 2] == 0:
+        return None
+
+    ram[this + 2] -= 1
+    return 0
+
+def string_new_line(vm, args):
+    return 128
+
+def string_back_space(vm, args):
+    return 129
+
+def string_double_quote(vm, args):
+    return 34
+
+
+# Screen. The current color is held by the OS in the Screen.2 static
+# variable (true for black).
+
+def screen_color(vm):
+    """Returns the current drawing color, or None if it's unknown."""
+    addr = vm.statics.get('Screen.2')
+    return None if addr is None else vm.ram[addr]
+
+def screen_set_color(vm, args):
+    addr = vm.statics.get('Screen.2')
+    if addr is None:
+        return None
+
+    vm.ram[addr] = args[0]
+    return 0
+
+def screen_clear_screen(vm, args):
+    ram = vm.ram
+    for addr in xrange(SCREEN, SCREEN + 8192):
+        ram[addr] = 0
+
+    return 0
+
+def screen_draw_pixel(vm, args):
+    x, y = args
+    color = screen_color(vm)
+    if color is None or x < 0 or x > 511 or y < 0 or y > 255:
+        return None
+
+    fill_row(vm.ram, y, x, x, color)
+    return 0
+
+def screen_draw_rectangle(vm, args):
+    x1, y1, x2, y2 = args
+    color = screen_color(vm)
+    if color is None or x1 > x2 or y1 > y2 or x1 < 0 or x2 > 511 \
+        or y1 < 0 or y2 > 255:
+        return None
+
+    ram = vm.ram
+    for y in xrange(y1, y2 + 1):
+        fill_row(ram, y, x1, x2, color)
+
+    return 0
+
+def fill_row(ram, y, x1, x2, color):
+    """
+    Sets (or clears, if color is false) the pixels x1..x2 of row y.
+    Pixel x is bit x % 16 of the (x / 16)th word of the row.
+    """
+    row = SCREEN + y * 32
+    first, last = x1 // 16, x2 // 16
+
+    for col in xrange(first, last + 1):
+        low = x1 % 16 if col == first else 0
+        high = x2 % 16 if col == last else 15
+        mask = word(((1 << (high + 1)) - 1) ^ ((1 << low) - 1))
+
+        if color:
+            ram[row + col] |= mask
+        else:
+            ram[row + col] &= ~mask
+
+
+# Sys
+
+def sys_wait(vm, args):
+    # There's no point in a busy wait when running headlessly.
+    if args[0] < 0:
+        return None
+
+    return 0
+
+
+# The natives that manage the heap by themselves rely on the OS Memory
+# class, and are only used along with it.
+for fn in [array_new, array_dispose, string_new, string_dispose]:
+    fn.uses = ['Memory']
+
+# Maps each OS function to its native implementation.
+natives = {
+    'Math.multiply': math_multiply,
+    'Math.divide': math_divide,
+    'Math.sqrt': math_sqrt,
+    'Math.abs': math_abs,
+    'Math.min': math_min,
+    'Math.max': math_max,
+    'Memory.peek': memory_peek,
+    'Memory.poke': memory_poke,
+    'Memory.alloc': memory_alloc,
+    'Memory.deAlloc': memory_dealloc,
+    'Array.new': array_new,
+    'Array.dispose': array_dispose,
+    'String.new': string_new,
+    'String.dispose': string_dispose,
+    'String.length': string_length,
+    'String.charAt': string_char_at,
+    'String.setCharAt': string_set_char_at,
+    'String.appendChar': string_append_char,
+    'String.eraseLastChar': string_erase_last_char,
+    'String.newLine': string_new_line,
+    'String.backSpace': string_back_space,
+    'String.doubleQuote': string_double_quote,
+    'Screen.setColor': screen_set_color,
+    'Screen.clearScreen': screen_clear_screen,
+    'Screen.drawPixel': screen_draw_pixel,
+    'Screen.drawRectangle': screen_draw_rectangle,
+    'Sys.wait': sys_wait
+}
+
+
+def verify(vm, name, args, max_steps=1000000):
+    """
+    Calls the given function twice on the current machine state, once
+    natively and once by interpreting its VM code, and compares the results.
+    Returns a (native result, interpreted result, differing addresses) tuple.
+    Only the memory that outlives the call is compared: the static
+    variables, the heap and the screen. Note that some OS functions keep
+    scratch data on the heap (Math.divide, for example), which natives
+    don't bother to maintain. Raises a ValueError if a call doesn't return
+    within the given amount of VM commands.
+    """
+    enabled = name in vm.native_functions
+    initial = vm.ram[:]
+
+    try:
+        vm.use_native(name, True)
+        native = vm.call(name, args, max_steps)
+        native_ram = vm.ram[:]
+
+        vm.ram[:] = initial
+        vm.use_native(name, False)
+        interpreted = vm.call(name, args, max_steps)
+    finally:
+        vm.use_native(name, enabled)
+
+    diffs = [addr for addr in range(16, 256) + range(HEAP, len(initial))
+        if vm.ram[addr] != native_ram[addr]]
+
+    return native, interpreted, diffs
@@ -0,0 +1,480 @@
+from emulator import fixed_segments, Deoptimize, STACK, DEEP
+
+# Determines the amount of calls after which a function is compiled.
+THRESHOLD = 100
+
+# Caches the compiled code objects by their generated source, so a function
+# is compiled once per process even when many programs (or many emulator
+# instances of the same program, like in a test suite) use it.
+code_cache = {}
+
+# The bases of the this and that segments, as held in RAM.
+pointers = {
+    'this': 3,
+    'that': 4
+}
+
+comparisons = {
+    'eq': '==',
+    'gt': '>',
+    'lt': '<'
+}
+
+bitwise = {
+    'and': '&',
+    'or': '|'
+}
+
+
+class JIT:
+    """
+    A second execution tier of the VM emulator. Functions whose call count
+    exceeds the threshold are compiled into Python functions, which execute
+    the VM commands of the function as straight-line code on Python local
+    variables, instead of dispatching them one by one.
+    """
+    def __init__(self, threshold=THRESHOLD):
+        self.threshold = threshold
+
+        # Determines the compiled functions, and the reason each of the
+        # functions that couldn't be compiled was rejected.
+        self.compiled = []
+        self.failed = {}
+
+    def promote(self, vm, idx):
+        """
+        Compiles the function of the given index and installs it in the VM.
+        """
+        name = vm.function_names[idx]
+
+        try:
+            source = FunctionCompiler(vm, name).compile()
+        except ValueError as err:
+            self.failed[name] = str(err)
+            vm.set_compiled(idx, False)
+            return
+
+        code = code_cache.get(source)
+        if code is None:
+            code = compile(source, '<vm {}>'.format(name), 'exec')
+            code_cache[source] = code
+
+        namespace = {}
+        exec code in namespace
+
+        self.compiled.append(name)
+        vm.set_compiled(idx, namespace['make'](vm.ram, vm.fns, vm.fuel,
+            Deoptimize))
+
+
+class FunctionCompiler:
+    """
+    Generates the Python source of a single VM function. The working stack
+    is mapped on local variables (s0, s1, ...), as are the local variables
+    (l0, ...) and the arguments (a0, ...) of the function. Constants, plain
+    variables and comparisons are kept symbolic on the stack, and only
+    materialized when needed. The labels of the function are mapped to the
+    states of a loop, each state running the commands up to the next label.
+
+    The generated source defines make(ram, fns, fuel, Deoptimize), which
+    returns the compiled function. It is called as f(sp, *args), where sp is
+    the stack address above the arguments, and returns the return value of
+    the function. Other functions are called through fns, which maps a
+    function index to a callable of the same signature.
+
+    Every loop iteration takes a step of the fuel. When it runs out (or
+    the function is called too deep, or the this/that segments point to
+    the VM pointers) the function raises Deoptimize with its current frame,
+    and the interpreter continues from the matching VM command.
+    """
+    def __init__(self, vm, name):
+        self.vm = vm
+        self.name = name
+        self.classname, self.nlocals, self.commands = vm.bodies[name]
+        self.entry = vm.entries[vm.function_idx[name]]
+
+        self.lines = []
+
+        # The symbolic working stack. Each entry is a (kind, text, names)
+        # tuple, where kind is const, var, cond or slot, and names are the
+        # variables its text refers to.
+        self.stack = []
+
+        # Determines the states (by label), the stack depth at each label and
+        # the labels that start a loop (the target of a backward jump).
+        self.states = {}
+        self.depths = {}
+        self.headers = set()
+
+        self.max_depth = 0
+        self.nargs = 0
+
+    def compile(self):
+        """
+        Returns the generated source of the function.
+        """
+        # Number the states (state 0 is the entry of the function), find the
+        # loops and the arguments in use.
+        for t, arg1, arg2, offset in self.commands:
+            if t == 'C_LABEL':
+                self.states[arg1] = len(self.states) + 1
+            elif t in ['C_GOTO', 'C_IF'] and arg1 in self.states:
+                self.headers.add(arg1)
+            elif arg1 == 'argument':
+                self.nargs = max(self.nargs, arg2 + 1)
+
+        # Every label starts a state of the dispatch loop.
+        looping = len(self.states) > 0
+        self.indent = 2
+        if looping:
+            self.lines.append((3, 'if state == 0:'))
+            self.indent = 4
+
+        # Calls out of the usual stack area (too deep, or after the program
+        # has overwritten SP) are interpreted.
+        self.emit('if not {} <= sp <= {}:'.format(STACK, DEEP))
+        self.indent += 1
+        self.deoptimize(self.entry, [], locals_=False)
+        self.indent -= 1
+
+        reachable = True
+        for t, arg1, arg2, offset in self.commands:
+            if t == 'C_LABEL':
+                if reachable:
+                    # Falls through to the next state.
+                    self.flush()
+                    self.jump(arg1)
+                else:
+                    self.stack = [self.slot(i) for i in
+                        range(self.depths.setdefault(arg1, 0))]
+
+                self.lines.append((3, 'elif state == {}:'.format(
+                    self.states[arg1])))
+                reachable = True
+
+                if arg1 in self.headers:
+                    # Every loop iteration takes a step.
+                    self.emit('fuel[0] -= 1')
+                    self.emit('if fuel[0] < 0:')
+                    self.indent += 1
+                    self.deoptimize(offset, self.stack)
+                    self.indent -= 1
+                continue
+
+            if not reachable:
+                # Dead code, after a goto or return.
+                continue
+
+            reachable = self.compile_command(t, arg1, arg2, offset)
+
+        if reachable:
+            self.emit('raise ValueError("{} ended without a return")'.format(
+                self.name))
+
+        return self.source(looping)
+
+    def source(self, looping):
+        """
+        Returns the generated source, wrapped by the function definition.
+        """
+        params = ['sp'] + ['a{}=0'.format(i) for i in range(self.nargs)]
+        variables = ['l{}'.format(i) for i in range(self.nlocals)] + \
+            ['s{}'.format(i) for i in range(self.max_depth)]
+
+        lines = [
+            '# {}'.format(self.name),
+            'def make(ram, fns, fuel, Deoptimize):',
+            '    def f({}, *rest):'.format(', '.join(params)),
+            '        t3 = ram[3]',
+            '        t4 = ram[4]'
+        ]
+
+        if variables:
+            lines.append('        {} = 0'.format(' = '.join(variables)))
+
+        if looping:
+            lines += [
+                '        state = 0',
+                '        while 1:'
+            ]
+
+        lines += ['    ' * depth + line for depth, line in self.lines]
+        lines.append('    return f')
+        return '\n'.join(lines) + '\n'
+
+    def compile_command(self, t, arg1, arg2, offset):
+        """
+        Generates the code of a single command, found at the given code
+        offset. Returns false if the following command is unreachable.
+        """
+        if t == 'C_PUSH':
+            self.push(arg1, arg2, offset)
+        elif t == 'C_POP':
+            self.pop_to(arg1, arg2, offset)
+        elif t == 'C_ARITHMETIC':
+            self.arithmetic(arg1)
+        elif t == 'C_GOTO':
+            self.flush()
+            self.jump(arg1)
+            self.emit('continue')
+            return False
+        elif t == 'C_IF':
+            condition = self.condition(self.stack.pop())
+            self.flush()
+            self.emit('if {}:'.format(condition))
+            self.indent += 1
+            self.jump(arg1)
+            self.emit('continue')
+            self.indent -= 1
+        elif t == 'C_CALL':
+            self.call(arg1, arg2, offset)
+        elif t == 'C_RETURN':
+            value = self.value(self.stack.pop())
+            self.emit('ram[3] = t3')
+            self.emit('ram[4] = t4')
+            self.emit('return {}'.format(value))
+            return False
+        elif t == 'C_FUNCTION':
+            raise ValueError('Unexpected function command.')
+
+        return True
+
+    def push(self, segment, idx, offset):
+        """Generates a push command."""
+        if segment == 'constant':
+            self.stack.append(('const', str(idx), ()))
+        elif segment == 'local':
+            self.push_var('l{}'.format(idx))
+        elif segment == 'argument':
+            self.push_var('a{}'.format(idx))
+        else:
+            self.push_expr(self.address(segment, idx, offset, self.stack))
+
+    def pop_to(self, segment, idx, offset):
+        """Generates a pop command."""
+        entry = self.stack.pop()
+        value = self.value(entry)
+        if segment == 'local':
+            self.assign('l{}'.format(idx), value)
+        elif segment == 'argument':
+            self.assign('a{}'.format(idx), value)
+        else:
+            address = self.address(segment, idx, offset,
+                self.stack + [entry])
+            self.emit('{} = {}'.format(address, value))
+
+    def address(self, segment, idx, offset, stack):
+        """
+        Returns the RAM expression of a segment entry. The this and that
+        segments may point anywhere, but accessing the VM pointers (SP,
+        LCL and ARG) is left to the interpreter, given the stack at the
+        command.
+        """
+        if segment in pointers:
+            base = 'ram[{}]'.format(pointers[segment])
+            self.emit('p = {} + {}'.format(base, idx) if idx else
+                'p = {}'.format(base))
+            self.emit('if p < 3:')
+            self.indent += 1
+            self.deoptimize(offset, stack)
+            self.indent -= 1
+            return 'ram[p]'
+
+        if segment in fixed_segments:
+            return 'ram[{}]'.format(fixed_segments[segment] + idx)
+
+        if segment == 'static':
+            name = '{}.{}'.format(self.classname, idx)
+            return 'ram[{}]'.format(self.vm.statics[name])
+
+        raise ValueError('{} is an invalid segment'.format(segment))
+
+    def arithmetic(self, command):
+        """Generates an arithmetic-logical command."""
+        if command == 'not':
+            kind, text, names = self.stack.pop()
+            if kind == 'cond':
+                self.stack.append(('cond', 'not ({})'.format(text), names))
+            else:
+                self.push_expr('~{}'.format(text))
+            return
+
+        if command == 'neg':
+            entry = self.stack.pop()
+            if entry[0] == 'const':
+                self.stack.append(('const', str(word(-int(entry[1]))), ()))
+            else:
+                self.push_expr(wrap('-' + self.value(entry)))
+            return
+
+        b = self.stack.pop()
+        a = self.stack.pop()
+
+        if command in comparisons:
+            text = '{} {} {}'.format(self.value(a), comparisons[command],
+                self.value(b))
+            self.stack.append(('cond', text, a[2] + b[2]))
+            return
+
+        if command in bitwise:
+            self.push_expr('{} {} {}'.format(self.value(a), bitwise[command],
+                self.value(b)))
+            return
+
+        op = '+' if command == 'add' else '-'
+        if a[0] == 'const' and b[0] == 'const':
+            if command == 'add':
+                value = int(a[1]) + int(b[1])
+            else:
+                value = int(a[1]) - int(b[1])
+            self.stack.append(('const', str(word(value)), ()))
+        else:
+            self.push_expr(wrap('{} {} {}'.format(self.value(a), op,
+                self.value(b))))
+
+    def call(self, name, nargs, offset):
+        """
+        Generates a call command. The callee's stack address is the one it
+        gets when this function is interpreted: above the frame, the local
+        variables, the stack and the arguments.
+        """
+        args = [self.value(self.stack.pop()) for i in range(nargs)]
+        args.reverse()
+
+        depth = len(self.stack)
+        slot = 's{}'.format(depth)
+        self.invalidate(slot)
+
+        sp = 'sp + {}'.format(5 + self.nlocals + depth + nargs)
+        self.emit('try:')
+        self.indent += 1
+        self.emit('{} = fns[{}]({})'.format(slot,
+            self.vm.function_index(name), ', '.join([sp] + args)))
+        self.indent -= 1
+
+        # A callee that continues in the interpreter returns to the
+        # command that follows the call.
+        self.emit('except Deoptimize as state:')
+        self.indent += 1
+        self.emit('state.frames.append({})'.format(
+            self.frame(offset + 3, nargs, self.stack)))
+        self.emit('raise')
+        self.indent -= 1
+
+        self.stack.append(self.slot(depth))
+        self.max_depth = max(self.max_depth, len(self.stack))
+
+    def deoptimize(self, offset, stack, locals_=True):
+        """
+        Generates a raise of Deoptimize, continuing from the command at the
+        given offset with the given stack.
+        """
+        self.emit('raise Deoptimize({})'.format(
+            self.frame(offset, 0, stack, locals_)))
+
+    def frame(self, offset, nargs, stack, locals_=True):
+        """
+        Returns an expression of the current frame, as expected by
+        Deoptimize. There are no local variables before the function
+        command is executed.
+        """
+        args = ['a{}'.format(i) for i in range(self.nargs)]
+        local = ['l{}'.format(i) for i in range(self.nlocals)] \
+            if locals_ else []
+        values = [self.value(entry) for entry in stack]
+
+        return '({}, {}, [{}] + list(rest), [{}], [{}], t3, t4)'.format(
+            offset, nargs, ', '.join(args), ', '.join(local),
+            ', '.join(values))
+
+    def push_var(self, name):
+        """Pushes a (symbolic) variable on the stack."""
+        self.stack.append(('var', name, (name,)))
+
+    def push_expr(self, expr):
+        """Pushes the value of the given expression into a stack slot."""
+        slot = 's{}'.format(len(self.stack))
+        self.assign(slot, expr)
+        self.stack.append(('slot', slot, (slot,)))
+        self.max_depth = max(self.max_depth, len(self.stack))
+
+    def assign(self, name, expr, keep=None):
+        """
+        Assigns the expression to a variable. Symbolic stack entries that
+        refer to the variable are materialized first.
+        """
+        self.invalidate(name, keep)
+        self.emit('{} = {}'.format(name, expr))
+
+    def invalidate(self, name, keep=None):
+        """
+        Materializes the symbolic stack entries that refer to the given
+        variable, before it's assigned.
+        """
+        for i, entry in enumerate(self.stack):
+            if i != keep and entry[0] in ['var', 'cond'] and name in entry[2]:
+                self.materialize(i)
+
+    def materialize(self, i):
+        """Stores the stack entry at the given depth in its slot."""
+        kind, text, names = self.stack[i]
+        if kind == 'slot':
+            return
+
+        slot = 's{}'.format(i)
+        self.assign(slot, self.value(self.stack[i]), keep=i)
+        self.stack[i] = self.slot(i)
+        self.max_depth = max(self.max_depth, i + 1)
+
+    def flush(self):
+        """Materializes the whole stack, as expected at a label."""
+        for i in range(len(self.stack)):
+            self.materialize(i)
+
+    def slot(self, i):
+        """Returns the stack entry of a materialized slot."""
+        name = 's{}'.format(i)
+        return ('slot', name, (name,))
+
+    def jump(self, label):
+        """
+        Generates a jump to the state of the given label. The stack depth
+        must agree with the other jumps to this label.
+        """
+        if label not in self.states:
+            raise ValueError('Unknown label {}'.format(label))
+
+        depth = self.depths.setdefault(label, len(self.stack))
+        if depth != len(self.stack):
+            raise ValueError('Inconsistent stack depth at {}'.format(label))
+
+        self.emit('state = {}'.format(self.states[label]))
+
+    def value(self, entry):
+        """Returns an expression of the 16-bit value of a stack entry."""
+        kind, text, names = entry
+        if kind == 'cond':
+            return '(-1 if {} else 0)'.format(text)
+
+        return text
+
+    def condition(self, entry):
+        """Returns an expression of the truth value of a stack entry."""
+        kind, text, names = entry
+        return text if kind == 'cond' else '{} != 0'.format(text)
+
+    def emit(self, line):
+        """Appends a line to the generated code, at the current indentation."""
+        self.lines.append((self.indent, line))
+
+
+def wrap(expr):
+    """
+    Returns an expression that wraps the given expression to 16 bits.
+    """
+    return '(({} + 32768) & 65535) - 32768'.format(expr)
+
+def word(value):
+    """Wraps the given integer to a 16-bit two's complement value."""
+    value &= 0xFFFF
+    return value - 65536 if value > 32767 else value
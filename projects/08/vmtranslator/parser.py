@@ -28,12 +28,16 @@ class Parser:
 
     def has_more_lines(self):
         """
-        Return true if there are more lines in the input file.
+        Return true if there are more commands in the input file.
+        Trailing empty lines or comments don't count as commands.
         """
         pos = self.stream.tell()
-        res = self.stream.readline() != ''
+        line = self.stream.readline()
+        while line != '' and re.sub('//.*', '', line).strip() == '':
+            line = self.stream.readline()
+
         self.stream.seek(pos)
-        return res
+        return line != ''
 
     def advance(self):
         """
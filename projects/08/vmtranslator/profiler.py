@@ -0,0 +1,170 @@
+from emulator import CALL, NATIVE, RETURN
+
+# The name of the code that calls Sys.init, at the root of the call tree.
+BOOTSTRAP = 'bootstrap'
+
+
+class VMProfiler(object):
+    """
+    Profiles the execution of a VM program on the VM emulator. Every VM
+    command is attributed to the call stack it was executed in (a call
+    command to the caller, a function command to the callee), from which
+    the per-function profile is derived:
+
+    calls - the amount of times the function was called.
+    inclusive - the commands executed by the function and its callees.
+    exclusive - the commands executed by the function itself.
+    stack - the maximal amount of stack words its frame took, i.e, its
+    local variables and working stack.
+
+    Natives are counted as calls that execute no VM commands. Compiled
+    functions are not profiled, as they run without the interpreter.
+    """
+    def __init__(self, vm):
+        if vm.jit is not None:
+            raise ValueError('Programs with compiled functions can\'t be profiled.')
+
+        self.vm = vm
+
+        # Determines the call stacks seen so far. Each call stack is given an
+        # id, mapped from its (caller stack id, function) pair, and counts the
+        # commands executed in it and the maximal size of its frame.
+        self.stack_ids = {}
+        self.stacks = []
+        self.counts = []
+        self.stack_sizes = []
+
+        # Determines the calls of each function.
+        self.calls = {}
+
+        # The maximal amount of nested calls.
+        self.max_depth = 0
+
+        # The current call stack, as a list of stack ids.
+        self.path = [self.stack_id(None, self.function_at(vm.pc))]
+
+    def function_at(self, pc):
+        """
+        Returns the name of the function the given code offset belongs to.
+        """
+        vm = self.vm
+        name, entry = BOOTSTRAP, -1
+        for idx, offset in enumerate(vm.entries):
+            if entry < offset <= pc:
+                name, entry = vm.function_names[idx], offset
+
+        return name
+
+    def stack_id(self, caller, name):
+        """
+        Returns the id of the call stack of the given function, called
+        from the given call stack id (None for the root).
+        """
+        key = (caller, name)
+        if key not in self.stack_ids:
+            self.stack_ids[key] = len(self.stacks)
+            parent = self.stacks[caller] if caller is not None else ()
+            self.stacks.append(parent + (name,))
+            self.counts.append(0)
+            self.stack_sizes.append(0)
+
+        return self.stack_ids[key]
+
+    def enter(self, name):
+        """Records a call of the given function."""
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self.path.append(self.stack_id(self.path[-1], name))
+        self.max_depth = max(self.max_depth, len(self.path) - 1)
+
+    def run(self, max_steps=None):
+        """
+        Executes the program, one VM command at a time, until the machine
+        halts or the given amount of commands was executed. Returns the
+        amount of executed commands.
+        """
+        vm = self.vm
+        code = vm.code
+        ram = vm.ram
+        names = vm.function_names
+        counts = self.counts
+        stack_sizes = self.stack_sizes
+        path = self.path
+
+        step = 0
+        while max_steps is None or step < max_steps:
+            pc = vm.pc
+            op = code[pc]
+            current = path[-1]
+
+            if not vm.run(1):
+                break
+
+            step += 1
+            counts[current] += 1
+
+            if op >= CALL:
+                name = names[code[pc + 1]]
+                if op == NATIVE and vm.pc == pc + 3:
+                    # Executed natively, there's no frame.
+                    self.calls[name] = self.calls.get(name, 0) + 1
+                else:
+                    self.enter(name)
+            elif op == RETURN:
+                path.pop()
+
+                # Returning from the function the program started at (a
+                # single VM file) continues in an unknown caller.
+                if not path:
+                    path.append(self.stack_id(None, self.function_at(vm.pc)))
+
+            current = path[-1]
+            size = ram[0] - ram[1]
+            if size > stack_sizes[current]:
+                stack_sizes[current] = size
+
+        return step
+
+    def profile(self):
+        """
+        Returns the flat profile, as a list of (function, calls, inclusive,
+        exclusive, stack) tuples, ordered by exclusive commands. Recursive
+        calls are counted once in the inclusive commands of a function.
+        """
+        inclusive, exclusive, stack = {}, {}, {}
+        for names, count, size in zip(self.stacks, self.counts,
+            self.stack_sizes):
+            name = names[-1]
+            exclusive[name] = exclusive.get(name, 0) + count
+
+            # The bootstrap code has no frame of its own.
+            if name != BOOTSTRAP:
+                stack[name] = max(stack.get(name, 0), size)
+
+            for caller in set(names):
+                inclusive[caller] = inclusive.get(caller, 0) + count
+
+        for name in self.calls:
+            inclusive.setdefault(name, 0)
+            exclusive.setdefault(name, 0)
+
+        rows = [(name, self.calls.get(name, 0), inclusive[name],
+            exclusive[name], stack.get(name, 0)) for name in inclusive]
+        return sorted(rows, key=lambda row: (-row[3], row[0]))
+
+    def write_flat(self, f):
+        """Writes the flat profile to the given file, as a table."""
+        f.write('{:<32}{:>10}{:>14}{:>14}{:>8}\n'.format('Function', 'Calls',
+            'Inclusive', 'Exclusive', 'Stack'))
+
+        for row in self.profile():
+            f.write('{:<32}{:>10}{:>14}{:>14}{:>8}\n'.format(*row))
+
+    def write_collapsed(self, f):
+        """
+        Writes the call tree to the given file in the collapsed stacks
+        format (one 'caller;...;callee count' line per call stack), as
+        read by flame graph tools.
+        """
+        for names, count in sorted(zip(self.stacks, self.counts)):
+            if count:
+                f.write('{} {}\n'.format(';'.join(names), count))
@@ -4,7 +4,7 @@ class CodeWriter:
     """
     This module translates a parsed VM command into Hack assembly code.
     """
-    def __init__(self, filename):
+    def __init__(self, filename, report=None):
         # Determines the main stream assembly file to write to.
         filename = re.sub('.vm$', '', filename)
         self.stream = open(filename + '.asm', 'w')
@@ -35,6 +35,10 @@ class CodeWriter:
         # file_name.function.name
         self.function_calls_count = {}
 
+        # Determines an optional cost report (see cost.py) that is
+        # informed of every emitted line of assembly code.
+        self.report = report
+
     def sef_file_name(self, filename):
         """
         Informs that the translation of a new VM file has started.
@@ -140,6 +144,9 @@ class CodeWriter:
         # Increment call count by 1, for this function.
         self.function_calls_count[function_name] += 1
 
+        if self.report:
+            self.report.record_call(function_name)
+
         # Push return-address to stack.
         self._push_from_D('@' + ret_symbol, 'D=A')
 
@@ -426,6 +433,9 @@ class CodeWriter:
         if lines and isinstance(lines, str):
             lines = [lines]
 
+        if self.report:
+            self.report.record_lines(lines)
+
         lines.append('')
         self.stream.write('\n'.join(lines))
 
@@ -4,23 +4,94 @@ import sys
 import glob
 import logging
 import traceback
+import multiprocessing
 
 from tokenizer import JackTokenizer
-from compiler import CompilationEngine
+from compiler import CompilationEngine, VERSION
+from build import Manifest, MANIFEST
+from passes import optimizations, default
+
+def compile_file(job):
+    """
+    Compiles a Jack file into its .vm file, with the given optimizations.
+    Returns the name of the file, the error it encountered with its
+    traceback (or None), and the counts of the optimizations by name.
+    """
+    filename, cache_dir, optimize = job
+    engine = None
+    passes = [optimizations[name]() for name in optimize]
+    counts = dict((name, {}) for name in optimize)
+    try:
+        tok = JackTokenizer(filename, cache_dir)
+        engine = CompilationEngine(tok, passes)
+
+        # Since the first token in a valid Jack file must be class,
+        # the parsing process starts by calling the CompileClass routine.
+        engine.compile_class()
+
+        # We're done, close the current engine for the current file.
+        engine.close()
+
+        for name, run in zip(optimize, passes):
+            counts[name] = run.report()
+        return filename, None, counts
+
+    except Exception as err:
+        # The .vm file of a class that failed to compile is left as it was.
+        if engine is not None:
+            engine.vm_writer.discard()
+        return filename, (str(err),
+            '\n'.join(traceback.format_exc().splitlines()[-3:])), counts
+
 
 def main():
     path = None
     files = None
+    args = sys.argv[1:]
+    cache_dir = None
+    processes = 1
+    optimize = []
+    incremental = '--incremental' in args
+    args = [arg for arg in args if arg != '--incremental']
+
+    # The --optimize flag runs the given optimizations (comma separated, or
+    # all the ones that don't change the behavior of any program) over the
+    # syntax tree of every class.
+    if '--optimize' in args:
+        idx = args.index('--optimize')
+        optimize = args[idx + 1].split(',')
+        args = args[:idx] + args[idx + 2:]
+        if optimize == ['all']:
+            optimize = list(default)
+
+        unknown = [name for name in optimize if name not in optimizations]
+        if unknown:
+            raise Exception("Unknown optimizations: " + ', '.join(unknown))
+
+    # The -j flag compiles the classes in the given amount of worker
+    # processes.
+    if '-j' in args:
+        idx = args.index('-j')
+        processes = int(args[idx + 1])
+        args = args[:idx] + args[idx + 2:]
+
+    # The --cache flag keeps the tokens of the compiled files in the given
+    # directory, by the hash of their sources, for later runs.
+    if '--cache' in args:
+        idx = args.index('--cache')
+        cache_dir = args[idx + 1]
+        args = args[:idx] + args[idx + 2:]
 
     # If no path is specified, the Jack Analyzer operates on the
     # current directory by default.
-    if len(sys.argv) == 1:
+    if len(args) == 0:
         path = os.getcwd()
-    elif len(sys.argv) == 2:
-        path = sys.argv[1]
+    elif len(args) == 1:
+        path = args[0]
     else:
         raise Exception("Usage: python JackAnalyzer.py filename/dirname " +
-            "(empty path for current dir)")
+            "(empty path for current dir) [-j N] [--cache DIR] " +
+            "[--incremental] [--optimize name,...|all]")
 
     # Given path is either a single Jack file, or a directory of Jack files.
     is_single_file = re.search('.jack$', path)
@@ -38,23 +109,67 @@ def main():
         # We're given a single Jack file.
         files = [path]
 
-    try:
-        for filename in files:
-            tok = JackTokenizer(filename)
-            engine = CompilationEngine(tok)
+    # The --incremental flag compiles only the classes that changed since
+    # the last run (or that refer to a class whose interface changed), as
+    # recorded by the manifest in the directory of the classes.
+    manifest = None
+    if incremental:
+        options = {'version': VERSION, 'optimize': optimize}
+        dirname = path if not is_single_file else os.path.dirname(path)
+        manifest = Manifest(os.path.join(dirname, MANIFEST))
+        stale = manifest.plan(files, options, cache_dir)
+        if len(stale) < len(files):
+            print "Skipping {} unchanged of {} files".format(
+                len(files) - len(stale), len(files))
+        files = stale
 
-            # Since the first token in a valid Jack file must be class,
-            # the parsing process starts by calling the CompileClass routine.
-            engine.compile_class()
+    # Every class is compiled on its own, so the errors of all the files
+    # are reported together.
+    jobs = [(filename, cache_dir, optimize) for filename in files]
+    if processes == 1 or len(jobs) < 2:
+        results = [compile_file(job) for job in jobs]
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(compile_file, jobs)
+        finally:
+            pool.close()
+            pool.join()
 
-            # We're done, close the current engine for the current file.
-            engine.close()
+    failed = 0
+    totals = dict((name, {}) for name in optimize)
+    for filename, error, counts in results:
+        for name, report in counts.items():
+            for key, value in report.items():
+                if key in totals[name]:
+                    totals[name][key] += value
+                else:
+                    totals[name][key] = value
 
-        print "Completed compilation for {}".format(path)
+        if error is not None:
+            message, trace = error
+            print "Encountered an error in {}: {}".format(filename, message)
+            logging.error(trace)
+            failed += 1
 
-    except Exception as err:
-        print "Encountered an error: {}".format(err)
-        logging.error('\n'.join(traceback.format_exc().splitlines()[-3:]))
+            if manifest is not None:
+                manifest.discard(filename)
+        elif manifest is not None:
+            manifest.record(filename)
+
+    if manifest is not None:
+        manifest.save()
+
+    for name in optimize:
+        if totals[name]:
+            print '\n'.join(optimizations[name].describe(totals[name]))
+
+    if failed:
+        print "Failed to compile {} of {} files in {}".format(failed,
+            len(results), path)
+        sys.exit(1)
+
+    print "Completed compilation for {}".format(path)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,152 @@
+import os
+import json
+import hashlib
+
+from tokenizer import load_tokens
+
+# The name of the manifest file, in the directory of the compiled classes.
+MANIFEST = '.manifest.json'
+
+
+def file_hash(path):
+    """Returns the sha1 of the given file, or None if there's no such file."""
+    if not os.path.isfile(path):
+        return None
+
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def interface(tokens):
+    """
+    Returns the hash of the public interface of a class, given its tokens:
+    the kind, the return type, the name and the parameter types of each of
+    its subroutines. Names of parameters and bodies aren't part of it.
+    """
+    declarations = []
+    depth = 0
+    idx = 0
+    while idx < len(tokens):
+        type = tokens.type(idx)
+        value = tokens.value(idx)
+
+        if type == 'SYMBOL' and value == '{':
+            depth += 1
+        elif type == 'SYMBOL' and value == '}':
+            depth -= 1
+        elif depth == 1 and value in ['constructor', 'function', 'method']:
+            # kind type name ( type name , type name ... )
+            declaration = [tokens.value(idx + k) for k in range(3)]
+            idx += 4
+            while tokens.value(idx) != ')':
+                if tokens.value(idx) != ',':
+                    declaration.append(tokens.value(idx))
+                    idx += 1
+                idx += 1
+            declarations.append(' '.join(declaration))
+
+        idx += 1
+
+    return hashlib.sha1('\n'.join(declarations)).hexdigest()
+
+
+def dependencies(tokens, classes):
+    """
+    Returns the names of the given classes that a class refers to, given
+    its tokens.
+    """
+    return sorted(value for value in tokens.values
+        if isinstance(value, str) and value in classes)
+
+
+class Manifest:
+    """
+    Records what every class of a directory was last compiled from: the
+    hash of its source, the options of the compiler, the hash of its .vm
+    file, the hash of its public interface and the classes it refers to.
+    A class whose record still holds needn't be compiled again.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.classes = {}
+
+        if os.path.isfile(path):
+            with open(path) as f:
+                self.classes = json.load(f).get('classes', {})
+
+    def plan(self, files, options, cache_dir=None):
+        """
+        Returns the files (of the given ones) that need to be compiled: the
+        ones whose source, options or .vm file changed since they were
+        recorded, and the ones that refer to a class whose public interface
+        changed.
+        """
+        names = dict((classname(filename), filename) for filename in files)
+
+        # Classes that are gone from the directory changed their interface.
+        changed = set(name for name in self.classes if name not in names)
+        for name in changed:
+            del self.classes[name]
+
+        stale = []
+        for name, filename in sorted(names.items()):
+            record = self.classes.get(name)
+            source = file_hash(filename)
+            output = file_hash(vm_filename(filename))
+            if record is not None and record['source'] == source and \
+                    record['options'] == options and \
+                    record['output'] == output:
+                continue
+
+            tokens = load_tokens(filename, cache_dir)
+            entry = {
+                'source': source,
+                'options': options,
+                'output': None,
+                'interface': interface(tokens),
+                'dependencies': dependencies(tokens, names)
+            }
+            if record is None or record['interface'] != entry['interface']:
+                changed.add(name)
+
+            self.classes[name] = entry
+            stale.append(filename)
+
+        # The classes that refer to a changed class are compiled again, for
+        # what they know of it.
+        for name, filename in sorted(names.items()):
+            if filename not in stale and \
+                    changed & set(self.classes[name]['dependencies']):
+                self.classes[name]['output'] = None
+                stale.append(filename)
+
+        return stale
+
+    def record(self, filename):
+        """Records the .vm file of a class that was compiled."""
+        entry = self.classes[classname(filename)]
+        entry['output'] = file_hash(vm_filename(filename))
+
+    def discard(self, filename):
+        """Forgets a class that failed to compile."""
+        self.classes.pop(classname(filename), None)
+
+    def save(self):
+        """
+        Writes the manifest. The file is written in full before it's
+        renamed, so it's never read half written.
+        """
+        temp = '{}.{}'.format(self.path, os.getpid())
+        with open(temp, 'w') as f:
+            json.dump({'classes': self.classes}, f, indent=2, sort_keys=True)
+        os.rename(temp, self.path)
+
+
+def classname(filename):
+    """Returns the name of the class of the given Jack file."""
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+def vm_filename(filename):
+    """Returns the name of the .vm file of the given Jack file."""
+    return os.path.splitext(filename)[0] + '.vm'
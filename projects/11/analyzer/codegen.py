@@ -0,0 +1,333 @@
+from table import SymbolTable
+
+class CodeGenerator:
+    """
+    Walks the syntax tree of a Jack class (see nodes.py) and emits its VM
+    code using the VMWriter.
+    """
+    def __init__(self, vm_writer, classname):
+        self.vm_writer = vm_writer
+        self.classname = classname
+        self.symbol_table = SymbolTable(classname)
+
+        # Determines the current subroutine in use.
+        self.current_fn_type = None
+        self.current_fn_name = None
+
+        self.if_idx = 0
+        self.while_idx = 0
+        self.string_idx = 0
+
+        self.verbal_arithemtic = {
+            '>': 'GT',
+            '<': 'LT',
+            '=': 'EQ',
+            '|': 'OR',
+            '-': 'SUB',
+            '+': 'ADD',
+            '&': 'AND'
+        }
+
+        self.verbal_unary = {
+            '~': 'NOT',
+            '-': 'NEG'
+        }
+
+    def compile(self, node):
+        """Emits the code of the given node, by its class."""
+        method = getattr(self, 'compile_' + node.__class__.__name__.lower())
+        method(node)
+
+    def compile_statements(self, statements):
+        for statement in statements:
+            self.compile(statement)
+
+    def compile_class(self, node):
+        """
+        Compiles a complete class.
+        """
+        for var_dec in node.class_vars:
+            for name in var_dec.names:
+                self.symbol_table.define(name, var_dec.type, var_dec.kind)
+
+        for subroutine in node.subroutines:
+            self.compile(subroutine)
+
+    def compile_subroutine(self, node):
+        """
+        Compiles a complete method, function, or constructor.
+        """
+        self.current_fn_type = node.kind
+        self.current_fn_name = node.name
+
+        # Reset symbol table for current scope.
+        self.symbol_table.start_subroutine()
+
+        if self.current_fn_type == 'method':
+            # The type of 'this' is the class name (for exmaple, 'Point').
+            self.symbol_table.define('this', self.classname, 'arg')
+
+        for type, name in node.parameters:
+            self.symbol_table.define(name, type, 'arg')
+        for var_dec in node.var_decs:
+            for name in var_dec.names:
+                self.symbol_table.define(name, var_dec.type, var_dec.kind)
+
+        # Ouput the subroutine's declaration VM code.
+        subroutine_name = '{}.{}'.format(self.classname, self.current_fn_name)
+        nlocals = self.symbol_table.var_count('var')
+        self.vm_writer.write_function(subroutine_name, nlocals)
+
+        # Constructors require allocating memory to object fields.
+        if self.current_fn_type == 'constructor':
+            nargs = self.symbol_table.var_count('field')
+            self.vm_writer.write_push('constant', nargs)
+            self.vm_writer.write_call('Memory.alloc', 1)
+            self.vm_writer.write_pop('pointer', 0)
+
+        # THIS = argument 0 for class methods.
+        if self.current_fn_type == 'method':
+            self.vm_writer.write_push('argument', 0)
+            self.vm_writer.write_pop('pointer', 0)
+
+        self.compile_statements(node.statements)
+
+    def compile_let(self, node):
+        """
+        Compiles a let statement.
+        """
+        index = self.get_index(node.name)
+        segment = self.get_kind(node.name)
+
+        # Placement might be an array entring.
+        if node.index is not None:
+            self.compile(node.index)
+
+            self.vm_writer.write_push(segment, index)
+            self.vm_writer.write_arithmetic('ADD')
+            self.vm_writer.write_pop('TEMP', 0)
+
+            self.compile(node.value)
+
+            self.vm_writer.write_push('TEMP', 0)
+            self.vm_writer.write_pop('POINTER', 1)
+            self.vm_writer.write_pop('THAT', 0)
+        else:
+            # Regular assignment.
+            self.compile(node.value)
+            self.vm_writer.write_pop(segment, index)
+
+    def compile_do(self, node):
+        """
+        Compiles a do statement.
+        """
+        self.compile(node.call)
+        self.vm_writer.write_pop('TEMP', 0)
+
+    def compile_call(self, node):
+        """
+        Compiles a subroutine invokation.
+        """
+        args_count = len(node.args)
+
+        # Either a static (outer) class funciton or an instance function call.
+        if node.receiver is not None:
+            inst_type = self.symbol_table.type_of(node.receiver)
+            if inst_type:
+                # It's an instance.
+                inst_kind = self.get_kind(node.receiver)
+                inst_indx = self.get_index(node.receiver)
+
+                self.vm_writer.write_push(inst_kind, inst_indx)
+                fn_name = '{}.{}'.format(inst_type, node.name)
+
+                args_count += 1 # Pass 'this' as an argument.
+            else: # Static function of a class.
+                fn_name = '{}.{}'.format(node.receiver, node.name)
+
+        else: # Local method call.
+            fn_name = '{}.{}'.format(self.classname, node.name)
+            args_count += 1 # Pass 'this' as an argument.
+            self.vm_writer.write_push('POINTER', 0)
+
+        for arg in node.args:
+            self.compile(arg)
+        self.vm_writer.write_call(fn_name, args_count)
+
+    def compile_if(self, node):
+        """
+        Compiles an if statement, possibly with a trailing else clause.
+        """
+        self.compile(node.condition) # E.g., x > 2
+        self.vm_writer.write_arithmetic('NOT')
+
+        idx = self.if_idx
+        self.if_idx += 1
+        label_false = '{}.if_false.{}'.format(self.current_fn_name, idx)
+        label_proceed = '{}.{}'.format(self.current_fn_name, idx)
+
+        self.vm_writer.write_if(label_false)
+
+        self.compile_statements(node.statements)
+
+        self.vm_writer.write_goto(label_proceed)
+
+        # Lables statements.
+        self.vm_writer.write_label(label_false)
+        if node.else_statements is not None:
+            self.compile_statements(node.else_statements)
+
+        self.vm_writer.write_label(label_proceed)
+
+    def compile_while(self, node):
+        """
+        Compiles a while statement.
+        """
+        fn_name = self.current_fn_name
+        idx = self.while_idx
+        self.while_idx += 1
+
+        while_start_label = '{}.while_start.{}'.format(fn_name, idx)
+        while_end_label = '{}.while_end.{}'.format(fn_name, idx)
+
+        self.vm_writer.write_label(while_start_label)
+        self.compile(node.condition)
+        self.vm_writer.write_arithmetic('NOT')
+
+        # while's body.
+        self.vm_writer.write_if(while_end_label)
+        self.compile_statements(node.statements)
+        self.vm_writer.write_goto(while_start_label)
+        self.vm_writer.write_label(while_end_label)
+
+    def compile_return(self, node):
+        """
+        Compiles a return statement.
+        """
+        if node.value is not None:
+            self.compile(node.value)
+        else: # Return VOID.
+            self.vm_writer.write_push('CONSTANT', 0)
+
+        self.vm_writer.write_return()
+
+    def compile_binary(self, node):
+        """
+        Compiles a binary operation.
+        """
+        self.compile(node.left)
+        self.compile(node.right)
+
+        # Explicitly use Math.multiply or Math.divide.
+        if node.op == '*':
+            self.vm_writer.write_call('Math.multiply', 2)
+        elif node.op == '/':
+            self.vm_writer.write_call('Math.divide', 2)
+        else:
+            name = self.verbal_arithemtic.get(node.op)
+            self.vm_writer.write_arithmetic(name)
+
+    def compile_unary(self, node):
+        self.compile(node.operand)
+        name = self.verbal_unary.get(node.op)
+        self.vm_writer.write_arithmetic(name)
+
+    def compile_arrayref(self, node):
+        self.compile(node.index)
+
+        index = self.get_index(node.name)
+        segment = self.get_kind(node.name)
+        self.vm_writer.write_push(segment, index)
+        self.vm_writer.write_arithmetic('ADD')
+        self.vm_writer.write_pop('POINTER', 1)
+        self.vm_writer.write_push('THAT', 0)
+
+    def compile_with(self, node):
+        self.compile(node.value)
+        self.vm_writer.write_pop('TEMP', node.index)
+        self.compile(node.body)
+
+    def compile_temp(self, node):
+        self.vm_writer.write_push('TEMP', node.index)
+
+    def compile_intconst(self, node):
+        """Compiles an integer."""
+        # The smallest integer has no positive counterpart (in 16 bits).
+        if node.value == -0x8000:
+            self.vm_writer.write_push('CONSTANT', 0x7FFF)
+            self.vm_writer.write_arithmetic('NOT')
+            return
+
+        self.vm_writer.write_push('CONSTANT', abs(node.value))
+        if node.value < 0:
+            self.vm_writer.write_arithmetic('NEG')
+
+    def compile_stringconst(self, node):
+        """Compiles a string."""
+        self.vm_writer.write_push('CONSTANT', len(node.value))
+        self.vm_writer.write_call('String.new', 1)
+
+        # String assignments are handled using a series of calls
+        # to String.appendChar(c), when c is the integer representing
+        # unicode code point.
+        for c in node.value:
+            self.vm_writer.write_push('CONSTANT', ord(c))
+            self.vm_writer.write_call('String.appendChar', 2)
+
+    def compile_pooledstring(self, node):
+        """
+        Compiles a pooled string: its static variable, which is built
+        first if it's still null.
+        """
+        index = self.get_index(node.name())
+        label_ready = '{}.string_ready.{}'.format(self.current_fn_name,
+            self.string_idx)
+        self.string_idx += 1
+
+        self.vm_writer.write_push('STATIC', index)
+        self.vm_writer.write_if(label_ready)
+        self.compile_stringconst(node)
+        self.vm_writer.write_pop('STATIC', index)
+        self.vm_writer.write_label(label_ready)
+        self.vm_writer.write_push('STATIC', index)
+
+    def compile_keywordconst(self, node):
+        """Compiles a keyword."""
+        if node.value == 'this':
+            self.vm_writer.write_push('POINTER', 0)
+            return
+
+        if node.value == 'true':
+            self.vm_writer.write_push('CONSTANT', 1)
+            self.vm_writer.write_arithmetic('NEG')
+            return
+
+        # null or false.
+        self.vm_writer.write_push('CONSTANT', 0)
+
+    def compile_varref(self, node):
+        """Compiles a variable."""
+        index = self.get_index(node.name)
+        segment = self.get_kind(node.name)
+        self.vm_writer.write_push(segment, index)
+
+    def get_kind(self, name):
+        """Returns the kind value of a symbol table value."""
+        segment = self.symbol_table.kind_of(name)
+        if segment is None:
+            raise SyntaxError('Undefined variable {} in {}.{}'.format(name,
+                self.classname, self.current_fn_name))
+
+        segment = segment.lower()
+        if segment == 'field':
+            return 'this'
+        if segment == 'var':
+            return 'local'
+        if segment == 'arg':
+            return 'argument'
+
+        return segment
+
+    def get_index(self, name):
+        """Returns the index value of a symbol table value."""
+        return self.symbol_table.index_of(name)
@@ -2,16 +2,26 @@ import re
 import inspect
 
 from writer import VMWriter
-from table import SymbolTable
+from codegen import CodeGenerator
+from nodes import (Class, VarDec, Subroutine, Let, If, While, Do, Return,
+    IntConst, StringConst, KeywordConst, VarRef, ArrayRef, Call, Unary,
+    Binary)
+
+# The version of the compiler, as recorded by build manifests (see build.py).
+VERSION = 1
 
 class CompilationEngine:
     """
     Recursive top-down compilation engine for the Jack langauge.
-    Using a Tokenizer object, this module will process different
-    Jack tokens and compile it to VM code using the VMWriter.
+    Using a Tokenizer object, this module will parse the Jack tokens of a
+    class into its syntax tree (see nodes.py), run the given passes over it,
+    and compile it to VM code using the CodeGenerator and the VMWriter.
     While at it, invalid Jack syntax will raise SyntaxError.
+
+    A pass is a callable that's given the syntax tree of the class, and
+    returns the tree to compile (see nodes.Transformer).
     """
-    def __init__(self, tokenizer):
+    def __init__(self, tokenizer, passes=()):
         """
         Creates a new compilation engine with the given tokenizer.
         """
@@ -22,10 +32,8 @@ class CompilationEngine:
 
         self.tokenizer = tokenizer
         self.vm_writer = VMWriter(filename)
-        self.symbol_table = SymbolTable(filename)
         self.classname = self.get_classname(filename)
-
-        self.tokenizer.seperate_all()
+        self.passes = list(passes)
 
         # Different keywords and operators partition to digest
         # the structure of program.
@@ -35,31 +43,22 @@ class CompilationEngine:
         self.ops = ['+', '-', '*', '/', '&', '|', '<', '>', '=']
         self.unary_ops = ['~', '-']
 
-        # Determines the current subroutine in use.
-        self.current_fn_type = None
-        self.current_fn_name = None
-
-        self.if_idx = 0
-        self.while_idx = 0
-
-        self.verbal_arithemtic = {
-            '>': 'GT',
-            '<': 'LT',
-            '=': 'EQ',
-            '|': 'OR',
-            '-': 'SUB',
-            '+': 'ADD',
-            '&': 'AND'
-        }
+    def compile_class(self):
+        """
+        Compiles a complete class: parses it, runs the passes over it, and
+        writes its VM code. Returns its syntax tree.
+        """
+        node = self.parse_class()
+        for run in self.passes:
+            node = run(node)
 
-        self.verbal_unary = {
-            '~': 'NOT',
-            '-': 'NEG'
-        }
+        CodeGenerator(self.vm_writer, self.classname).compile(node)
+        self.vm_writer.close()
+        return node
 
-    def compile_class(self):
+    def parse_class(self):
         """
-        Compiles a complete class.
+        Parses a complete class.
         """
         if not self.tokenizer.has_more_tokens():
             raise SyntaxError('No tokens available to compile.')
@@ -68,130 +67,92 @@ class CompilationEngine:
         self.tokenizer.advance()
 
         self.process('class')
-        self.get_token() # class name
+        name = self.get_token() # class name
         self.process('{')
 
         # Reached a variable declaration or a subroutine,
         # there might be more than one.
+        class_vars = []
         while self.tokenizer.current_token in self.class_var_dec:
-            self.compile_class_var_dec()
+            class_vars.append(self.parse_var_dec())
 
-        # Keep on writing subroutines until end of class.
+        # Keep on parsing subroutines until end of class.
+        subroutines = []
         while self.tokenizer.current_token in self.subroutines:
-            self.compile_subroutine_dec()
+            subroutines.append(self.parse_subroutine_dec())
 
         # Validates the closing bracket of a class.
         self.process('}')
-        self.vm_writer.close()
+        return Class(name, class_vars, subroutines)
 
-    def compile_class_var_dec(self):
+    def parse_var_dec(self):
         """
-        Compiles a static variable declaration, or a field declaration.
+        Parses a static variable declaration, a field declaration or a var
+        declaration.
         """
         kind = self.get_token()
         type = self.get_token()
 
         # Iterate tokens until reaching a command break (';').
+        names = []
         while self.tokenizer.current_token != ';':
-            name = self.get_token()
-            self.symbol_table.define(name, type, kind)
-
+            names.append(self.get_token())
             if self.tokenizer.current_token == ',':
-                self.process()
+                self.process(',')
 
         self.process(';')
+        return VarDec(kind, type, names)
 
-    def compile_subroutine_dec(self):
+    def parse_subroutine_dec(self):
         """
-        Compiles a complete method, function, or constructor.
+        Parses a complete method, function, or constructor.
         """
-        self.current_fn_type = self.get_token() # static function, method or constructor.
-        self.current_fn_return = self.get_token() # void or type.
-        self.current_fn_name = self.get_token() # name of the subroutine.
-
-        # Reset symbol table for current scope.
-        self.symbol_table.start_subroutine()
-
-        if self.current_fn_type == 'method':
-            # The type of 'this' is the class name (for exmaple, 'Point').
-            self.symbol_table.define('this', self.classname, 'arg')
+        kind = self.get_token() # static function, method or constructor.
+        return_type = self.get_token() # void or type.
+        name = self.get_token() # name of the subroutine.
 
         # Parameters list, e.g, (int Ax, int Ay, int Asize)
         self.process('(')
-        self.compile_parameter_list()
+        parameters = self.parse_parameter_list()
         self.process(')')
 
-        # Subroutine body
-        self.compile_subroutine_body()
-
-    def compile_parameter_list(self):
-        """
-        Compiles a (possibly empty) parameter list.
-        """
-        while self.tokenizer.current_token != ')':
-            type = self.get_token()
-            name = self.get_token()
-            self.symbol_table.define(name, type, 'arg')
-
-            if self.tokenizer.current_token == ',':
-                self.process()
-
-    def compile_subroutine_body(self):
-        """
-        Compiles a subroutine's body.
-        """
+        # Subroutine body, with its variable declarations first.
         self.process('{')
-
-        # Before proceeding to the routine's statements,
-        # check if there are any variable declarations.
-        while self.tokenizer.current_token not in self.statements:
-            self.compile_var_dec()
-
-        # Ouput the subroutine's declaration VM code.
-        subroutine_name = '{}.{}'.format(self.classname, self.current_fn_name)
-        nlocals = self.symbol_table.var_count('var')
-        self.vm_writer.write_function(subroutine_name, nlocals)
-
-        # Constructors require allocating memory to object fields.
-        if self.current_fn_type == 'constructor':
-            nargs = self.symbol_table.var_count('field')
-            self.vm_writer.write_push('constant', nargs)
-            self.vm_writer.write_call('Memory.alloc', 1)
-            self.vm_writer.write_pop('pointer', 0)
-
-        # THIS = argument 0 for class methods.
-        if self.current_fn_type == 'method':
-            self.vm_writer.write_push('argument', 0)
-            self.vm_writer.write_pop('pointer', 0)
+        var_decs = []
+        while self.tokenizer.current_token == 'var':
+            var_decs.append(self.parse_var_dec())
 
         # The subroutine body contains statements. For example,
         # let x = Ax;   let statement
         # do draw();    do statement
         # return x;     return statement
-        self.compile_statements()
-
+        statements = self.parse_statements()
         self.process('}')
 
-    def compile_var_dec(self):
+        return Subroutine(kind, return_type, name, parameters, var_decs,
+            statements)
+
+    def parse_parameter_list(self):
         """
-        Compiles a var declaration.
+        Parses a (possibly empty) parameter list, as (type, name) pairs.
         """
-        kind = self.get_token()
-        type = self.get_token()
-
-        while self.tokenizer.current_token != ';':
+        parameters = []
+        while self.tokenizer.current_token != ')':
+            type = self.get_token()
             name = self.get_token()
-            self.symbol_table.define(name, type, kind)
+            parameters.append((type, name))
+
             if self.tokenizer.current_token == ',':
-                self.process(',')
+                self.process()
 
-        self.process(';')
+        return parameters
 
-    def compile_statements(self):
+    def parse_statements(self):
         """
-        Compiles a sequence of statements.
+        Parses a sequence of statements.
         """
-        # Write statements until ending closing bracket of parent subroutine.
+        # Parse statements until the closing bracket of their block.
+        statements = []
         while self.tokenizer.current_token != '}':
             # Explicitly validate statement
             statement = self.get_token()
@@ -199,182 +160,124 @@ class CompilationEngine:
                 s = ', '.join(self.statements)
                 raise SyntaxError('Statement should start with one of ' + s)
 
-            # Compile full statement.
-            method = getattr(self, 'compile_' + statement)
-            method()
+            # Parse full statement.
+            method = getattr(self, 'parse_' + statement)
+            statements.append(method())
 
-    def compile_let(self):
+        return statements
+
+    def parse_let(self):
         """
-        Compiles a let statement.
+        Parses a let statement.
         """
         if self.tokenizer.current_type != 'IDENTIFIER':
             raise SyntaxError('Let statement must proceed with an identifier.')
 
-        identifier = self.get_token()
-        index = self.get_index(identifier)
-        segment = self.get_kind(identifier)
+        name = self.get_token()
 
         # Placement might be an array entring.
+        index = None
         if self.tokenizer.current_token == '[':
-            self.compile_array_entry()
-
-            self.vm_writer.write_push(segment, index)
-            self.vm_writer.write_arithmetic('ADD')
-            self.vm_writer.write_pop('TEMP', 0)
-
-            self.process('=')
-            self.compile_expression()
-
-            self.vm_writer.write_push('TEMP', 0)
-            self.vm_writer.write_pop('POINTER', 1)
-            self.vm_writer.write_pop('THAT', 0)
-        else:
-            # Regular assignment.
-            self.process('=')
-            self.compile_expression()
-            self.vm_writer.write_pop(segment, index)
+            index = self.parse_array_entry()
 
+        self.process('=')
+        value = self.parse_expression()
         self.process(';')
 
+        return Let(name, index, value)
 
-    def compile_do(self):
+    def parse_do(self):
         """
-        Compiles a do statement.
+        Parses a do statement.
         """
-        self.compile_subroutine_invoke()
-        self.vm_writer.write_pop('TEMP', 0)
+        call = self.parse_subroutine_invoke()
         self.process(';') # end of do statement.
+        return Do(call)
 
-    def compile_subroutine_invoke(self):
+    def parse_subroutine_invoke(self):
         """
-        Compiles a subroutine invokation.
+        Parses a subroutine invokation.
         """
         identifier = self.get_token()
-        args_count = 0
+        receiver = None
 
-        # Either a static (outer) class funciton or an instance function call.
+        # Either a class (or instance) function call or a local method call.
         if self.tokenizer.current_token == '.':
             self.process('.')
-            subroutine_name = self.get_token()
-
-            inst_type = self.symbol_table.type_of(identifier)
-            if inst_type:
-                # It's an instance.
-                inst_kind = self.get_kind(identifier)
-                inst_indx = self.get_index(identifier)
-
-                self.vm_writer.write_push(inst_kind, inst_indx)
-                fn_name = '{}.{}'.format(inst_type, subroutine_name)
-
-                args_count += 1 # Pass 'this' as an argument.
-            else: # Static function of a class.
-                fn_name = '{}.{}'.format(identifier, subroutine_name)
-
-        else: # Local method call.
-            fn_name = '{}.{}'.format(self.classname, identifier)
-            args_count += 1 # Pass 'this' as an argument.
-            self.vm_writer.write_push('POINTER', 0)
+            receiver = identifier
+            identifier = self.get_token()
 
         self.process('(')
-        args_count += self.compile_expression_list()
+        args = self.parse_expression_list()
         self.process(')')
-        self.vm_writer.write_call(fn_name, args_count)
 
-    def compile_if(self):
+        return Call(receiver, identifier, args)
+
+    def parse_if(self):
         """
-        Compiles an if statement, possibly with a trailing else clause.
+        Parses an if statement, possibly with a trailing else clause.
         """
         self.process('(')
-        self.compile_expression() # E.g., x > 2
-        self.vm_writer.write_arithmetic('NOT')
+        condition = self.parse_expression() # E.g., x > 2
         self.process(')') # End of if condition statement.
 
         # if statement body
         self.process('{')
-
-        idx = self.if_idx
-        self.if_idx += 1
-        label_false = '{}.if_false.{}'.format(self.current_fn_name, idx)
-        label_proceed = '{}.{}'.format(self.current_fn_name, idx)
-
-        self.vm_writer.write_if(label_false)
-
-        self.compile_statements()
-
-        self.vm_writer.write_goto(label_proceed)
+        statements = self.parse_statements()
         self.process('}')
 
-        # Lables statements.
-        self.vm_writer.write_label(label_false)
+        else_statements = None
         if self.tokenizer.current_token == 'else':
             # We have a proceeding else.
             self.process('else')
             self.process('{')
-            self.compile_statements()
+            else_statements = self.parse_statements()
             self.process('}')
 
-        self.vm_writer.write_label(label_proceed)
+        return If(condition, statements, else_statements)
 
-    def compile_while(self):
+    def parse_while(self):
         """
-        Compiles a while statement.
+        Parses a while statement.
         """
         self.process('(')
-
-        fn_name = self.current_fn_name
-        idx = self.while_idx
-        self.while_idx += 1
-
-        while_start_label = '{}.while_start.{}'.format(fn_name, idx)
-        while_end_label = '{}.while_end.{}'.format(fn_name, idx)
-
-        self.vm_writer.write_label(while_start_label)
-        self.compile_expression()
-        self.vm_writer.write_arithmetic('NOT')
+        condition = self.parse_expression()
         self.process(')')
 
         # while's body.
         self.process('{')
-        self.vm_writer.write_if(while_end_label)
-        self.compile_statements()
-        self.vm_writer.write_goto(while_start_label)
-        self.vm_writer.write_label(while_end_label)
+        statements = self.parse_statements()
         self.process('}') # We're done
 
-    def compile_return(self):
+        return While(condition, statements)
+
+    def parse_return(self):
         """
-        Compiles a return statement.
+        Parses a return statement.
         """
+        value = None
         if self.tokenizer.current_token != ';':
-            self.compile_expression()
-        else: # Return VOID.
-            self.vm_writer.write_push('CONSTANT', 0)
+            value = self.parse_expression()
 
-        self.vm_writer.write_return()
         self.process(';')
+        return Return(value)
 
-    def compile_expression(self):
+    def parse_expression(self):
         """
-        Compiles an expression.
+        Parses an expression. Jack has no operator precedence, so the
+        operations are grouped from left to right.
         """
-        self.compile_term()
+        node = self.parse_term()
 
         while self.tokenizer.current_token in self.ops:
             op = self.get_token()
-            self.compile_term() # Push is done by compile_term
+            node = Binary(op, node, self.parse_term())
 
-            # Explicitly use Math.multiply or Math.divide.
-            if op == '*':
-                self.vm_writer.write_call('Math.multiply', 2)
-            elif op == '/':
-                self.vm_writer.write_call('Math.divide', 2)
-            else:
-                name = self.verbal_arithemtic.get(op)
-                self.vm_writer.write_arithmetic(name)
+        return node
 
-    def compile_term(self):
+    def parse_term(self):
         """
-        Compiles a term. If the current token is an identifier, the routine
+        Parses a term. If the current token is an identifier, the routine
         must resolve it into a variable, an array entry, or a subroutine
         call. A single lookahead token, which may be [, (, or ., suffices
         to distinguish between the possibilities. Any other token is not
@@ -386,100 +289,47 @@ class CompilationEngine:
 
         if current_token == '(':
             self.process('(')
-            self.compile_expression()
+            node = self.parse_expression()
             self.process(')')
-        elif self.tokenizer.peek() == '[':
-            arr_identifier = self.get_token()
-            self.compile_array_entry()
-
-            index = self.get_index(arr_identifier)
-            segment = self.get_kind(arr_identifier)
-            self.vm_writer.write_push(segment, index)
-            self.vm_writer.write_arithmetic('ADD')
-            self.vm_writer.write_pop('POINTER', 1)
-            self.vm_writer.write_push('THAT', 0)
-
-        elif current_token in self.unary_ops:
-            unary_op = self.get_token()
-            self.compile_term()
-            name = self.verbal_unary.get(unary_op)
-            self.vm_writer.write_arithmetic(name)
-
-        elif self.peek() in ['.', '(']:
-            self.compile_subroutine_invoke()
-
-        elif token_type == 'INT_CONST':
-            self._compile_integer()
-        elif token_type == 'STRING_CONST':
-            self._compile_string()
-        elif token_type == 'KEYWORD':
-            self._compile_keyword()
-        else:
-            self._compile_identifier()
-
-    def _compile_integer(self):
-        """Compiles the current token as an integer."""
-        token = self.get_token()
-        self.vm_writer.write_push('CONSTANT', abs(token))
-        if token < 0:
-            self.vm_writer.write_arithmetic('NEG')
+            return node
 
+        if self.tokenizer.peek() == '[':
+            name = self.get_token()
+            return ArrayRef(name, self.parse_array_entry())
 
-    def _compile_string(self):
-        """Compiles the current token as a string."""
-        current_token = self.tokenizer.current_token
-        self.vm_writer.write_push('CONSTANT', len(current_token))
-        self.vm_writer.write_call('String.new', 1)
-
-        # String assignments are handled using a series of calls
-        # to String.appendChar(c), when c is the integer representing
-        # unicode code point.
-        for c in current_token:
-            self.vm_writer.write_push('CONSTANT', ord(c))
-            self.vm_writer.write_call('String.appendChar', 2)
-
-        self.process() # Finished compiling string.
-
-    def _compile_keyword(self):
-        """Compiles the current token as a keyword."""
-        current_token = self.get_token()
-        if current_token == 'this':
-            self.vm_writer.write_push('POINTER', 0)
-            return
-
-        if current_token == 'true':
-            self.vm_writer.write_push('CONSTANT', 1)
-            self.vm_writer.write_arithmetic('NEG')
-            return
-
-        # null or false.
-        self.vm_writer.write_push('CONSTANT', 0)
-
-    def _compile_identifier(self):
-        """Compiles the current token as an identifier."""
-        current_token = self.get_token()
-        index = self.get_index(current_token)
-        segment = self.get_kind(current_token)
-        self.vm_writer.write_push(segment, index)
+        if current_token in self.unary_ops:
+            op = self.get_token()
+            return Unary(op, self.parse_term())
+
+        if self.peek() in ['.', '(']:
+            return self.parse_subroutine_invoke()
+
+        token = self.get_token()
+        if token_type == 'INT_CONST':
+            return IntConst(token)
+        if token_type == 'STRING_CONST':
+            return StringConst(token)
+        if token_type == 'KEYWORD':
+            return KeywordConst(token)
+
+        return VarRef(token)
 
     def get_current_type(self):
         """Returns the type of the current token."""
         return self.tokenizer.current_type
 
-    def compile_expression_list(self):
+    def parse_expression_list(self):
         """
-        Compiles a (possibly empty) comma- separated list of expressions
-        and returns the number of arguments in this expression list.
+        Parses a (possibly empty) comma- separated list of expressions.
         """
-        args_count = 0
+        expressions = []
         while self.tokenizer.current_token != ')':
-            args_count += 1
-            self.compile_expression()
+            expressions.append(self.parse_expression())
 
             if self.tokenizer.current_token == ',':
                 self.process(',')
 
-        return args_count
+        return expressions
 
     def process(self, string=None):
         """
@@ -491,6 +341,8 @@ class CompilationEngine:
         if string and t != string:
             caller = inspect.stack()[1][3]
             msg = 'Invalid token rasied from {}. Got {} when expected: {}'.format(caller, string, t)
+            msg = '{}:{}:{}: {}'.format(self.tokenizer.filename,
+                self.tokenizer.line, self.tokenizer.column, msg)
             raise SyntaxError(msg)
 
         if self.tokenizer.has_more_tokens():
@@ -509,40 +361,17 @@ class CompilationEngine:
         return token
 
     def peek(self):
-        """Peeks into the toknes deque."""
+        """Peeks at the value of the next token."""
         return self.tokenizer.peek()
 
-    def compile_array_entry(self):
+    def parse_array_entry(self):
         """
-        A helper routine to compile an array entry.
+        A helper routine to parse the index of an array entry.
         """
         self.process('[')
-        self.compile_expression()
+        node = self.parse_expression()
         self.process(']')
-
-    def is_int(self, input):
-        try:
-            input = int(input)
-            return True
-        except ValueError:
-            return None
-
-    def get_kind(self, name):
-        """Returns the kind value of a symbol table value."""
-        segment = self.symbol_table.kind_of(name)
-        segment = segment.lower()
-        if segment == 'field':
-            return 'this'
-        if segment == 'var':
-            return 'local'
-        if segment == 'arg':
-            return 'argument'
-
-        return segment
-
-    def get_index(self, name):
-        """Returns the index value of a symbol table value."""
-        return self.symbol_table.index_of(name)
+        return node
 
     def get_classname(self, filename):
         """Returns the clean class name."""
@@ -0,0 +1,144 @@
+class Node(object):
+    """
+    A node of the syntax tree of a Jack class. Every kind of node declares
+    its fields as its __slots__, and is created with their values in order.
+    """
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, ', '.join(
+            repr(getattr(self, name)) for name in self.__slots__))
+
+
+class Class(Node):
+    """A class: its variable declarations and its subroutines."""
+    __slots__ = ('name', 'class_vars', 'subroutines')
+
+
+class VarDec(Node):
+    """A declaration of variables (static, field or var) of a type."""
+    __slots__ = ('kind', 'type', 'names')
+
+
+class Subroutine(Node):
+    """
+    A constructor, function or method. Its parameters are (type, name)
+    pairs.
+    """
+    __slots__ = ('kind', 'return_type', 'name', 'parameters', 'var_decs',
+        'statements')
+
+
+# Statements.
+
+class Let(Node):
+    """Assigns a value to a variable, or to an array entry (by index)."""
+    __slots__ = ('name', 'index', 'value')
+
+
+class If(Node):
+    """An if statement, whose else statements may be None."""
+    __slots__ = ('condition', 'statements', 'else_statements')
+
+
+class While(Node):
+    __slots__ = ('condition', 'statements')
+
+
+class Do(Node):
+    __slots__ = ('call',)
+
+
+class Return(Node):
+    """Returns a value, or None from a void subroutine."""
+    __slots__ = ('value',)
+
+
+# Expressions.
+
+class IntConst(Node):
+    __slots__ = ('value',)
+
+
+class StringConst(Node):
+    __slots__ = ('value',)
+
+
+class KeywordConst(Node):
+    """One of true, false, null and this."""
+    __slots__ = ('value',)
+
+
+class PooledString(Node):
+    """
+    A string literal that's built once, into a static variable of its
+    class named by name(). Made by passes only.
+    """
+    __slots__ = ('value',)
+
+    def name(self):
+        return '"{}"'.format(self.value)
+
+
+class VarRef(Node):
+    __slots__ = ('name',)
+
+
+class ArrayRef(Node):
+    __slots__ = ('name', 'index')
+
+
+class Call(Node):
+    """
+    A subroutine call, like receiver.name(args). The receiver is a class
+    or a variable, or None for a method of the current object.
+    """
+    __slots__ = ('receiver', 'name', 'args')
+
+
+class Unary(Node):
+    __slots__ = ('op', 'operand')
+
+
+class Binary(Node):
+    __slots__ = ('op', 'left', 'right')
+
+
+class With(Node):
+    """
+    Evaluates a value into an entry of the temp segment, and then the body
+    expression, which reads it back by Temp nodes. Made by passes only.
+    """
+    __slots__ = ('index', 'value', 'body')
+
+
+class Temp(Node):
+    """Reads an entry of the temp segment."""
+    __slots__ = ('index',)
+
+
+class Transformer(object):
+    """
+    A pass over the syntax tree of a class, that may replace its nodes.
+    The children of a node are visited first, and then the node itself is
+    given to the visit_<node class> method of the pass, if it has one,
+    which returns the node to replace it with (or the node itself).
+    """
+    def __call__(self, node):
+        return self.visit(node)
+
+    def visit(self, node):
+        for name in node.__slots__:
+            value = getattr(node, name)
+            if isinstance(value, Node):
+                setattr(node, name, self.visit(value))
+            elif isinstance(value, list):
+                setattr(node, name, [self.visit(item)
+                    if isinstance(item, Node) else item for item in value])
+
+        method = getattr(self, 'visit_' + node.__class__.__name__, None)
+        return method(node) if method is not None else node
@@ -0,0 +1,336 @@
+from nodes import (Transformer, VarDec, IntConst, StringConst, KeywordConst,
+    VarRef, Call, Unary, Binary, With, Temp, PooledString, Node)
+
+def wrap(value):
+    """Returns the given integer as a 16-bit two's complement value."""
+    return ((value + 0x8000) & 0xFFFF) - 0x8000
+
+
+def constant(node):
+    """
+    Returns the value of the given expression if it's a constant (an
+    integer, true, false or null), or None.
+    """
+    if isinstance(node, IntConst):
+        return node.value
+    if isinstance(node, KeywordConst) and node.value != 'this':
+        return -1 if node.value == 'true' else 0
+    return None
+
+
+def is_pure(node):
+    """
+    Returns whether evaluating the given expression has no effects, so its
+    code may be left out. Only subroutine calls have effects.
+    """
+    if isinstance(node, Call):
+        return False
+
+    for name in node.__slots__:
+        value = getattr(node, name)
+        if isinstance(value, Node) and not is_pure(value):
+            return False
+
+    return True
+
+
+# The binary operations, on 16-bit two's complement values. Comparisons
+# are true (-1) or false (0). Division is only computed for non negative
+# operands, as Math.divide would (None leaves it to run time).
+operations = {
+    '+': lambda x, y: wrap(x + y),
+    '-': lambda x, y: wrap(x - y),
+    '*': lambda x, y: wrap(x * y),
+    '/': lambda x, y: x // y if x >= 0 and y > 0 else None,
+    '&': lambda x, y: x & y,
+    '|': lambda x, y: x | y,
+    '<': lambda x, y: -1 if x < y else 0,
+    '>': lambda x, y: -1 if x > y else 0,
+    '=': lambda x, y: -1 if x == y else 0
+}
+
+unary_operations = {
+    '-': lambda x: wrap(-x),
+    '~': lambda x: ~x
+}
+
+# The operations whose operands may be grouped in any order, so the
+# constants of a chain of them (like x + 2 + 3) are folded together.
+associative = frozenset(['+', '*', '&', '|'])
+
+
+class Pass(Transformer):
+    """
+    An optimization of the syntax tree of a class, that counts the changes
+    it made. Its report is summed over all the compiled classes, and
+    described by its summary.
+    """
+    summary = 'Made {count} changes'
+
+    def __init__(self):
+        self.count = 0
+
+    def report(self):
+        """
+        Returns the counts of the pass, by name, summed over the classes
+        (numbers are added, lists are joined).
+        """
+        return {'count': self.count}
+
+    @classmethod
+    def describe(cls, totals):
+        """Returns the lines that describe the given totals of reports."""
+        return [cls.summary.format(**totals)]
+
+
+class FoldConstants(Pass):
+    """
+    Evaluates the operations of constant expressions at compile time, and
+    simplifies the operations whose result is known from one operand (like
+    x + 0, x * 1 or x & 0). Counts the operations it removed.
+    """
+    summary = 'Folded {count} constant operations'
+
+    def fold(self, value):
+        self.count += 1
+        return IntConst(value)
+
+    def visit_Unary(self, node):
+        value = constant(node.operand)
+        if value is not None:
+            return self.fold(unary_operations[node.op](value))
+
+        # -(-x) and ~(~x) are x.
+        if isinstance(node.operand, Unary) and node.operand.op == node.op:
+            self.count += 2
+            return node.operand.operand
+
+        return node
+
+    def visit_Binary(self, node):
+        op = node.op
+        left = constant(node.left)
+        right = constant(node.right)
+
+        if left is not None and right is not None:
+            value = operations[op](left, right)
+            if value is not None:
+                return self.fold(value)
+            return node
+
+        # 0 - x is -x.
+        if op == '-' and left == 0:
+            self.count += 1
+            return Unary('-', node.right)
+
+        # Constants are kept on the right of the operations whose operands
+        # may be swapped.
+        if left is not None and op in associative:
+            node = Binary(op, node.right, node.left)
+            left, right = right, left
+
+        if right is None:
+            return node
+
+        # (x op a) op b is x op (a op b).
+        inner = node.left
+        if op in associative and isinstance(inner, Binary) and \
+                inner.op == op and constant(inner.right) is not None:
+            self.count += 1
+            return self.visit_Binary(Binary(op, inner.left,
+                IntConst(operations[op](constant(inner.right), right))))
+
+        return self.simplify(node, right)
+
+    def simplify(self, node, right):
+        """
+        Simplifies an operation whose right operand is the given constant,
+        and whose left one isn't.
+        """
+        op = node.op
+        x = node.left
+
+        # x + 0, x - 0, x * 1, x / 1, x | 0 and x & -1 are x.
+        if (op in ['+', '-', '|'] and right == 0) or \
+                (op in ['*', '/'] and right == 1) or \
+                (op == '&' and right == -1):
+            self.count += 1
+            return x
+
+        # x * -1 is -x.
+        if op == '*' and right == -1:
+            self.count += 1
+            return Unary('-', x)
+
+        # x * 0 and x & 0 are 0, and x | -1 is -1, if x can be left out.
+        if is_pure(x) and ((op in ['*', '&'] and right == 0) or
+                (op == '|' and right == -1)):
+            return self.fold(right)
+
+        return node
+
+
+class ReduceStrength(Pass):
+    """
+    Replaces multiplications by constants of up to MAX_BITS one bits, and
+    divisions by powers of two, with inline sequences of additions and
+    bitwise operations, instead of calls to Math.multiply and Math.divide.
+
+    The VM has no way to duplicate or shift a value, so the operand is kept
+    in temp 1, and doubled by adding it to itself (through temp 2 once it's
+    no longer a variable). Temp 0 is left for let and do statements.
+    """
+    summary = 'Reduced {count} multiplications and divisions'
+
+    MAX_BITS = 3
+
+    def visit_Binary(self, node):
+        left = constant(node.left)
+        right = constant(node.right)
+
+        if node.op == '*' and right is not None and left is None:
+            return self.multiply(node, node.left, right)
+        if node.op == '*' and left is not None and right is None:
+            return self.multiply(node, node.right, left)
+
+        # Math.divide truncates, so does the inline division, for divisors
+        # that are powers of two.
+        if node.op == '/' and left is None and right is not None and \
+                right > 1 and right & (right - 1) == 0:
+            self.count += 1
+            return self.divide(node.left, right.bit_length() - 1)
+
+        return node
+
+    def multiply(self, node, x, factor):
+        """
+        Returns the sequence of x * factor, or the given node for factors
+        that aren't worth it.
+        """
+        magnitude = abs(factor)
+        if magnitude < 2 or magnitude > 0x7FFF or \
+                bin(magnitude).count('1') > self.MAX_BITS:
+            return node
+
+        self.count += 1
+
+        # A variable is read again, anything else is kept in temp 1.
+        operand = x if isinstance(x, VarRef) else Temp(1)
+
+        # The bits of the factor from the highest: every bit doubles the
+        # product so far, and a one bit adds the operand.
+        product = operand
+        for bit in bin(magnitude)[3:]:
+            product = self.double(product)
+            if bit == '1':
+                product = Binary('+', product, operand)
+
+        if factor < 0:
+            product = Unary('-', product)
+        return product if operand is x else With(1, x, product)
+
+    def double(self, value):
+        """Returns the sequence of the given value, doubled."""
+        if isinstance(value, (VarRef, Temp)):
+            return Binary('+', value, value)
+        return With(2, value, Binary('+', Temp(2), Temp(2)))
+
+    def divide(self, x, shift):
+        """
+        Returns the sequence of x / 2^shift, truncated toward zero: the
+        bits of |x| from the shift on are moved down one at a time (as
+        (|x| & 2^i > 0) & 2^(i - shift)), and the sign of x is put back.
+        Temp 1 holds the operand, and temp 2 whether it's negative.
+        """
+        def negate_if_negative(value):
+            # (v & ~negative) | (-v & negative)
+            return Binary('|',
+                Binary('&', value, Unary('~', Temp(2))),
+                Binary('&', Unary('-', value), Temp(2)))
+
+        quotient = None
+        for bit in range(shift, 16):
+            if bit == 15:
+                # The sign bit, set only in |-32768|.
+                test = Binary('<', Binary('&', Temp(1), IntConst(-0x8000)),
+                    IntConst(0))
+            else:
+                test = Binary('>', Binary('&', Temp(1), IntConst(1 << bit)),
+                    IntConst(0))
+
+            term = Binary('&', test, IntConst(1 << (bit - shift)))
+            quotient = term if quotient is None else \
+                Binary('+', quotient, term)
+
+        return With(1, x,
+            With(2, Binary('<', Temp(1), IntConst(0)),
+                With(1, negate_if_negative(Temp(1)),
+                    With(1, quotient, negate_if_negative(Temp(1))))))
+
+
+class PoolStrings(Pass):
+    """
+    Builds every distinct string literal of a class once: the literal is
+    kept in a static variable of the class (named by the quoted literal,
+    which no identifier can be), that's built on its first evaluation, and
+    read on the next ones. The strings are shared by all the uses of the
+    literal, so programs that modify (or dispose) their literals must not
+    pool them.
+
+    Counts the pooled uses, and the bytes of characters that aren't
+    allocated again every time all the uses are evaluated.
+    """
+    summary = 'Pooled {literals} string literals ({count} uses), saving ' + \
+        '{bytes} bytes of heap every time the uses are evaluated'
+
+    def __init__(self):
+        Pass.__init__(self)
+        self.classname = None
+        self.literals = []
+        self.uses = {}
+
+    def __call__(self, node):
+        self.classname = node.name
+        node = self.visit(node)
+        if self.literals:
+            node.class_vars.append(VarDec('static', 'String',
+                [PooledString(value).name() for value in self.literals]))
+        return node
+
+    def visit_StringConst(self, node):
+        if node.value not in self.uses:
+            self.literals.append(node.value)
+            self.uses[node.value] = 0
+
+        self.uses[node.value] += 1
+        self.count += 1
+        return PooledString(node.value)
+
+    def report(self):
+        return {
+            'count': self.count,
+            'literals': len(self.literals),
+            'bytes': sum(2 * len(value) * self.uses[value]
+                for value in self.literals),
+            'pooled': [(self.classname, value, self.uses[value])
+                for value in self.literals]
+        }
+
+    @classmethod
+    def describe(cls, totals):
+        lines = super(PoolStrings, cls).describe(totals)
+        for classname, value, uses in totals['pooled']:
+            lines.append('    {}: "{}" x{}'.format(classname, value, uses))
+        return lines
+
+
+# The optimizations that can be selected for the compiler, by name.
+optimizations = {
+    'fold': FoldConstants,
+    'strength': ReduceStrength,
+    'strings': PoolStrings
+}
+
+# The optimizations selected by 'all'. Pooling strings changes programs
+# that modify their literals, so it's only run when it's named.
+default = ['fold', 'strength']
@@ -1,5 +1,236 @@
+import os
 import re
-from collections import deque
+import hashlib
+import marshal
+from array import array
+
+# The version of the lexer and of its token streams, as cached on disk
+# (see load_tokens). Cached streams of other versions are never read.
+VERSION = 1
+
+# Defines the symbols characters as part of the Jack langauge.
+SYMBOLS = frozenset([
+    '{', '}', '(', ')', '[', ']',
+    '.', ',', ';', '+', '-',
+    '*', '/', '&', '|', '<',
+    '>', '=', '~'
+])
+
+# Defines the saved keywords as part of the Jack langauge, and their
+# constants (as returned by JackTokenizer.keyword).
+keywords = {
+    'class': 'CLASS',
+    'constructor': 'CONSTRUCTOR',
+    'function': 'FUNCTION',
+    'method': 'METHOD',
+    'field': 'FIELD',
+    'static': 'STATIC',
+    'var': 'VAR',
+    'int': 'INT',
+    'char': 'CHAR',
+    'boolean': 'BOOLEAN',
+    'void': 'VOID',
+    'true': 'TRUE',
+    'false': 'FALSE',
+    'null': 'NULL',
+    'this': 'THIS',
+    'let': 'LET',
+    'do': 'DO',
+    'if': 'IF',
+    'else': 'ELSE',
+    'while': 'WHILE',
+    'return': 'RETURN'
+}
+KEYWORDS = frozenset(keywords)
+
+# The types of tokens, by their codes in a token stream.
+token_types = ['KEYWORD', 'SYMBOL', 'IDENTIFIER', 'INT_CONST', 'STRING_CONST']
+type_codes = dict((name, code) for code, name in enumerate(token_types))
+
+# The master pattern of the lexer: a single alternation of every kind of
+# lexeme, so the whole file is scanned once. Comments and white space are
+# matched as well, and skipped; anything else is a character that can't
+# start a Jack token.
+token_re = re.compile(r'''
+      (?P<COMMENT>//[^\n]*|/\*.*?\*/)
+    | (?P<SPACE>\s+)
+    | (?P<INT_CONST>\d+)
+    | (?P<STRING_CONST>"[^"\n]*")
+    | (?P<WORD>[A-Za-z_]\w*)
+    | (?P<SYMBOL>[{}()\[\].,;+\-*/&|<>=~])
+    | (?P<INVALID>.)
+''', re.S | re.X)
+
+
+class TokenStream:
+    """
+    The tokens of a Jack file, in parallel arrays: the code of the type of
+    every token (see token_types), the index of its value in the values
+    table, where every distinct value is kept once, and its line and column.
+    """
+    def __init__(self):
+        self.types = array('B')
+        self.indices = array('I')
+        self.lines = array('I')
+        self.columns = array('I')
+
+        self.values = []
+        self.value_index = {}
+
+    def __len__(self):
+        return len(self.types)
+
+    def append(self, type, value, line, column):
+        """Adds a token (of the given type name) to the stream."""
+        idx = self.value_index.get(value)
+        if idx is None:
+            idx = self.value_index[value] = len(self.values)
+            self.values.append(value)
+
+        self.types.append(type_codes[type])
+        self.indices.append(idx)
+        self.lines.append(line)
+        self.columns.append(column)
+
+    def dump(self):
+        """Returns the stream as a tuple of strings, for marshal."""
+        return (self.types.tostring(), self.indices.tostring(),
+            self.lines.tostring(), self.columns.tostring(), self.values)
+
+    @classmethod
+    def load(cls, data):
+        """Returns the stream of the given dump."""
+        stream = cls()
+        types, indices, lines, columns, stream.values = data
+        stream.types.fromstring(types)
+        stream.indices.fromstring(indices)
+        stream.lines.fromstring(lines)
+        stream.columns.fromstring(columns)
+        stream.value_index = dict((value, idx) for idx, value in
+            enumerate(stream.values))
+        return stream
+
+    def type(self, idx):
+        """Returns the type name of the token at the given index."""
+        return token_types[self.types[idx]]
+
+    def value(self, idx):
+        """Returns the value of the token at the given index."""
+        return self.values[self.indices[idx]]
+
+
+class Cursor:
+    """
+    A position in a token stream: the index of the next token to read.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.pos = 0
+
+    def has_more(self):
+        return self.pos < len(self.stream)
+
+    def next(self):
+        """
+        Returns the next token, as a (type, value, line, column) tuple, and
+        moves past it.
+        """
+        stream = self.stream
+        idx = self.pos
+        self.pos += 1
+        return (token_types[stream.types[idx]],
+            stream.values[stream.indices[idx]], stream.lines[idx],
+            stream.columns[idx])
+
+    def peek(self, k=0):
+        """
+        Returns the value of the token k tokens past the next one, or None
+        past the end of the stream.
+        """
+        idx = self.pos + k
+        if idx >= len(self.stream):
+            return None
+        return self.stream.value(idx)
+
+    def peek_type(self, k=0):
+        """Returns the type of the token k tokens past the next one."""
+        idx = self.pos + k
+        if idx >= len(self.stream):
+            return None
+        return self.stream.type(idx)
+
+
+def tokenize(data, filename='<string>'):
+    """
+    Scans the given Jack source once, and returns its tokens as a
+    TokenStream. The value of an INT_CONST is an integer, and the value of
+    a STRING_CONST has no double quotes.
+    """
+    tokens = TokenStream()
+    line = 1
+    line_start = 0
+
+    for match in token_re.finditer(data):
+        kind = match.lastgroup
+        value = match.group(kind)
+        start = match.start()
+
+        if kind in ['COMMENT', 'SPACE']:
+            # Keep track of the lines the skipped text spans.
+            newlines = value.count('\n')
+            if newlines:
+                line += newlines
+                line_start = start + value.rindex('\n') + 1
+            continue
+
+        if kind == 'WORD':
+            kind = 'KEYWORD' if value in KEYWORDS else 'IDENTIFIER'
+        elif kind == 'INT_CONST':
+            value = int(value)
+        elif kind == 'STRING_CONST':
+            value = value[1:-1]
+        elif kind == 'INVALID':
+            message = 'Invalid Jack string.' if value == '"' else \
+                'Invalid character {!r}.'.format(value)
+            raise SyntaxError('{}:{}:{}: {}'.format(filename, line,
+                start - line_start + 1, message))
+
+        tokens.append(kind, value, line, start - line_start + 1)
+
+    return tokens
+
+
+def load_tokens(filename, cache_dir=None):
+    """
+    Returns the token stream of the given Jack file. If given a cache
+    directory, the stream is kept there by the hash of the file and the
+    version of the lexer, so an unchanged file isn't scanned again.
+    """
+    with open(filename, 'r') as f:
+        data = f.read()
+
+    if cache_dir is None:
+        return tokenize(data, filename)
+
+    digest = hashlib.sha1('{}\0{}'.format(VERSION, data)).hexdigest()
+    path = os.path.join(cache_dir, digest + '.tokens')
+    if os.path.isfile(path):
+        with open(path, 'rb') as f:
+            return TokenStream.load(marshal.load(f))
+
+    tokens = tokenize(data, filename)
+
+    # The file is written in full before it's renamed, so it's never read
+    # half written.
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    temp = '{}.{}'.format(path, os.getpid())
+    with open(temp, 'wb') as f:
+        marshal.dump(tokens.dump(), f)
+    os.rename(temp, path)
+
+    return tokens
+
 
 class JackTokenizer:
     """
@@ -7,100 +238,37 @@ class JackTokenizer:
     accessing the input one token at a time. Also, parses and provides
     the type of each token, as defined by the Jack grammar.
     """
-    def __init__(self, filename):
+    def __init__(self, filename, cache_dir=None):
         self.filename = filename
+        self.cache_dir = cache_dir
         self.current_token = None
         self.current_type = None
 
-        # Defines a deque collection of all the tokens
-        # of the given jack file.
+        # The position (line and column) of the current token.
+        self.line = None
+        self.column = None
+
+        # Defines the stream of all the tokens of the given jack file,
+        # and the cursor reading it.
         self.tokens = self.init()
+        self.cursor = Cursor(self.tokens)
 
-        # Defines the symbols characters as part of the Jack langauge.
-        self.symbols = [
-            '{', '}', '(', ')', '[', ']',
-            '.', ',', ';', '+', '-',
-            '*', '/', '&', '|', '<',
-            '>', '=', '~'
-        ]
-
-        # Defines the saved keywords as part of the Jack langauge.
-        self.keywords = {
-            'class': 'CLASS',
-            'constructor': 'CONSTRUCTOR',
-            'function': 'FUNCTION',
-            'method': 'METHOD',
-            'field': 'FIELD',
-            'static': 'STATIC',
-            'var': 'VAR',
-            'int': 'INT',
-            'char': 'CHAR',
-            'boolean': 'BOOLEAN',
-            'void': 'VOID',
-            'true': 'TRUE',
-            'false': 'FALSE',
-            'null': 'NULL',
-            'this': 'THIS',
-            'let': 'LET',
-            'do': 'DO',
-            'if': 'IF',
-            'else': 'ELSE',
-            'while': 'WHILE',
-            'return': 'RETURN'
-        }
+        self.symbols = SYMBOLS
+        self.keywords = keywords
 
     def init(self):
         """
-        Opens the associated jack file and marches through the text
-        to filter out comments, white space and new lines.
-        Returns a collections.deque object for simplicty as later used.
+        Opens the associated jack file and scans it to its final tokens
+        (see tokenize), or reads them from the cache directory if given
+        one. Returns a TokenStream object.
         """
-        with open(self.filename, 'r') as f:
-            data = f.read()
-
-        # Remove API comments (/** some comment here.. */)
-        data = re.sub('(/\*{2,}(\n|.*?)*?\*/)*', '', data)
-
-        data = data.split('\n') # Split by new line
-        data = [l.strip() for l in data] # Strip white space
-        data = [l.split('//')[0] for l in data ] # Remove inline comments
-
-        # We have filtered all the lines of the file to just code.
-        # Now, make a final tokens array - seperated as words.
-        tokens = []
-        for line in data:
-            if not line:
-                continue
-
-            # Handle strings - shouldn't be seperated by white space.
-            if '"' not in line:
-                tokens.extend(line.split())
-                continue
-
-            # Current line includes a string.
-            try:
-                start_idx, end_idx = (m.start() for m in \
-                    re.finditer(r'"', line))
-
-                if line[:start_idx]:
-                    tokens.extend(line[:start_idx].split())
-
-                # The string itself.
-                tokens.append(line[start_idx:end_idx + 1])
-
-                if line[end_idx + 1:]:
-                    tokens.extend(line[end_idx + 1:].split())
-
-            except ValueError:
-                raise SyntaxError('Invalid Jack string.')
-
-        return deque(tokens)
+        return load_tokens(self.filename, self.cache_dir)
 
     def has_more_tokens(self):
         """
         Are there any more tokens in the input?
         """
-        return len(self.tokens) > 0
+        return self.cursor.has_more()
 
     def advance(self):
         """
@@ -111,156 +279,63 @@ class JackTokenizer:
             print "No more tokens."
             return
 
-        self.current_token = self.tokens.popleft()
-        self.current_type = self.token_type()
+        self.current_type, self.current_token, self.line, self.column = \
+            self.cursor.next()
 
     def token_type(self):
         """
         Returns the type of the current token, as a constant.
-        Since the type might be ambiguous for expressions like
-        field int x,y; We might need to further seperate.
         """
-        token = self.current_token
-
-        # String constans.
-        if token[0] == '"':
-            self.current_token = self.string_val()
-            return 'STRING_CONST'
-
-        if token in self.keywords:
-            self.current_token = token
-            return 'KEYWORD'
-
-        # Int constants.
-        int_val = self.int_val()
-        if int_val is not None: # Integer might be zero.
-            self.current_token = int_val
-            return 'INT_CONST'
-
-        # Symbols.
-        if token[0] in self.symbols:
-            self.current_token = self.symbol()
-            return 'SYMBOL'
-
-        # Identifiers.
-        self.current_token = self.identifier()
-        # As the whole token might be an expression like:
-        # Memory.deAlloc(this), and thus seperated at some stage
-        # to 'this)', it wasn't recognized as a keyword.
-        return 'KEYWORD' if self.current_token in self.keywords else 'IDENTIFIER'
+        return self.current_type
 
     def keyword(self):
         """
         Returns the keyword which is the current token, as a constant.
         """
-        token = self.current_token
-        if (token not in self.keywords):
+        if self.current_type != 'KEYWORD':
             raise TypeError('Current token is not a keyword.')
 
-        return self.keywords.get(token)
+        return self.keywords.get(self.current_token)
 
     def symbol(self):
         """
         Returns the character which is the current symbol token.
         """
-        token = self.current_token
-        if (token[0] not in self.symbols):
+        if self.current_type != 'SYMBOL':
             raise TypeError('Current token is not a symbol.')
 
-        # Support a sequence of tokens, for example "field int x ,y;".
-        # Our token might be ,y; and needs to be seperated.
-        if len(token) > 1:
-            self.tokens.appendleft(token[1:])
-            token = token[0]
-
-        return token
+        return self.current_token
 
     def identifier(self):
         """
         Returns the string which is the current identifier token.
         """
-        # We need to check for trailing symbol, for exmaple in case
-        # when we declare field int x, y;
-        token = self.current_token
-        for idx, el in enumerate(token):
-            if el in self.symbols:
-                # Current identifier reached it's last char.
-                self.tokens.appendleft(token[idx:])
-                token = token[:idx]
-                break
-
-        return token
+        if self.current_type != 'IDENTIFIER':
+            raise TypeError('Current token is not an identifier.')
+
+        return self.current_token
 
     def int_val(self):
         """
         Returns the integer value of the current token.
         """
-        token = self.current_token
-
-        sign = None
-        if token[0] == '-':
-            sign = True
-            token = token[1:]
+        if self.current_type != 'INT_CONST':
+            raise TypeError('Current token is not an integer.')
 
-        if not token or not token[0].isdigit():
-            return None
-
-        # We have a digit token, potentially, but we need
-        # to verify it or find trailing symbols.
-        integer = None
-        for idx, el in enumerate(token):
-            if not el.isdigit() or el in self.symbols:
-                integer = int(token[:idx])
-                self.tokens.appendleft(token[idx:])
-                break
-            else:
-                integer = int(token[:idx + 1])
-
-        if sign:
-            integer = -1 * integer
-        return integer
+        return self.current_token
 
     def string_val(self):
         """
         Returns the string value of the current token, without the
         opening and closing double quotes.
         """
-        token = self.current_token
-        if token[0] != '"':
+        if self.current_type != 'STRING_CONST':
             raise TypeError('Current token is not a string.')
 
-        idx = token[1:].find('"')
-        if idx < 0:
-            raise SyntaxError('Invalid string.')
-
-        string = token[1:idx + 1]
-
-        # Check trailing tokens.
-        if token[idx + 2:]:
-            self.tokens.appendleft(token[idx + 1:])
-
-        return string
-
-    def peek(self):
-        """
-        Peek at leftmost item in the tokens deque.
-        """
-        return self.tokens[0]
+        return self.current_token
 
-    def seperate_all(self):
+    def peek(self, k=0):
         """
-        Since some of our tokens are further seperated only when advancing
-        (for example, we may currently have a token like 'Keyboard.readInt('),
-        this method goes over all tokens and preforms the complete seperation.
-        This can help in the compiling prorcess since we're validating
-        specific tokens throughout the process.
+        Peek at the value of the token k tokens past the next one.
         """
-        tokens = []
-        while self.has_more_tokens():
-            self.advance()
-            token = self.current_token
-            if self.current_type == 'STRING_CONST':
-                token = '"{}"'.format(token)
-            tokens.append(str(token))
-
-        self.tokens = deque(tokens)
+        return self.cursor.peek(k)
@@ -1,13 +1,17 @@
+import os
 import re
 
 class VMWriter:
     """
-    Emits VM code into the <classname>.vm file.
+    Emits VM code into the <classname>.vm file. The code is written to a
+    temporary file, which replaces the .vm file once it's closed, so the
+    .vm file is never left half written.
     """
     def __init__(self, filename):
         """Creates a new <filename>.vm file and prepares it for writing."""
         self.filename = re.sub('.jack$', '.vm', filename)
-        self.stream = open(self.filename, 'w')
+        self.temp = '{}.{}'.format(self.filename, os.getpid())
+        self.stream = open(self.temp, 'w')
 
     def write_push(self, segment, index):
         """Writes a VM push command."""
@@ -51,4 +55,16 @@ class VMWriter:
 
     def close(self):
         """Closes the output file."""
+        if self.stream.closed:
+            return
+
+        self.stream.close()
+        os.rename(self.temp, self.filename)
+
+    def discard(self):
+        """Closes the output file, leaving the .vm file as it was."""
+        if self.stream.closed:
+            return
+
         self.stream.close()
+        os.remove(self.temp)